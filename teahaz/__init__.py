@@ -3,8 +3,114 @@
 .. include:: ../docs/getting_started.md
 """
 
-from .types import *
-from .client import *
-from .dataclasses import *
+# Submodules are only imported once one of their names is accessed, so
+# `import teahaz` stays cheap for short-lived scripts. Notably, the HTTP
+# stack is only loaded once a `Chatroom` is created.
+
+from __future__ import annotations
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
 __version__ = "0.1.0"
+
+_EXPORTS = {
+    "MessageCallback": "types",
+    "BatchCallback": "types",
+    "ErrorCallback": "types",
+    "ExceptionCallback": "types",
+    "EventCallback": "types",
+    "Event": "client",
+    "Teacup": "client",
+    "Chatroom": "client",
+    "LoginResult": "client",
+    "User": "dataclasses",
+    "Invite": "dataclasses",
+    "Channel": "dataclasses",
+    "ChannelDelta": "dataclasses",
+    "Message": "dataclasses",
+    "SystemEvent": "dataclasses",
+    "MessageLog": "messagelog",
+    "MessageView": "messagelog",
+    "MessageTable": "analytics",
+    "ChannelIndex": "registry",
+    "ChatroomRegistry": "registry",
+    "normalize_origin": "registry",
+    "Snapshotter": "snapshot",
+    "TokenBucket": "outbox",
+    "Outbox": "outbox",
+    "Priority": "budget",
+    "RequestBudget": "budget",
+    "threaded": "executor",
+    "get_executor": "executor",
+    "set_max_workers": "executor",
+    "HashRing": "sharding",
+    "RemoteChatroom": "sharding",
+    "ShardedTeacup": "sharding",
+    "BlobHandle": "blobs",
+    "BlobStore": "blobs",
+    "ArchiveWriter": "archive",
+    "HistoryArchive": "archive",
+    "write_archive": "archive",
+    "SegmentStore": "tiering",
+    "SearchHit": "search",
+    "SearchIndex": "search",
+    "MetadataCache": "cache",
+    "TrafficRecorder": "recorder",
+    "ReplayServer": "recorder",
+    "StandInServer": "standin",
+    "Transport": "transport",
+    "SessionTransport": "transport",
+    "HTTP2Transport": "transport",
+}
+
+# Star-imports only cover the names the package always exported, including
+# `threaded`, which moved out of `teahaz.client`. The others have to be
+# imported by name, so `from teahaz import *` doesn't load every submodule,
+# along with their optional dependencies.
+__all__ = [
+    name
+    for name, module in _EXPORTS.items()
+    if module in ("types", "client", "dataclasses") or name == "threaded"
+]
+
+
+def __getattr__(name: str) -> Any:
+    """Imports the submodule defining name, and returns its value."""
+
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__() -> list[str]:
+    """Lists all names, including the ones not yet imported."""
+
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+if TYPE_CHECKING:
+    from .types import *
+    from .client import *
+    from .dataclasses import *
+    from .messagelog import *
+    from .analytics import *
+    from .registry import *
+    from .snapshot import *
+    from .outbox import *
+    from .budget import *
+    from .executor import *
+    from .sharding import *
+    from .blobs import *
+    from .archive import *
+    from .tiering import *
+    from .search import *
+    from .cache import *
+    from .recorder import *
+    from .standin import *
+    from .transport import *
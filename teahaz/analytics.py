@@ -0,0 +1,298 @@
+"""The module containing the columnar message table used for analytics over chat history.
+
+A `MessageTable` keeps one row per message in a NumPy structured array:
+
+```
+send_time       float64
+message_type    uint8       index into `MessageTable.types`
+channel         uint32      index into `MessageTable.channels`
+user            uint32      index into `MessageTable.users`
+length          uint32      characters of text, bytes of files, 0 otherwise
+```
+
+Strings are stored as categorical codes, so aggregations (histograms, top
+users, per-channel counts) run vectorized over integer columns instead of
+looping over `Message` objects. Tables are appended to in place, which is how
+`Chatroom.enable_analytics` keeps one up to date from the poll loop.
+
+This module needs the optional `numpy` package.
+"""
+
+from __future__ import annotations
+
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Iterable
+
+from .blobs import BlobHandle
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if TYPE_CHECKING:
+    from .dataclasses import Message
+
+__all__ = [
+    "MessageTable",
+]
+
+DTYPE = [
+    ("send_time", "f8"),
+    ("message_type", "u1"),
+    ("channel", "u4"),
+    ("user", "u4"),
+    ("length", "u4"),
+]
+"""The fields of a table row."""
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+
+def _length(message: Message) -> int:
+    """Returns the payload length stored for message."""
+
+    data = message.data
+
+    if isinstance(data, (str, bytes)):
+        return len(data)
+
+    if isinstance(data, BlobHandle):
+        return data.size
+
+    return 0
+
+
+class MessageTable:
+    """A columnar, NumPy-backed table of messages, optimized for aggregations.
+
+    All aggregation methods accept the same filters: `start` & `end` limit
+    rows by `send_time` (inclusive), while `channel`, `user` and
+    `message_type` select rows by value. Aggregations work on a snapshot of
+    the rows, so they can run while other threads append.
+    """
+
+    def __init__(self, messages: Iterable[Message] = (), capacity: int = 1024) -> None:
+        """Initializes the table.
+
+        Args:
+            messages: The initial messages.
+            capacity: The initial amount of rows allocated.
+
+        Raises:
+            ImportError: NumPy is not installed.
+        """
+
+        if numpy is None:
+            raise ImportError("MessageTable requires the numpy package.")
+
+        self.types: list[str] = []
+        self.channels: list[str | None] = []
+        self.users: list[str | None] = []
+
+        self._codes: tuple[dict[Any, int], ...] = ({}, {}, {})
+        self._lock = Lock()
+        self._rows = numpy.zeros(max(1, capacity), dtype=DTYPE)
+        self._size = 0
+
+        self.extend(messages)
+
+    def __len__(self) -> int:
+        """Returns the count of rows."""
+
+        return self._size
+
+    def __repr__(self) -> str:
+        """Returns a short description of the table."""
+
+        return (
+            f"<MessageTable of {self._size} messages, {len(self.users)} users,"
+            f" {len(self.channels)} channels>"
+        )
+
+    @property
+    def rows(self) -> numpy.ndarray:
+        """A read-only structured array of the current rows.
+
+        Appends never write to rows that were already visible, so this can be
+        kept as a snapshot of the table.
+        """
+
+        rows = self._rows[: self._size]
+        rows.flags.writeable = False
+
+        return rows
+
+    def _code(self, kind: int, values: list[Any], value: Any) -> int:
+        """Returns the categorical code of value, assigning a new one if needed."""
+
+        codes = self._codes[kind]
+        code = codes.get(value)
+
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+
+        return code
+
+    def append(self, message: Message) -> None:
+        """Adds a row for message."""
+
+        self.extend([message])
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        """Adds rows for messages."""
+
+        messages = list(messages)
+        if not messages:
+            return
+
+        with self._lock:
+            new = numpy.array(
+                [
+                    (
+                        message.send_time,
+                        self._code(0, self.types, message.message_type),
+                        self._code(1, self.channels, message.channel_id),
+                        self._code(2, self.users, message.username),
+                        _length(message),
+                    )
+                    for message in messages
+                ],
+                dtype=DTYPE,
+            )
+
+            size = self._size + len(new)
+
+            if size > len(self._rows):
+                # The old buffer is left as is, as readers may hold views of it
+                grown = numpy.zeros(max(size, 2 * len(self._rows)), dtype=DTYPE)
+                grown[: self._size] = self._rows[: self._size]
+                self._rows = grown
+
+            self._rows[self._size : size] = new
+            self._size = size
+
+    def select(  # pylint: disable=too-many-arguments
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        channel: str | None = None,
+        user: str | None = None,
+        message_type: str | None = None,
+    ) -> numpy.ndarray:
+        """Returns the rows matching the filters."""
+
+        rows = self.rows
+        conditions = []
+
+        if start is not None:
+            conditions.append(rows["send_time"] >= start)
+
+        if end is not None:
+            conditions.append(rows["send_time"] <= end)
+
+        for field, codes, value in [
+            ("message_type", self._codes[0], message_type),
+            ("channel", self._codes[1], channel),
+            ("user", self._codes[2], user),
+        ]:
+            if value is None:
+                continue
+
+            if value not in codes:
+                return rows[:0]
+
+            conditions.append(rows[field] == codes[value])
+
+        # Without filters, the rows are returned without copying
+        if not conditions:
+            return rows
+
+        return rows[numpy.logical_and.reduce(conditions)]
+
+    def histogram(
+        self, bucket: float = HOUR, **filters: Any
+    ) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Counts messages per time bucket.
+
+        Args:
+            bucket: The width of a bucket, in seconds. Buckets are aligned to
+                multiples of it since the epoch.
+            **filters: See the class documentation.
+
+        Returns:
+            The start times of the buckets, and the count of messages in each.
+            Buckets between the first & last message are included even when
+            they are empty.
+        """
+
+        times = self.select(**filters)["send_time"]
+        if len(times) == 0:
+            return numpy.zeros(0), numpy.zeros(0, dtype=numpy.int64)
+
+        indices = numpy.floor(times / bucket).astype(numpy.int64)
+        first = indices.min()
+        counts = numpy.bincount(indices - first)
+
+        return (first + numpy.arange(len(counts))) * bucket, counts
+
+    def busiest_hours(self, utc_offset: float = 0.0, **filters: Any) -> numpy.ndarray:
+        """Counts messages by hour of the day.
+
+        Args:
+            utc_offset: The seconds added to send times, to count in a time zone.
+            **filters: See the class documentation.
+
+        Returns:
+            An array of 24 counts, the first one being for 00:00-00:59.
+        """
+
+        times = self.select(**filters)["send_time"] + utc_offset
+        hours = (numpy.floor(times % DAY / HOUR)).astype(numpy.int64)
+
+        return numpy.bincount(hours, minlength=24)
+
+    def top_users(self, count: int = 10, **filters: Any) -> list[tuple[str | None, int]]:
+        """Returns the users who sent the most messages, with their message count."""
+
+        counts = numpy.bincount(self.select(**filters)["user"], minlength=len(self.users))
+        top = numpy.argsort(counts, kind="stable")[::-1][:count]
+
+        return [(self.users[code], int(counts[code])) for code in top if counts[code]]
+
+    def user_rates(self, per: float = HOUR, **filters: Any) -> dict[str | None, float]:
+        """Returns the messages each user sent per `per` seconds.
+
+        The rate is measured over the time between the first & last selected
+        message, so it is comparable between users.
+        """
+
+        rows = self.select(**filters)
+        if len(rows) == 0:
+            return {}
+
+        span = max(float(numpy.ptp(rows["send_time"])), per)
+        counts = numpy.bincount(rows["user"], minlength=len(self.users))
+
+        return {
+            self.users[code]: float(counts[code]) * per / span
+            for code in numpy.flatnonzero(counts)
+        }
+
+    def channel_counts(self, **filters: Any) -> dict[str | None, int]:
+        """Returns the count of messages in each channel."""
+
+        counts = numpy.bincount(
+            self.select(**filters)["channel"], minlength=len(self.channels)
+        )
+
+        return {
+            self.channels[code]: int(counts[code]) for code in numpy.flatnonzero(counts)
+        }
+
+    def total_length(self, **filters: Any) -> int:
+        """Returns the summed payload length of messages."""
+
+        return int(self.select(**filters)["length"].sum(dtype=numpy.int64))
@@ -0,0 +1,477 @@
+"""The module containing the memory-mapped, columnar archive format for chat history.
+
+An archive file stores a chatroom's messages sorted by `send_time`. Fixed-width
+fields are kept in columns, variable-length ones in an offset-indexed payload
+section:
+
+```
+header      magic, row count, metadata offset & length
+send_time   float64[rows]
+type        uint8[rows]     index into metadata["types"]
+channel     uint32[rows]    index into metadata["channels"]
+user        uint32[rows]    index into metadata["users"]
+offsets     uint64[rows+1]  payload boundaries
+payloads    bytes           JSON `[uid, data]` of each row
+metadata    JSON            dictionaries & column locations
+```
+
+Opening an archive only maps the file and reads its metadata, so it is
+instant regardless of size. Time-range queries binary-search the `send_time`
+column, and `Message` objects are only created for rows that are accessed.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import mmap
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from .blobs import BlobHandle, BlobStore
+from .dataclasses import Message, SystemEvent
+
+__all__ = [
+    "ArchiveWriter",
+    "HistoryArchive",
+    "write_archive",
+]
+
+ARCHIVE_NAME = "history.tharch"
+"""The file name used for archives inside dump directories."""
+
+MAGIC = b"THARCH01"
+HEADER = struct.Struct("<8sQQQ")
+
+_COLUMNS = [
+    ("send_time", "d"),
+    ("type", "B"),
+    ("channel", "I"),
+    ("user", "I"),
+]
+
+
+def _encode_payload(message: Message) -> bytes:
+    """Encodes the variable-length fields of message."""
+
+    data: Any = message.data
+
+    if isinstance(data, BlobHandle):
+        data = {"blob": data.digest, "size": data.size}
+
+    elif isinstance(data, SystemEvent):
+        data = {"event_type": data.event_type, "user_info": data.user_info}
+
+    elif isinstance(data, bytes):
+        data = {"latin-1": data.decode("latin-1")}
+
+    return json.dumps([message.uid, data], separators=(",", ":")).encode("utf-8")
+
+
+class _Dictionary:
+    """A list of distinct values, with codes assigned in insertion order."""
+
+    def __init__(self, values: Iterable[Any] = ()) -> None:
+        """Initializes the dictionary."""
+
+        self.values: list[Any] = []
+        self._codes: dict[Any, int] = {}
+
+        for value in values:
+            self.code(value)
+
+    def code(self, value: Any) -> int:
+        """Returns the code of value, assigning a new one if needed."""
+
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+
+        return code
+
+
+class HistoryArchive:
+    """A read-only, memory-mapped archive of chat history.
+
+    The fixed-width columns are exposed as `memoryview`s, so they can be
+    scanned (or handed to other libraries) without copying.
+    """
+
+    def __init__(self, path: str | Path, blob_store: BlobStore | None = None) -> None:
+        """Opens an archive.
+
+        Args:
+            path: The archive file.
+            blob_store: The store used to resolve file messages into handles.
+
+        Raises:
+            ValueError: The file is not an archive, or was written on a machine
+                with a different byte order.
+        """
+
+        self.path = Path(path)
+        self.blob_store = blob_store
+
+        with open(self.path, "rb") as archive:
+            self._map = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._map)
+        magic, rows, meta_offset, meta_length = HEADER.unpack_from(view)
+
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a history archive.")
+
+        self.metadata = json.loads(bytes(view[meta_offset : meta_offset + meta_length]))
+
+        if self.metadata["byteorder"] != sys.byteorder:
+            raise ValueError(f"{self.path} was written with a different byte order.")
+
+        self.rows: int = rows
+        self.types: list[str] = self.metadata["types"]
+        self.channels: list[str | None] = self.metadata["channels"]
+        self.users: list[str | None] = self.metadata["users"]
+
+        columns = self.metadata["columns"]
+
+        def _column(name: str, typecode: str) -> memoryview:
+            start, length = columns[name]
+            return view[start : start + length].cast(typecode)
+
+        self.send_time = _column("send_time", "d")
+        self.type = _column("type", "B")
+        self.channel = _column("channel", "I")
+        self.user = _column("user", "I")
+        self.offsets = _column("offsets", "Q")
+        self._payloads = _column("payloads", "B")
+        self._payloads_start: int = columns["payloads"][0]
+
+    def __len__(self) -> int:
+        """Returns the count of archived messages."""
+
+        return self.rows
+
+    def __getitem__(self, index: int) -> Message:
+        """Materializes the message at index."""
+
+        if index < 0:
+            index += self.rows
+
+        if not 0 <= index < self.rows:
+            raise IndexError(f"Archive row {index} out of range.")
+
+        uid, data = json.loads(self.payload(index).tobytes())
+
+        message_type = self.types[self.type[index]]
+        if isinstance(data, dict):
+            data = self._decode_data(message_type, data)
+
+        return Message(
+            uid=uid,
+            send_time=self.send_time[index],
+            message_type=message_type,
+            data=data,
+            channel_id=self.channels[self.channel[index]],
+            username=self.users[self.user[index]],
+        )
+
+    def __iter__(self) -> Iterator[Message]:
+        """Iterates over all messages, in send_time order."""
+
+        for index in range(self.rows):
+            yield self[index]
+
+    def __enter__(self) -> HistoryArchive:
+        """Returns self."""
+
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        """Closes the archive."""
+
+        self.close()
+
+    def _decode_data(self, message_type: str, data: dict[str, Any]) -> Any:
+        """Reverses `_encode_payload` for structured data."""
+
+        if "blob" in data and self.blob_store is not None:
+            return BlobHandle(
+                data["blob"], data["size"], self.blob_store.path_of(data["blob"])
+            )
+
+        if "latin-1" in data:
+            return data["latin-1"].encode("latin-1")
+
+        if message_type.startswith("system"):
+            return SystemEvent(data["event_type"], data["user_info"])
+
+        return data
+
+    def close(self) -> None:
+        """Releases the memory map. Views of the archive can't be used afterwards."""
+
+        for column in [
+            self.send_time,
+            self.type,
+            self.channel,
+            self.user,
+            self.offsets,
+            self._payloads,
+        ]:
+            column.release()
+
+        self._map.close()
+
+    def payload(self, index: int) -> memoryview:
+        """Returns the raw, JSON-encoded `[uid, data]` payload of a row."""
+
+        return self._payloads[self.offsets[index] : self.offsets[index + 1]]
+
+    def prefetch(self, rows: range) -> None:
+        """Asks the OS to start reading the payloads of rows, before they are used.
+
+        This does nothing on platforms without `madvise`.
+        """
+
+        if len(rows) == 0 or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+
+        start = self._payloads_start + self.offsets[rows.start]
+        end = self._payloads_start + self.offsets[rows.stop]
+        aligned = start - start % mmap.PAGESIZE
+
+        self._map.madvise(mmap.MADV_WILLNEED, aligned, end - aligned)
+
+    def between(self, start: float | None = None, end: float | None = None) -> range:
+        """Returns the row indices of messages sent within `[start, end]`.
+
+        This binary-searches the send_time column, without creating any
+        `Message` objects.
+
+        Args:
+            start: The earliest send_time to include.
+            end: The latest send_time to include.
+        """
+
+        first = 0 if start is None else bisect_left(self.send_time, start)
+        last = self.rows if end is None else bisect_right(self.send_time, end)
+
+        return range(first, max(first, last))
+
+    def messages(
+        self, start: float | None = None, end: float | None = None
+    ) -> Iterator[Message]:
+        """Iterates over the messages sent within `[start, end]`."""
+
+        for index in self.between(start, end):
+            yield self[index]
+
+
+class ArchiveWriter:
+    """Builds an archive file from messages and existing archives.
+
+    Rows copied from an archive using `extend_from` are copied in their raw
+    form, without creating `Message` objects. Rows are sorted by send_time
+    on write if they were not added in order.
+    """
+
+    def __init__(self) -> None:
+        """Initializes the writer."""
+
+        self._types = _Dictionary()
+        self._channels = _Dictionary()
+        self._users = _Dictionary()
+        self._columns = {name: array(typecode) for name, typecode in _COLUMNS}
+        self._offsets = array("Q", [0])
+
+        # pylint: disable-next=consider-using-with
+        self._payloads = tempfile.TemporaryFile()
+        self._is_sorted = True
+
+    def __len__(self) -> int:
+        """Returns the count of rows added."""
+
+        return len(self._columns["send_time"])
+
+    def _add_row(
+        self, send_time: float, codes: tuple[int, int, int], payload: bytes | memoryview
+    ) -> None:
+        """Adds a single row."""
+
+        times = self._columns["send_time"]
+        if times and times[-1] > send_time:
+            self._is_sorted = False
+
+        times.append(send_time)
+        self._columns["type"].append(codes[0])
+        self._columns["channel"].append(codes[1])
+        self._columns["user"].append(codes[2])
+
+        self._payloads.write(payload)
+        self._offsets.append(self._offsets[-1] + len(payload))
+
+    def add(self, message: Message) -> None:
+        """Adds a message."""
+
+        self._add_row(
+            message.send_time,
+            (
+                self._types.code(message.message_type),
+                self._channels.code(message.channel_id),
+                self._users.code(message.username),
+            ),
+            _encode_payload(message),
+        )
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        """Adds messages."""
+
+        for message in messages:
+            self.add(message)
+
+    def extend_from(self, archive: HistoryArchive) -> None:
+        """Adds every row of an existing archive, without decoding them."""
+
+        types = [self._types.code(value) for value in archive.types]
+        channels = [self._channels.code(value) for value in archive.channels]
+        users = [self._users.code(value) for value in archive.users]
+
+        for index in range(len(archive)):
+            self._add_row(
+                archive.send_time[index],
+                (
+                    types[archive.type[index]],
+                    channels[archive.channel[index]],
+                    users[archive.user[index]],
+                ),
+                archive.payload(index),
+            )
+
+    def _sorted_columns(self) -> tuple[dict[str, array], list[int] | None]:
+        """Returns the columns in send_time order, and the permutation used."""
+
+        if self._is_sorted:
+            return self._columns, None
+
+        times = self._columns["send_time"]
+        order = sorted(range(len(times)), key=times.__getitem__)
+
+        return {
+            name: array(column.typecode, (column[index] for index in order))
+            for name, column in self._columns.items()
+        }, order
+
+    def write(self, path: str | Path) -> None:
+        """Writes the archive, atomically replacing path.
+
+        The writer should not be used afterwards.
+        """
+
+        path = Path(path)
+        columns, order = self._sorted_columns()
+
+        self._payloads.flush()
+        self._payloads.seek(0)
+
+        descriptor, temp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(descriptor, "wb") as archive:
+            archive.write(b"\0" * HEADER.size)
+            locations = {}
+
+            def _write_section(name: str, data: bytes | memoryview) -> None:
+                """Writes a section, 8-byte aligned."""
+
+                archive.write(b"\0" * (-archive.tell() % 8))
+                locations[name] = [archive.tell(), len(data)]
+                archive.write(data)
+
+            for name, _ in _COLUMNS:
+                _write_section(name, columns[name].tobytes())
+
+            if order is None:
+                offsets = self._offsets
+                _write_section("offsets", offsets.tobytes())
+
+                archive.write(b"\0" * (-archive.tell() % 8))
+                start = archive.tell()
+
+                while chunk := self._payloads.read(1 << 20):
+                    archive.write(chunk)
+
+                locations["payloads"] = [start, self._offsets[-1]]
+
+            else:
+                offsets = array("Q", [0])
+                for index in order:
+                    offsets.append(
+                        offsets[-1] + self._offsets[index + 1] - self._offsets[index]
+                    )
+
+                _write_section("offsets", offsets.tobytes())
+
+                archive.write(b"\0" * (-archive.tell() % 8))
+                start = archive.tell()
+
+                if self._offsets[-1] > 0:
+                    with mmap.mmap(
+                        self._payloads.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as payloads:
+                        for index in order:
+                            archive.write(
+                                payloads[self._offsets[index] : self._offsets[index + 1]]
+                            )
+
+                locations["payloads"] = [start, self._offsets[-1]]
+
+            metadata = json.dumps(
+                {
+                    "byteorder": sys.byteorder,
+                    "types": self._types.values,
+                    "channels": self._channels.values,
+                    "users": self._users.values,
+                    "columns": locations,
+                }
+            ).encode("utf-8")
+
+            meta_offset = archive.tell()
+            archive.write(metadata)
+
+            archive.seek(0)
+            archive.write(
+                HEADER.pack(MAGIC, len(self), meta_offset, len(metadata))
+            )
+
+            archive.flush()
+            os.fsync(archive.fileno())
+
+        os.replace(temp, path)
+        self._payloads.close()
+
+
+def write_archive(
+    path: str | Path,
+    messages: Iterable[Message],
+    base: HistoryArchive | None = None,
+) -> None:
+    """Writes messages into an archive file.
+
+    Args:
+        path: The file to write. It is replaced atomically.
+        messages: The messages to write.
+        base: An archive whose rows are included before messages. It may be
+            the archive at path itself, as long as it isn't closed before this
+            returns.
+    """
+
+    writer = ArchiveWriter()
+
+    if base is not None:
+        writer.extend_from(base)
+
+    writer.extend(messages)
+    writer.write(path)
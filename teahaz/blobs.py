@@ -0,0 +1,119 @@
+"""The module containing the content-addressed store for file payloads.
+
+Files are stored on disk by the SHA-256 digest of their content, so a file
+posted to several channels (or chatrooms) is only stored once. File messages
+then only hold a small `BlobHandle`, which gives a memory-mapped view of the
+content on access.
+"""
+
+from __future__ import annotations
+
+import os
+import mmap
+import hashlib
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass
+
+__all__ = [
+    "BlobHandle",
+    "BlobStore",
+]
+
+
+@dataclass(frozen=True)
+class BlobHandle:
+    """A reference to a blob inside a `BlobStore`."""
+
+    digest: str
+    """The hex SHA-256 digest of the content."""
+
+    size: int
+    """The size of the content, in bytes."""
+
+    path: Path
+    """The path of the file holding the content."""
+
+    def view(self) -> memoryview:
+        """Returns a read-only, memory-mapped view of the content."""
+
+        if self.size == 0:
+            return memoryview(b"")
+
+        with open(self.path, "rb") as blobfile:
+            mapped = mmap.mmap(blobfile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(mapped)
+
+    def read(self) -> bytes:
+        """Reads the content into memory."""
+
+        return self.path.read_bytes()
+
+
+class BlobStore:
+    """A directory of blobs, keyed by the SHA-256 digest of their content.
+
+    Blobs are written to a temporary file and atomically renamed into place,
+    so concurrent writers of the same content are safe.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        """Initializes the store, creating its root if needed.
+
+        Args:
+            root: The directory to store blobs in.
+        """
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def __contains__(self, digest: str) -> bool:
+        """Determines whether a blob with the given digest is stored."""
+
+        return self.path_of(digest).exists()
+
+    def path_of(self, digest: str) -> Path:
+        """Returns the path a blob with the given digest is stored at."""
+
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, data: bytes) -> BlobHandle:
+        """Stores data, unless an identical blob is already stored.
+
+        Args:
+            data: The content to store.
+
+        Returns:
+            The handle of the stored blob.
+        """
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_of(digest)
+
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+
+            descriptor, temp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            with os.fdopen(descriptor, "wb") as blobfile:
+                blobfile.write(data)
+
+            os.replace(temp, path)
+
+        return BlobHandle(digest, len(data), path)
+
+    def get(self, digest: str) -> BlobHandle | None:
+        """Gets the handle of a stored blob.
+
+        Args:
+            digest: The hex SHA-256 digest of the content.
+
+        Returns:
+            The handle, or None if no such blob is stored.
+        """
+
+        path = self.path_of(digest)
+        if not path.exists():
+            return None
+
+        return BlobHandle(digest, path.stat().st_size, path)
@@ -0,0 +1,149 @@
+"""The module containing the request budget shared by chatrooms on the same server.
+
+A `RequestBudget` limits the rate of requests all chatrooms of a `Teacup` send
+to one origin. Chatrooms are assigned a `Priority`:
+
+- Interactive rooms always get the next token, even if that means waiting
+  for it, so their latency stays as low as the budget allows.
+- Normal & archival rooms only take tokens while the bucket is above a
+  reserve (a quarter & a half of it respectively), leaving the rest for
+  interactive rooms.
+- The poll interval of normal & archival rooms is stretched as the bucket
+  empties, so they generate less traffic under pressure.
+
+The budget adapts to the server like `teahaz.outbox.TokenBucket`: it is
+halved when the server answers with 429 or a 5xx status, and restored
+gradually after successful requests.
+"""
+
+from __future__ import annotations
+
+from enum import Enum
+from threading import Event
+
+from .outbox import TokenBucket
+
+__all__ = [
+    "Priority",
+    "RequestBudget",
+]
+
+
+class Priority(Enum):
+    """The priority classes of chatrooms sharing a `RequestBudget`."""
+
+    INTERACTIVE = "interactive"
+    """Rooms a user is looking at. They are never throttled beyond the budget."""
+
+    NORMAL = "normal"
+    """The default priority."""
+
+    ARCHIVAL = "archival"
+    """Rooms that are only recorded. They back off first."""
+
+
+RESERVES = {Priority.INTERACTIVE: 0.0, Priority.NORMAL: 0.25, Priority.ARCHIVAL: 0.5}
+"""The fraction of the bucket each priority can't take tokens from."""
+
+MAX_STRETCH = {Priority.INTERACTIVE: 1.0, Priority.NORMAL: 4.0, Priority.ARCHIVAL: 16.0}
+"""How many times each priority's poll interval is stretched under full pressure."""
+
+
+class RequestBudget(TokenBucket):
+    """A priority-aware token bucket shared by the chatrooms of an origin."""
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 1.0) -> None:
+        """Initializes the budget.
+
+        Args:
+            rate: The maximum sustained requests per second.
+            burst: The maximum amount of requests sent at once.
+            min_rate: The rate will never be reduced below this.
+        """
+
+        super().__init__(rate, burst, min_rate)
+
+    @property
+    def pressure(self) -> float:
+        """How depleted the bucket is, from 0 (full) to 1 (empty or in debt)."""
+
+        with self._lock:
+            self._refill()
+            return min(1.0, max(0.0, 1 - self._tokens / self.burst))
+
+    def reserve_for(self, priority: Priority) -> float:
+        """Tries to take a token for a request of the given priority.
+
+        Interactive requests always take a token, and wait for it if the
+        bucket is empty. Other requests only take a token if the bucket stays
+        above their reserve; otherwise nothing is taken, and they should call
+        this again once the returned delay has passed.
+
+        Returns:
+            0 if the request can be sent now. Otherwise, the seconds to wait
+            before sending (interactive) or retrying (other priorities).
+        """
+
+        if priority is Priority.INTERACTIVE:
+            return self.reserve()
+
+        with self._lock:
+            self._refill()
+            floor = RESERVES[priority] * self.burst
+
+            if self._tokens - 1 >= floor:
+                self._tokens -= 1
+                return 0.0
+
+            return (floor + 1 - self._tokens) / self.rate
+
+    def acquire(self, priority: Priority, stop: Event | None = None) -> bool:
+        """Waits until a request of the given priority may be sent.
+
+        Args:
+            priority: The priority of the request.
+            stop: An event that interrupts the wait when set.
+
+        Returns:
+            Whether the wait finished without being interrupted. Interrupted
+            requests still take a token, going into debt if needed, as they
+            may be sent anyway.
+        """
+
+        stop = stop or Event()
+
+        while True:
+            delay = self.reserve_for(priority)
+            if delay <= 0:
+                return True
+
+            if stop.wait(delay):
+                # Interactive requests already took theirs
+                if priority is not Priority.INTERACTIVE:
+                    self.reserve()
+
+                return False
+
+            if priority is Priority.INTERACTIVE:
+                return True
+
+    def stretch(self, priority: Priority) -> float:
+        """Returns the factor the poll interval of a priority is stretched by."""
+
+        return 1 + (MAX_STRETCH[priority] - 1) * self.pressure
+
+    def feedback(self, status_code: int) -> None:
+        """Adapts the rate to a response status code."""
+
+        if status_code == 429 or status_code >= 500:
+            self.penalize()
+        else:
+            self.reward()
+
+    def __repr__(self) -> str:
+        """Returns a short description of the budget."""
+
+        return (
+            f"<RequestBudget rate={self.rate:.1f}/{self.max_rate:.1f}"
+            f" burst={self.burst} pressure={self.pressure:.2f}>"
+        )
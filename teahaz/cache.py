@@ -0,0 +1,150 @@
+"""The module containing the cache used for chatroom metadata.
+
+Entries are kept for a time-to-live, after which they are revalidated. When
+the server sent an `ETag` with an entry, revalidation is a conditional request
+that the server can answer with `304 Not Modified`, in which case the cached
+value (and the objects in it) is kept. Concurrent callers of a key that needs
+fetching share a single in-flight fetch.
+"""
+
+from __future__ import annotations
+
+from threading import Lock
+from dataclasses import dataclass
+from time import monotonic
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Tuple, Union
+
+__all__ = [
+    "MetadataCache",
+]
+
+NOT_MODIFIED = object()
+"""Returned by fetch functions when the server answered `304 Not Modified`."""
+
+FetchResult = Union[Tuple[Any, Union[str, None]], object, None]
+"""`(value, etag)`, `NOT_MODIFIED`, or None if fetching failed."""
+
+
+@dataclass
+class _Entry:
+    """A cached value."""
+
+    value: Any
+    etag: str | None
+    fetched_at: float
+
+
+class MetadataCache:
+    """A thread-safe TTL cache with conditional revalidation and single-flight fetches."""
+
+    def __init__(self, ttl: float = 30.0, ttls: dict[Hashable, float] | None = None) -> None:
+        """Initializes the cache.
+
+        Args:
+            ttl: The amount of seconds entries are used for without revalidating.
+            ttls: TTLs of specific keys, overriding `ttl`.
+        """
+
+        self.ttl = ttl
+        self.ttls = ttls or {}
+
+        self._lock = Lock()
+        self._entries: dict[Hashable, _Entry] = {}
+        self._inflight: dict[Hashable, Future] = {}
+        self._generation = 0
+
+    def get(
+        self, key: Hashable, fetch: Callable[[str | None], FetchResult]
+    ) -> Any | None:
+        """Gets the value of key, fetching it if it is missing or expired.
+
+        Args:
+            key: The key of the value.
+            fetch: Called with the cached ETag (if any) to fetch the value.
+                Only one fetch per key runs at a time; other callers wait for
+                it, and get its result.
+
+        Returns:
+            The value, or None if fetching it failed.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            ttl = self.ttls.get(key, self.ttl)
+
+            if entry is not None and monotonic() - entry.fetched_at < ttl:
+                return entry.value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                future: Future = Future()
+                self._inflight[key] = future
+                generation = self._generation
+
+        if inflight is not None:
+            return inflight.result()
+
+        try:
+            value = self._fetch(key, entry, fetch, generation)
+        except BaseException as exception:
+            with self._lock:
+                del self._inflight[key]
+
+            future.set_exception(exception)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+
+        future.set_result(value)
+        return value
+
+    def _fetch(
+        self,
+        key: Hashable,
+        entry: _Entry | None,
+        fetch: Callable[[str | None], FetchResult],
+        generation: int,
+    ) -> Any | None:
+        """Runs fetch, storing its result."""
+
+        result = fetch(None if entry is None else entry.etag)
+        if result is None or (result is NOT_MODIFIED and entry is None):
+            return None
+
+        with self._lock:
+            if result is NOT_MODIFIED:
+                assert entry is not None
+                value, etag = entry.value, entry.etag
+            else:
+                value, etag = result  # type: ignore
+
+            # Values fetched before an invalidation are returned, but not trusted
+            fetched_at = monotonic() if generation == self._generation else float("-inf")
+            self._entries[key] = _Entry(value, etag, fetched_at)
+
+        return value
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        """Makes entries expire, so they are revalidated on their next use.
+
+        Their ETags are kept, so revalidating unchanged data stays cheap.
+
+        Args:
+            key: The key to invalidate. If not set, all keys are invalidated.
+        """
+
+        with self._lock:
+            self._generation += 1
+
+            for entry_key, entry in self._entries.items():
+                if key is None or entry_key == key:
+                    entry.fetched_at = float("-inf")
+
+    def clear(self) -> None:
+        """Removes all entries, including their ETags."""
+
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
@@ -4,20 +4,20 @@
 
 from __future__ import annotations
 
-import os
 import json
+import heapq
 import pickle
-import shutil
 from pathlib import Path
 from enum import Enum, auto
-from threading import Thread
-from dataclasses import asdict
-from time import sleep, time as epoch
+from threading import Thread, Lock, current_thread, Event as ThreadingEvent
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from collections import OrderedDict
+from time import sleep, monotonic, perf_counter, time as epoch
 from base64 import b64encode, b64decode
-from typing import Callable, Any, Union
-
-import requests
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Union
 
+from .blobs import BlobHandle, BlobStore
 from .dataclasses import (
     User,
     Invite,
@@ -25,43 +25,35 @@ from .dataclasses import (
     Message,
 )
 
-from .types import EventCallback
+from .types import BatchCallback, EventCallback
+from .outbox import Outbox
+from .budget import Priority, RequestBudget
+from .cache import NOT_MODIFIED, FetchResult, MetadataCache
+from .executor import threaded  # pylint: disable=unused-import
+from .compression import available_codecs, accept_encoding, compress
+from .registry import ChannelIndex, ChatroomRegistry, normalize_origin
+from .messagelog import MessageLog
+from .transport import HTTP2Transport, SessionTransport, Transport, _import_httpx
+
+if TYPE_CHECKING:
+    import requests
+
+    from .archive import HistoryArchive
+    from .crypto import RoomCipher
+    from .search import SearchHit, SearchIndex
+    from .analytics import MessageTable
+    from .snapshot import Snapshotter
+    from .tiering import SegmentStore
+    from .recorder import TrafficRecorder
 
 __all__ = [
-    "threaded",
     "Event",
     "Teacup",
     "Chatroom",
+    "LoginResult",
 ]
 
 
-def threaded(
-    target: Callable[..., Any], callback: Callable[..., Any] | None = None
-) -> Callable[..., None]:
-    """Returns a threaded callable for target.
-
-    Args:
-        target: The callable to thread.
-        callback: The callable that will be called with return value
-            of `target`.
-
-    Returns:
-        A lambda function that runs `target` in a thread, passing its
-        return value to `callback`.
-    """
-
-    def _call_target(*args, **kwargs) -> None:
-        """Calls the target."""
-
-        returned = target(*args, **kwargs)
-        if callback is not None:
-            callback(returned)
-
-    return lambda *args, **kwargs: Thread(
-        target=_call_target, args=args, kwargs=kwargs
-    ).start()
-
-
 class Event(Enum):
     """Events that `Chatroom` and `Teacup` can subscribe to"""
 
@@ -90,8 +82,8 @@ class Event(Enum):
     before the server receives and sends it back.
 
     Args:
-        message: The **locally instanced** `Message`. Only use this while the real
-            message has not yet arrived.
+        message: The **locally instanced** `Message`. Its `is_delivered` is False
+            until the server echoes it back, see `MSG_DELIVERED`.
     """
 
     MSG_NEW = auto()
@@ -101,6 +93,18 @@ class Event(Enum):
         message: The new `Message` instance.
     """
 
+    MSG_DELIVERED = auto()
+    """A message sent by this chatroom has been echoed back by the server.
+
+    The **locally instanced** `Message` given to `MSG_SENT` is updated in place
+    (`is_delivered` becomes True), and the same instance is used for the
+    following `MSG_NEW` event, as well as in `Chatroom.messages`.
+
+    Args:
+        message: The delivered `Message` instance.
+        latency: Seconds elapsed between sending the message and receiving it.
+    """
+
     MSG_DEL = auto()
     """A message was deleted.
 
@@ -122,6 +126,28 @@ class Event(Enum):
         message: The silent system message.
     """
 
+    CHANNEL_NEW = auto()
+    """A channel has become available.
+
+    Args:
+        channel: The new `Channel` instance.
+    """
+
+    CHANNEL_DEL = auto()
+    """A channel is no longer available.
+
+    Args:
+        channel: The removed `Channel` instance.
+    """
+
+    CHANNEL_RENAME = auto()
+    """A channel was renamed. The instance is updated in place.
+
+    Args:
+        channel: The renamed `Channel` instance.
+        old_name: The channel's previous name.
+    """
+
     USER_JOIN = auto()
     """A new user has joined the chatroom.
 
@@ -190,9 +216,86 @@ class EndpointContainer:
         )
 
 
+DEDUPE_WINDOW = 10_000
+"""The amount of recent message uids the event loop remembers to skip duplicates."""
+
+MESSAGE_EVENTS = (Event.MSG_NEW, Event.MSG_DEL, Event.MSG_SYS, Event.MSG_SYS_SILENT)
+"""The events of messages received by the event loop, which can be batched."""
+
+
+class _BatchListener:
+    """Collects the messages of an event for a `Chatroom.subscribe_batch` callback."""
+
+    def __init__(
+        self, callback: BatchCallback, max_batch: int, max_delay: float
+    ) -> None:
+        """Initializes the listener."""
+
+        self.callback = callback
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._lock = Lock()
+        self._pending: list[Message] = []
+        self._since = 0.0
+
+    def add(self, messages: list[Message]) -> None:
+        """Buffers messages until they are due."""
+
+        with self._lock:
+            if not self._pending:
+                self._since = monotonic()
+
+            self._pending.extend(messages)
+
+    def adopt(self, other: _BatchListener) -> None:
+        """Takes over the messages still buffered by a replaced listener."""
+
+        with other._lock:
+            pending, other._pending = other._pending, []
+
+        if pending:
+            self.add(pending)
+
+    def due(self) -> float | None:
+        """Returns the `time.monotonic()` value the buffer is due at, if not empty."""
+
+        with self._lock:
+            if not self._pending:
+                return None
+
+            if len(self._pending) >= self.max_batch:
+                return self._since
+
+            return self._since + self.max_delay
+
+    def take(self, force: bool = False) -> list[list[Message]]:
+        """Empties the buffer if it is due (or forced), returning it in batches."""
+
+        with self._lock:
+            if not self._pending:
+                return []
+
+            if (
+                not force
+                and len(self._pending) < self.max_batch
+                and monotonic() < self._since + self.max_delay
+            ):
+                return []
+
+            pending, self._pending = self._pending, []
+
+        return [
+            pending[start : start + self.max_batch]
+            for start in range(0, len(pending), self.max_batch)
+        ]
+
+
 class Chatroom:
     """The object to deal with all chatroom-related API actions."""
 
+    _RECENT_LIMIT = 1024
+
     def __init__(
         self,
         url: str,
@@ -217,25 +320,78 @@ class Chatroom:
         self.name = name
         self.interval = 1
 
+        # The HTTP stack is only imported once it is needed
+        import requests  # pylint: disable=import-outside-toplevel
+
         self.username: str | None = None
         self.session = session or requests.Session()
+        self.transport: Transport = SessionTransport(self.session)
         self.active_channel: Channel | None = None
-        self.channels: list[Channel] = []
-
-        self.event_thread = Thread(target=self._loop)
+        self.channels = ChannelIndex()
 
         # If the chatroom doesn't exist yet its endpoints' uid
         # is only filled in the create() method
         self.endpoints = EndpointContainer(self.url, self.uid)
 
-        self.messages: list[Message] = []
+        self._messages = MessageLog()
+        self.users: list[User] = []
+        self.outbox: Outbox | None = None
+        self.cipher: RoomCipher | None = None
+        self.blob_store: BlobStore | None = None
+        self.archive: HistoryArchive | None = None
+        self.search_index: SearchIndex | None = None
+        self.analytics: MessageTable | None = None
+        self.cold: SegmentStore | None = None
+        self.hot_count = 1000
+        self.metadata_cache = MetadataCache()
+        self.request_timeout: float | None = 30.0
+        self.recorder: TrafficRecorder | None = None
+        self.budget: RequestBudget | None = None
+        self.priority = Priority.NORMAL
+        self.compression: str | None = None
+        self.compression_level: int | None = None
+        self.compression_threshold = 1024
+        self.pending_timeout = 300.0
+
+        self._pending: dict[str, tuple[Message, float]] = {}
+        self._pending_lock = Lock()
+        self._store_lock = Lock()
+        self._spill_at = 0
+        self._recent: OrderedDict[str, Message] = OrderedDict()
 
         self._listeners: dict[Event, EventCallback] = {}
+        self._leader: Chatroom | None = None
+        self._followers: tuple[Chatroom, ...] = ()
+        self._batch_listeners: dict[Event, _BatchListener] = {}
         self._is_looping: bool = False
         self._is_stopped: bool = False
+        self._is_draining: bool = False
         self._is_server_side: bool = False
         self._last_get_time: float = epoch()
 
+        self._stop_event = ThreadingEvent()
+        self.event_thread = self._new_thread()
+
+    @property
+    def messages(self) -> MessageLog:
+        """All messages received by the event loop or prefetched, oldest first.
+
+        It can be read from any thread without locking; use its `snapshot`
+        method for several consistent reads. Lists assigned to it are
+        converted into a `teahaz.messagelog.MessageLog`.
+        """
+
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: Iterable[Message]) -> None:
+        """Replaces the stored messages."""
+
+        if not isinstance(messages, MessageLog):
+            messages = MessageLog(messages)
+
+        self._messages = messages
+
     def _request(self, method_name: str, **req_args: Any) -> Any | None:
         """Sends a request, handles events & exceptions.
 
@@ -253,26 +409,104 @@ class Chatroom:
                 no handler was available to call.
         """
 
-        method = getattr(self.session, method_name)
-        if method is None:
-            raise ValueError(f'Session does not have a method for "{method_name}".')
+        response = self._send_request(method_name, **req_args)
+        if response is None:
+            return None
 
-        error_handler = self._listeners.get(Event.ERROR)
-        exception_handler = self._listeners.get(Event.NETWORK_EXCEPTION)
+        return self._handle_response(response, method_name, req_args)
+
+    def _send_request(
+        self, method_name: str, capture: bool = True, **req_args: Any
+    ) -> requests.Response | None:
+        """Sends a request through our transport, handling exceptions.
+
+        Args:
+            method_name: An HTTP method name, such as GET.
+            capture: If not set, exceptions are raised even if there is a
+                handler for them, so the caller can decide what to do first.
+                See `_handle_exception`.
+            **req_args: Arguments passed to the request.
+
+        Returns:
+            The response regardless of its status code, or None if an exception
+            occured but was handled.
+
+        Raises:
+            ValueError: Invalid HTTP method was passed.
+        """
+
+        req_args.setdefault("timeout", self.request_timeout)
+
+        # Requests interrupted by stopping are still sent & paid for, just not
+        # delayed further
+        if self.budget is not None:
+            self.budget.acquire(self.priority, self._stop_event)
+
+        started = perf_counter()
 
         try:
-            response = method(**req_args)
+            response = self.transport.request(
+                method_name, **self._compress_body(req_args)
+            )
         except Exception as exception:
-            if exception_handler is not None:
-                exception_handler(exception, method_name, req_args)  # type: ignore
+            if self.recorder is not None:
+                self.recorder.record(self, method_name, req_args, started, error=exception)
 
-                return None
+            if not capture:
+                raise
+
+            return self._handle_exception(exception, method_name, req_args)
+
+        if self.recorder is not None:
+            self.recorder.record(self, method_name, req_args, started, response)
+
+        if self.budget is not None:
+            self.budget.feedback(response.status_code)
+
+        return response
+
+    def _handle_exception(
+        self, exception: Exception, method_name: str, req_args: dict[str, Any]
+    ) -> None:
+        """Passes the exception of a request to its handler.
+
+        Args:
+            exception: The exception raised by the transport.
+            method_name: The HTTP method used.
+            req_args: Arguments sent with the request.
+
+        Raises:
+            Exception: The exception, if there is no handler for it.
+        """
 
+        exception_handler = self._listeners.get(Event.NETWORK_EXCEPTION)
+        if exception_handler is None:
             raise exception
 
+        exception_handler(exception, method_name, req_args)  # type: ignore
+
+    def _handle_response(
+        self, response: requests.Response, method_name: str, req_args: dict[str, Any]
+    ) -> Any | None:
+        """Returns the JSON of a response, or handles its error.
+
+        Args:
+            response: The response to handle.
+            method_name: The HTTP method used.
+            req_args: Arguments sent with the request.
+
+        Returns:
+            JSON of response if `status_code == 200`, None if the error was handled.
+
+        Raises:
+            RuntimeError: Response status_code was not 200, and
+                no handler was available to call.
+        """
+
         if response.status_code == 200:
             return response.json()
 
+        error_handler = self._listeners.get(Event.ERROR)
         if error_handler is not None:
             error_handler(response, method_name, req_args)  # type: ignore
 
@@ -284,6 +518,30 @@ class Chatroom:
             f" with no error or exception handler: {response.status_code} -> {response.text}"
         )
 
+    def _compress_body(self, req_args: dict[str, Any]) -> dict[str, Any]:
+        """Returns req_args with its JSON body compressed, if compression is enabled.
+
+        Bodies smaller than `compression_threshold` are left alone, as well as
+        requests without a JSON body.
+        """
+
+        if self.compression is None or req_args.get("json") is None:
+            return req_args
+
+        body = json.dumps(req_args["json"]).encode("utf-8")
+        if len(body) < self.compression_threshold:
+            return req_args
+
+        wire_args = {key: value for key, value in req_args.items() if key != "json"}
+        wire_args["data"] = compress(body, self.compression, self.compression_level)
+        wire_args["headers"] = {
+            **(req_args.get("headers") or {}),
+            "Content-Type": "application/json",
+            "Content-Encoding": self.compression,
+        }
+
+        return wire_args
+
     def _notify(self, event: Event, *data: Any) -> None:
         """Notifies listeners of an event.
 
@@ -298,49 +556,240 @@ class Chatroom:
 
         callback(*data)
 
-    def _loop(self) -> None:
-        """The main event loop for a chatroom"""
+    def _new_thread(self, resume: bool = False) -> Thread:
+        """Creates a thread running a new loop, bound to the current stop event."""
+
+        return Thread(
+            target=self._loop,
+            args=(self._stop_event, resume),
+            name=f'Chatroom(uid="{self.uid}")',
+        )
+
+    def _loop(self, stop: ThreadingEvent, resume: bool = False) -> None:
+        """The main event loop for a chatroom
 
-        ids = [msg.uid for msg in self.messages]
-        self._last_get_time = epoch()
+        Args:
+            stop: The event that stops this loop. Every loop gets its own, so
+                a loop stuck in a request can't be revived by a restart.
+            resume: If set, polling continues from where the previous loop
+                stopped, instead of from the current time.
+        """
+
+        ids: dict[str, None] | None = None
+        if not resume:
+            self._last_get_time = epoch()
 
-        while not self._is_stopped:
-            if self.active_channel is None:
-                sleep(self.interval)
+        while not stop.is_set():
+            # Followers are given messages by their leader's loop
+            if self._leader is not None:
+                ids = None
+                self._wait(stop, self.interval)
+                continue
+
+            # Chatrooms logged into without fetching channels fetch them here
+            if self.active_channel is None and self.username is not None:
+                self._update_channels()
+
+            channel = self.active_channel
+            if channel is None:
+                stop.wait(self.interval)
                 continue
 
+            if ids is None:
+                ids = dict.fromkeys(msg.uid for msg in self.messages)
+
             # We need to assign to a temporary
             # variable, otherwise messages can
             # get stuck between setting & getting.
             previous = self._last_get_time
             self._last_get_time = epoch()
-            messages = self.get_since(previous)
+            messages = self._fetch_messages(
+                "since", channel, time=str(previous), accept=False
+            )
+
+            # Polls in flight while stopping are dropped, unless draining. Nothing
+            # was done with their messages yet, so the next loop fetches them again.
+            if stop.is_set() and not self._is_draining:
+                self._last_get_time = previous
+                break
 
             if messages is not None:
                 # there is no good way to type these
                 messages.sort(key=lambda msg: msg.send_time)
 
+                fresh = []
                 for message in messages:
                     # This is needed to avoid duplicates
                     if message.uid in ids:
                         continue
 
-                    self.messages.append(message)
-                    ids.append(message.uid)
+                    ids[message.uid] = None
+                    fresh.append(message)
+
+                fresh = self._accept_messages(channel, fresh)
+                self._store(fresh)
+
+                # Polls can only repeat recent messages, so older uids are forgotten
+                if len(ids) > 2 * DEDUPE_WINDOW:
+                    ids = dict.fromkeys(list(ids)[-DEDUPE_WINDOW:])
+
+                # Index before notifying, so callbacks can already search them
+                if self.search_index is not None and fresh:
+                    self.search_index.add(self.uid, fresh)
+
+                self._deliver(fresh, stop)
+
+                for follower in self._followers:
+                    # pylint: disable-next=protected-access
+                    follower._deliver(
+                        [follower._reconcile(message) for message in fresh],
+                        follower._stop_event,
+                    )
+
+            self._wait(stop, self._poll_interval())
+
+        if self._is_draining:
+            self._flush_batches(force=True)
+
+    def _deliver(self, messages: list[Message], stop: ThreadingEvent) -> None:
+        """Notifies our listeners of new messages.
+
+        Args:
+            messages: The new messages, oldest first.
+            stop: The stop event of the loop delivering them. Once it is set,
+                messages are only delivered when draining.
+        """
+
+        # System events are sent when users or channels change
+        if any(msg.message_type.startswith("system") for msg in messages):
+            self.invalidate_metadata()
+
+        for message in messages:
+            if stop.is_set() and not self._is_draining:
+                break
+
+            self._notify(self._event_of(message), message)
+
+        self._buffer_batches(messages)
+
+        # Batches buffered while stopping are delivered by the next loop
+        if not stop.is_set() or self._is_draining:
+            self._flush_batches()
+
+    def _store(self, messages: list[Message], prepend: bool = False) -> None:
+        """Adds new messages to `messages`, and to the analytics table if enabled."""
+
+        with self._store_lock:
+            if prepend:
+                self.messages.prepend(messages)
+            else:
+                self.messages.extend(messages)
+
+            if self.analytics is not None and messages:
+                self.analytics.extend(messages)
+
+            if self.cold is not None and len(self.messages) >= self._spill_at:
+                self._spill()
+
+    def _spill(self) -> None:
+        """Moves messages beyond the newest `hot_count` of their channel to `cold`.
+
+        This must be called with the store lock held.
+        """
+
+        assert self.cold is not None
+
+        kept: dict[str | None, int] = {}
+        spilled = []
+
+        for message in reversed(self.messages.snapshot()):
+            count = kept.get(message.channel_id, 0)
+
+            if count < self.hot_count:
+                kept[message.channel_id] = count + 1
+            else:
+                spilled.append(message)
+
+        # Messages are written before being removed, so they are never missing
+        if spilled:
+            self.cold.add(spilled)
+            self.messages.discard({message.uid for message in spilled})
 
-                    if message.message_type == "delete":
-                        self._notify(Event.MSG_DEL, message)
+        for channel in self.channels:
+            view = channel.messages.snapshot()
+            excess = len(view) - self.hot_count
 
-                    elif message.message_type == "system":
-                        self._notify(Event.MSG_SYS, message)
+            if excess > 0:
+                channel.messages.discard({message.uid for message in view[:excess]})
 
-                    elif message.message_type == "system-silent":
-                        self._notify(Event.MSG_SYS_SILENT, message)
+        # Scans are batched, so their cost is spread over hot_count messages
+        self._spill_at = len(self.messages) + self.hot_count
 
-                    else:
-                        self._notify(Event.MSG_NEW, message)
+    @staticmethod
+    def _event_of(message: Message) -> Event:
+        """Returns the event a message received by the loop is notified with."""
+
+        if message.message_type == "delete":
+            return Event.MSG_DEL
+
+        if message.message_type == "system":
+            return Event.MSG_SYS
+
+        if message.message_type == "system-silent":
+            return Event.MSG_SYS_SILENT
+
+        return Event.MSG_NEW
+
+    def _buffer_batches(self, messages: list[Message]) -> None:
+        """Adds messages to the buffers of the batch listeners of their events."""
+
+        if not self._batch_listeners or not messages:
+            return
+
+        grouped: dict[Event, list[Message]] = {}
+        for message in messages:
+            grouped.setdefault(self._event_of(message), []).append(message)
+
+        for event, group in grouped.items():
+            listener = self._batch_listeners.get(event)
+            if listener is not None:
+                listener.add(group)
+
+    def _flush_batches(self, force: bool = False) -> None:
+        """Delivers the batches that are due (or all of them, if forced)."""
+
+        for listener in list(self._batch_listeners.values()):
+            for batch in listener.take(force):
+                listener.callback(batch)
+
+    def _wait(self, stop: ThreadingEvent, seconds: float) -> None:
+        """Waits between polls, delivering the batches that come due meanwhile."""
+
+        deadline = monotonic() + seconds
+
+        while True:
+            wake = deadline
+            for listener in list(self._batch_listeners.values()):
+                due = listener.due()
+                if due is not None:
+                    wake = min(wake, due)
 
-            sleep(self.interval)
+            if stop.wait(max(0.0, wake - monotonic())) or wake >= deadline:
+                return
+
+            self._flush_batches()
+
+    def _poll_interval(self) -> float:
+        """Returns the seconds to wait between polls.
+
+        This is `interval`, stretched by the request budget (if any) while
+        it is under pressure, depending on our priority.
+        """
+
+        if self.budget is None:
+            return self.interval
+
+        return self.interval * self.budget.stretch(self.priority)
 
     def _run(self) -> None:
         """Runs monitoring loop"""
@@ -349,8 +798,17 @@ class Chatroom:
         self.event_thread.start()
         self._update_thread_name()
 
-    def _update_channels(self, channels: list[Channel] | None = None) -> None:
-        """Updates channels available to the user."""
+    def _update_channels(
+        self, channels: list[Channel] | None = None, complete: bool = False
+    ) -> None:
+        """Updates channels available to the user.
+
+        Args:
+            channels: The channels to apply. If not given, the full list is
+                fetched from the server.
+            complete: Whether `channels` is the full list of available channels,
+                in which case channels missing from it are removed.
+        """
 
         assert self.username, "Please log in before getting channels!"
 
@@ -359,12 +817,21 @@ class Chatroom:
             if channels is None:
                 return
 
-        for channel in channels:
-            if channel not in self.channels:
-                self.channels.append(channel)
+            complete = True
+
+        delta = self.channels.apply(channels, complete)
 
-        if self.active_channel is None and len(self.channels) > 0:
-            self.active_channel = self.channels[0]
+        for channel in delta.added:
+            self._notify(Event.CHANNEL_NEW, channel)
+
+        for channel in delta.removed:
+            self._notify(Event.CHANNEL_DEL, channel)
+
+        for channel, old_name in delta.renamed:
+            self._notify(Event.CHANNEL_RENAME, channel, old_name)
+
+        if self.active_channel is None or self.active_channel not in self.channels:
+            self.active_channel = self.channels.first()
 
     def _update_thread_name(self) -> None:
         """Sets self.event_thread.name."""
@@ -399,6 +866,26 @@ class Chatroom:
         else:
             channel = self.active_channel
 
+        return self._fetch_messages(method, channel, count, time)
+
+    def _fetch_messages(
+        self,
+        method: str,
+        channel: Channel,
+        count: str | None = None,
+        time: str | None = None,
+        accept: bool = True,
+    ) -> list[Message] | None:
+        """Gets messages of channel, without changing `active_channel`.
+
+        See `Chatroom._get_messages` for the other arguments.
+
+        Args:
+            accept: If not set, the messages are only decoded; they are neither
+                reconciled nor added to channel. This is left to
+                `_accept_messages`, once the caller decided to keep them.
+        """
+
         headers = {
             "get-method": method,
             "username": self.username,
@@ -417,24 +904,114 @@ class Chatroom:
             # Getting messages failed, but error was captured
             return None
 
+        encrypted = [
+            message for message in messages if not message["type"].startswith("system")
+        ]
+        for message, payload in zip(
+            encrypted,
+            self._decrypt_payloads([message["data"] for message in encrypted]),
+        ):
+            data = self._decode_payload(message["type"] == "file", payload)
+
+            # Unreadable messages are kept as received, so they can't stop polling
+            if data is None:
+                message["is_decrypted"] = False
+            else:
+                message["data"] = data
+
+        instances = [Message.from_dict(message) for message in messages]
+
+        if not accept:
+            return instances
+
+        return self._accept_messages(channel, instances)
+
+    def _accept_messages(
+        self, channel: Channel, messages: list[Message]
+    ) -> list[Message]:
+        """Reconciles fetched messages, and adds them to channel.
+
+        Returns:
+            The instances that should be used for the messages. See `_reconcile`.
+        """
+
         instances = []
         for message in messages:
-            if not message["type"].startswith("system"):
-                message["data"] = self._decrypt(message["data"])
-
-            msg_instance = Message.from_dict(message)
+            msg_instance = self._reconcile(message)
             instances.append(msg_instance)
             channel.messages.append(msg_instance)
 
         return instances
 
-    @staticmethod
-    def _encrypt(message: bytes) -> str:
+    def _add_pending(self, message: Message, sent_at: float) -> Message:
+        """Stores a sent message until its echo arrives from the server.
+
+        Args:
+            message: The locally instanced message.
+            sent_at: The `time.monotonic` value from before the message was sent.
+
+        Returns:
+            The instance that should be used for the message. This is only
+            different from `message` when the echo arrived before the response
+            of the send request.
+        """
+
+        with self._pending_lock:
+            echoed = self._recent.get(message.uid)
+
+            if echoed is None:
+                if len(self._pending) > self._RECENT_LIMIT:
+                    expired = monotonic() - self.pending_timeout
+                    self._pending = {
+                        uid: item
+                        for uid, item in self._pending.items()
+                        if item[1] > expired
+                    }
+
+                self._pending[message.uid] = (message, sent_at)
+                return message
+
+        self._notify(Event.MSG_DELIVERED, echoed, monotonic() - sent_at)
+        return echoed
+
+    def _reconcile(self, message: Message) -> Message:
+        """Matches a received message against the ones sent by us.
+
+        Args:
+            message: The message instance created from server data.
+
+        Returns:
+            Either the local instance of a message we sent, updated in place, or
+            the instance first created for a recently received message.
+        """
+
+        with self._pending_lock:
+            pending = self._pending.pop(message.uid, None)
+
+            if pending is None:
+                message = self._recent.setdefault(message.uid, message)
+            else:
+                self._recent[message.uid] = pending[0]
+
+            while len(self._recent) > self._RECENT_LIMIT:
+                self._recent.popitem(last=False)
+
+        if pending is None:
+            return message
+
+        local, sent_at = pending
+        local.send_time = message.send_time
+        local.is_delivered = True
+
+        self._notify(Event.MSG_DELIVERED, local, monotonic() - sent_at)
+        return local
+
+    def _encrypt(self, message: bytes) -> str:
         """Encrypts the given message.
 
         Note:
-            As encryption is currently not supported by the server, all this function does
-            is b64encode the given string.
+            Unless a secret was set using `Chatroom.set_secret`, all this function
+            does is b64encode the given string.
 
         Args:
             message: Text to encrypt.
@@ -443,15 +1020,17 @@ class Chatroom:
             The encrypted text.
         """
 
+        if self.cipher is not None:
+            message = self.cipher.encrypt(message)
+
         return b64encode(message).decode("ascii")
 
-    @staticmethod
-    def _decrypt(message: bytes) -> str:
+    def _decrypt(self, message: bytes | str) -> str:
         """Decrypts the given message.
 
         Note:
-            As encryption is currently not supported by the server, all this function does
-            is b64decode the given string.
+            Unless a secret was set using `Chatroom.set_secret`, all this function
+            does is b64decode the given string.
 
         Args:
             message: Text to decrypt.
@@ -460,45 +1039,413 @@ class Chatroom:
             The decrypted text.
         """
 
-        return b64decode(message).decode("ascii")
+        return self._decrypt_many([message])[0]
 
-    def initialize_from_response(self, response: dict) -> None:
-        """Initializes data of chatroom from a response dict.
+    def _decrypt_many(self, messages: list[bytes | str]) -> list[str]:
+        """Decrypts a batch of messages, see `Chatroom._decrypt`.
 
-        Args:
-            response: A dictionary of Teahaz server response.
+        Raises:
+            ValueError: A message couldn't be decrypted into text.
         """
 
-        self.name = response["chatroom_name"]
-        self.uid = response["chatroomID"]
-        self.username = response["users"][0]["username"]
+        texts = []
+        for payload in self._decrypt_payloads(messages):
+            text = self._decode_payload(False, payload)
+            if text is None:
+                raise ValueError("Message could not be decrypted.")
 
-        assert self.uid is not None
-        self.endpoints.uid = self.uid
-        self._update_thread_name()
+            texts.append(text)
 
-        self._update_channels(
-            [Channel.from_dict(channel) for channel in response["channels"]]
-        )
-        self._is_server_side = True
+        return texts  # type: ignore
 
-    def subscribe(self, event: Event, callback: EventCallback) -> None:
-        """Start listening for and event and run callback when it occurs.
+    def _decrypt_payloads(self, messages: list[bytes | str]) -> list[bytes | None]:
+        """Decrypts a batch of messages into raw bytes.
 
-        Sideeffect:
-            This method will call `self._run()` if the event passed is not an
-            Error or NetworkException.
+        Messages encrypted using a different secret are returned as None.
+        """
+
+        payloads: list[bytes | None] = [b64decode(message) for message in messages]
+
+        if self.cipher is not None:
+            payloads = self.cipher.decrypt_many(payloads)  # type: ignore
+
+        return payloads
+
+    def _decode_payload(
+        self, is_file: bool, payload: bytes | None
+    ) -> str | BlobHandle | None:
+        """Converts a decrypted payload into the data of a `Message`.
+
+        Files are moved into `blob_store` when one is set, leaving only their
+        handle in memory.
+
+        Returns:
+            The data, or None if the payload couldn't be decrypted. Without a
+            secret, encrypted payloads are only caught when decoding them.
+        """
+
+        if payload is None:
+            return None
+
+        if is_file and self.blob_store is not None:
+            return self.blob_store.put(payload)
+
+        try:
+            return payload.decode("ascii")
+        except UnicodeDecodeError:
+            return None
+
+    def set_compression(
+        self,
+        codec: str | None = "gzip",
+        threshold: int = 1024,
+        level: int | None = None,
+    ) -> None:
+        """Enables compression of request bodies, and advertises it for responses.
+
+        The server needs to support `Content-Encoding` on requests for this to
+        work, so it is disabled by default.
+
+        Args:
+            codec: One of `teahaz.compression.available_codecs()`. Passing None
+                disables request compression.
+            threshold: Bodies smaller than this many bytes are sent as-is.
+            level: The compression level, defaulting to the codec's usual one.
+
+        Raises:
+            ValueError: The codec is not available.
+        """
+
+        if codec is not None and codec not in available_codecs():
+            raise ValueError(
+                f"Compression codec {codec!r} is not available, use one of"
+                + f" {available_codecs()}."
+            )
+
+        self.compression = codec
+        self.compression_level = level
+        self.compression_threshold = threshold
+        self.transport.headers["Accept-Encoding"] = accept_encoding()
+
+    def set_transport(self, transport: Transport) -> None:
+        """Replaces the HTTP transport requests are sent through.
+
+        Cookies & the `Accept-Encoding` header (see `set_compression`) are
+        carried over, so we stay logged in. The previous transport is not closed.
+
+        Args:
+            transport: The new transport, see `teahaz.transport`.
+        """
+
+        previous = self.transport
+
+        for cookie in previous.cookies:
+            transport.cookies.set_cookie(cookie)
+
+        if "Accept-Encoding" in previous.headers:
+            transport.headers["Accept-Encoding"] = previous.headers["Accept-Encoding"]
+
+        self.transport = transport
+
+    def set_secret(self, secret: str | bytes | None) -> None:
+        """Enables end-to-end encryption using a secret shared by the chatroom's members.
+
+        Messages are encrypted using AES-GCM with a key derived from the secret,
+        see `teahaz.crypto`. Messages without encryption can still be read.
+
+        Args:
+            secret: The shared secret. Passing None disables encryption.
+        """
+
+        if secret is None:
+            self.cipher = None
+            return
+
+        # pylint: disable-next=import-outside-toplevel
+        from .crypto import RoomCipher
+
+        assert self.uid is not None, "Chatroom must have a uid before setting a secret!"
+        self.cipher = RoomCipher.from_secret(secret, self.uid)
+
+    def initialize_from_response(self, response: dict) -> None:
+        """Initializes data of chatroom from a response dict.
+
+        Args:
+            response: A dictionary of Teahaz server response.
+        """
+
+        self.name = response["chatroom_name"]
+        self.uid = response["chatroomID"]
+        self.username = response["users"][0]["username"]
+
+        assert self.uid is not None
+        self.endpoints.uid = self.uid
+        self._update_thread_name()
+
+        self._update_channels(
+            [Channel.from_dict(channel) for channel in response["channels"]],
+            complete=True,
+        )
+        self._is_server_side = True
+
+    def subscribe(self, event: Event, callback: EventCallback) -> None:
+        """Start listening for and event and run callback when it occurs.
+
+        Sideeffect:
+            This method will call `self._run()` if the event passed is not an
+            Error or NetworkException.
         """
 
         self._listeners[event] = callback
 
-        if not self._is_looping and not event in [Event.ERROR, Event.NETWORK_EXCEPTION]:
+        if (
+            not self._is_looping
+            and not self._is_stopped
+            and not event in [Event.ERROR, Event.NETWORK_EXCEPTION]
+        ):
+            self._run()
+
+    def subscribe_batch(
+        self,
+        event: Event,
+        callback: BatchCallback,
+        max_batch: int = 100,
+        max_delay: float = 0.0,
+    ) -> None:
+        """Start listening for an event, and run callback with lists of its messages.
+
+        This is meant for callbacks with a high per-call cost, such as ones
+        writing to a database, especially while catching up after downtime.
+        It works alongside `subscribe`; both callbacks are run for the event.
+
+        Messages are buffered while the loop isn't running, and delivered
+        (in order) once it is started again. Stopping with `drain=True`
+        delivers them right away.
+
+        Args:
+            event: The event to subscribe to. Only message events received by
+                the event loop can be batched: MSG_NEW, MSG_DEL, MSG_SYS and
+                MSG_SYS_SILENT.
+            callback: The callback that shall be called, with a list of
+                at most `max_batch` messages, oldest first.
+            max_batch: The maximum amount of messages in a batch. A batch is
+                delivered as soon as it is full.
+            max_delay: The maximum amount of seconds a message is held back to
+                fill a batch. If 0, batches are delivered every poll.
+
+        Raises:
+            ValueError: The event is not a message event, or max_batch is
+                not positive.
+
+        Sideeffect:
+            This method will call `self._run()`, like `subscribe`.
+        """
+
+        if event not in MESSAGE_EVENTS:
+            raise ValueError(f"Only message events can be batched, not {event}.")
+
+        if max_batch < 1:
+            raise ValueError("max_batch must be positive.")
+
+        listener = _BatchListener(callback, max_batch, max_delay)
+
+        previous = self._batch_listeners.get(event)
+        if previous is not None:
+            listener.adopt(previous)
+
+        self._batch_listeners[event] = listener
+
+        if not self._is_looping and not self._is_stopped:
             self._run()
 
-    def stop(self) -> None:
-        """Stops event loop."""
+    @property
+    def leader(self) -> Chatroom | None:
+        """The chatroom whose poller we get messages from, if any. See `follow`."""
+
+        return self._leader
+
+    def follow(self, leader: Chatroom) -> None:
+        """Gets messages from leader's event loop, instead of polling for them.
+
+        This is meant for multiple accounts in the same room: only one of
+        them downloads & decodes messages, and its `messages` is shared with
+        its followers. Our listeners are still notified of every message,
+        and our session is still used for everything else, such as sending.
+
+        If the leader is stopped while we are running, we take over polling
+        for it and the other followers.
+
+        Args:
+            leader: A chatroom of the same room (uid & origin). If it follows
+                another chatroom, we follow that one instead.
+
+        Raises:
+            ValueError: The leader is a different room, or ourselves.
+        """
+
+        while leader._leader is not None:
+            leader = leader._leader
+
+        if leader is self:
+            raise ValueError("A chatroom can't follow itself.")
+
+        if leader.uid != self.uid or normalize_origin(leader.url) != normalize_origin(
+            self.url
+        ):
+            raise ValueError("Only chatrooms of the same room can share a poller.")
+
+        self.unfollow()
+
+        # Our own followers move to the new leader
+        followers, self._followers = self._followers, ()
+        for follower in (self, *followers):
+            follower._leader = leader
+            follower._messages = leader._messages
+
+        leader._followers = leader._followers + (self, *followers)
+
+    def unfollow(self) -> None:
+        """Stops following our leader, and starts polling on our own again.
+
+        Our `messages` becomes a copy of the shared ones.
+        """
+
+        leader = self._leader
+        if leader is None:
+            return
+
+        leader._followers = tuple(
+            follower for follower in leader._followers if follower is not self
+        )
+
+        self._leader = None
+        self._last_get_time = leader._last_get_time
+        self._messages = MessageLog(leader._messages.snapshot())
+
+    def _hand_over(self) -> None:
+        """Passes our followers to the first running one, who takes over polling."""
+
+        followers = self._followers
+        successor = next((item for item in followers if not item._is_stopped), None)
+
+        if successor is None:
+            return
+
+        successor._leader = None
+        successor._last_get_time = self._last_get_time
+        successor._followers = tuple(
+            item for item in followers if item is not successor
+        ) + (self,)
+
+        for follower in successor._followers:
+            follower._leader = successor
+
+        self._followers = ()
+
+    def _signal_stop(self, drain: bool = False) -> None:
+        """Tells the event loop to stop, without waiting for it."""
 
         self._is_stopped = True
+        self._is_looping = False
+        self._is_draining = drain
+        self._stop_event.set()
+
+        if self._followers:
+            self._hand_over()
+
+        if self.outbox is not None and not drain:
+            self.outbox.stop(timeout=0)
+
+    def _join(self, deadline: float | None = None, drain: bool = False) -> bool:
+        """Waits for the threads stopped by `_signal_stop` to finish.
+
+        Args:
+            deadline: The `time.monotonic()` value to give up at.
+            drain: Whether the outbox should be drained before it is stopped.
+
+        Returns:
+            Whether all threads finished in time.
+        """
+
+        def _remaining() -> float | None:
+            return None if deadline is None else max(0.0, deadline - monotonic())
+
+        finished = True
+
+        if self.outbox is not None:
+            finished = self.outbox.stop(drain=drain, timeout=_remaining())
+
+        thread = self.event_thread
+        if thread.ident is not None and thread is not current_thread():
+            thread.join(_remaining())
+            finished = finished and not thread.is_alive()
+
+        # Messages spilled by the loop are only in memory until written
+        if self.cold is not None:
+            finished = self.cold.flush(_remaining()) and finished
+
+        return finished
+
+    def stop(self, timeout: float | None = None, drain: bool = False) -> bool:
+        """Stops the event loop & the outbox, and waits for their threads.
+
+        The loop wakes up right away. A poll that is in flight while stopping
+        is abandoned (it can take up to `request_timeout`), and its messages
+        are left for the next loop.
+
+        Args:
+            timeout: The maximum seconds to wait for. If not set, waits until
+                all threads have finished.
+            drain: If set, the current poll is finished and its events are
+                dispatched, and queued messages are sent before stopping.
+
+        Returns:
+            Whether all threads finished within the timeout.
+        """
+
+        self._signal_stop(drain)
+
+        deadline = None if timeout is None else monotonic() + timeout
+        return self._join(deadline, drain)
+
+    def start(self) -> None:
+        """Starts the event loop, if it isn't already running.
+
+        If the chatroom was stopped, a fresh loop is created. It continues
+        polling from where the previous loop stopped. A stopped outbox is
+        restarted too.
+        """
+
+        if self._is_looping:
+            return
+
+        self._is_stopped = False
+
+        if self.event_thread.ident is not None:
+            self._is_draining = False
+            self._stop_event = ThreadingEvent()
+            self.event_thread = self._new_thread(resume=True)
+
+        if self.outbox is not None:
+            self.outbox.start()
+
+        self._run()
+
+    def restart(self, timeout: float | None = None, drain: bool = False) -> bool:
+        """Stops the chatroom, then starts it again with fresh threads.
+
+        Args:
+            timeout: See `stop`.
+            drain: See `stop`.
+
+        Returns:
+            Whether the previous threads finished within the timeout.
+        """
+
+        finished = self.stop(timeout, drain)
+        self.start()
+
+        return finished
 
     def create(self, username: str, password: str) -> Chatroom | None:
         """Creates a new chatroom on the server.
@@ -554,9 +1501,10 @@ class Chatroom:
             return None
 
         channel = Channel.from_dict(response)
+        self.invalidate_metadata("channels")
         self._update_channels([channel])
 
-        return channel
+        return self.channels.get(channel.uid)
 
     def create_invite(
         self, uses: int = 1, expiration_time: float | None = None
@@ -620,50 +1568,115 @@ class Chatroom:
 
         return self
 
-    def get_users(self) -> list[User] | None:
+    def _get_metadata(
+        self, name: str, url: str, parse: Callable[[dict[str, Any]], Any], cached: bool
+    ) -> list[Any] | None:
+        """Gets a list of metadata objects through `metadata_cache`.
+
+        Args:
+            name: The cache key of the metadata, such as "users".
+            url: The endpoint to fetch from.
+            parse: Creates an object from each item of the response.
+            cached: If not set, the cached value is revalidated even if it
+                has not expired.
+
+        Returns:
+            A new list of the (possibly cached) objects, or None if fetching
+            failed but the error was captured.
+        """
+
+        def _fetch(etag: str | None) -> FetchResult:
+            """Fetches the metadata, conditionally if we have an ETag."""
+
+            req_args: dict[str, Any] = {"url": url, "headers": {"username": self.username}}
+            if etag is not None:
+                req_args["headers"]["If-None-Match"] = etag
+
+            response = self._send_request("get", **req_args)
+            if response is None:
+                return None
+
+            if response.status_code == 304:
+                return NOT_MODIFIED
+
+            items = self._handle_response(response, "get", req_args)
+            if items is None:
+                return None
+
+            return [parse(item) for item in items], response.headers.get("ETag")
+
+        # Responses depend on the user we are logged in as
+        key = (name, self.username)
+
+        if not cached:
+            self.metadata_cache.invalidate(key)
+
+        values = self.metadata_cache.get(key, _fetch)
+        if values is None:
+            return None
+
+        return list(values)
+
+    def invalidate_metadata(self, name: str | None = None) -> None:
+        """Makes cached metadata expire, so it is revalidated on its next use.
+
+        This is done automatically when system messages arrive or channels are
+        created, but can be useful when the chatroom is changed by other means.
+
+        Args:
+            name: One of "users" and "channels". If not set, all metadata
+                is invalidated.
+        """
+
+        self.metadata_cache.invalidate(None if name is None else (name, self.username))
+
+    def get_users(self, cached: bool = True) -> list[User] | None:
         """Gets all users in a chatroom.
 
+        Users are cached in `metadata_cache`, see `invalidate_metadata`.
+
+        Args:
+            cached: If not set, the cache is revalidated with the server.
+
         Returns:
             A list of User instances on success, None otherwise.
         """
 
-        users = self._request(
-            "get",
-            url=self.endpoints.users,
-            headers={"username": self.username},
-        )
+        users = self._get_metadata("users", self.endpoints.users, User.from_dict, cached)
 
         if users is None:
             # Getting users failed, but error was captured
             return None
 
-        return [User.from_dict(user) for user in users]
+        self.users = users
+        return self.users
 
-    def get_channels(self) -> list[Channel] | None:
+    def get_channels(self, cached: bool = True) -> list[Channel] | None:
         """Gets all channels the logged-in user has access to.
 
+        Channels are cached in `metadata_cache`, see `invalidate_metadata`.
+
+        Args:
+            cached: If not set, the cache is revalidated with the server.
+
         Returns:
             A list of Channel instances on success, None otherwise.
         """
 
-        channels = self._request(
-            "get",
-            url=self.endpoints.channels,
-            headers={"username": self.username},
+        return self._get_metadata(
+            "channels", self.endpoints.channels, Channel.from_dict, cached
         )
 
-        if channels is None:
-            # Getting channels failed, but error was captured
-            return None
-
-        return [Channel.from_dict(channel) for channel in channels]
-
-    def login(self, username: str, password: str) -> requests.Response | None:
+    def login(
+        self, username: str, password: str, fetch_channels: bool = True
+    ) -> requests.Response | None:
         """Logs into the chatroom with given credentials.
 
         Args:
             username: Username to log into.
             password: Password to log in with.
+            fetch_channels: Whether the available channels should be fetched.
+                If not, the event loop fetches them before its first poll.
 
         Returns:
             Raw response for some reason.
@@ -684,7 +1697,9 @@ class Chatroom:
             return None
 
         self.username = username
-        self._update_channels()
+        if fetch_channels:
+            self._update_channels()
+
         self._is_server_side = True
 
         return response
@@ -727,133 +1742,525 @@ class Chatroom:
             str(count),
         )
 
-    def send(
-        self,
-        content: Union[str, bytes],
-        channel: Channel | None = None,
-        reply_id: str | None = None,
-    ) -> Message | None:
-        """Sends a message.
+    def prefetch(self, count: int) -> list[Message] | None:
+        """Fetches the last count messages of every channel into `messages`.
+
+        Messages already stored are skipped, and no events are sent. This
+        does not change `active_channel`.
 
         Args:
-            content: Message data. Currently only `str` is supported.
-            channel: The channel to send the message on. Defaults to self.active_channel.
-            reply_id: The optional id of the messages this one will reply to.
+            count: The maximum amount of messages fetched per channel.
 
         Returns:
-            None. The outgoing message can be acquired by subscribing to `Event.MSG_SENT`.
-
-        Raises:
-            ValueError: No channel was passed, and self.active_channel is None.
-
-        Sideeffect:
-            This changes self.active_channel to the provided one, if it isn't None.
+            The newly stored messages, or None if fetching any of the
+            channels failed but the error was captured.
         """
 
-        msg = {}
-        if channel is not None:
-            self.active_channel = channel
+        known = {message.uid for message in self.messages}
 
-        elif self.active_channel is None:
-            raise ValueError(
-                "No active channel set. Please use either the Chatroom.set_channel() function"
-                + " or provide `channel` as a non-null value!"
+        fetched: list[Message] = []
+        for channel in self.channels:
+            messages = self._fetch_messages("count", channel, str(count), accept=False)
+            if messages is None:
+                return None
+
+            stored = {message.uid for message in channel.messages}
+            older = sorted(
+                {
+                    message.uid: message
+                    for message in messages
+                    if message.uid not in stored
+                }.values(),
+                key=lambda message: message.send_time,
             )
 
-        if isinstance(content, bytes):
-            endpoint = self.endpoints.files
-        else:
-            endpoint = self.endpoints.messages
+            older = [self._reconcile(message) for message in older]
+            channel.messages.prepend(older)
 
-        if isinstance(content, str):
-            content = content.encode("ascii")
+            fetched.extend(message for message in older if message.uid not in known)
 
-        msg = {
-            "username": self.username,
-            "channelID": self.active_channel.uid,
-            "replyID": reply_id,
-            "data": self._encrypt(content),
-        }
+        fresh = sorted(fetched, key=lambda message: message.send_time)
 
-        sent = self._request(
-            "post",
-            url=endpoint,
-            json=msg,
-        )
+        # Prefetched messages predate anything the loop receives
+        self._store(fresh, prepend=True)
 
-        if sent is not None:
-            sent["data"] = content.decode("ascii")
-            message_out = Message.from_dict(sent)
-            message_out.is_delivered = False
-            self._notify(Event.MSG_SENT, message_out)
+        if self.search_index is not None:
+            self.search_index.add(self.uid, fresh)
 
-            return message_out
+        return fresh
 
-        return None
+    def enable_analytics(self) -> MessageTable:
+        """Starts keeping a columnar table of this chatroom's messages.
 
+        The table is filled with the current history (including archived
+        messages), and then kept up to date with new and prefetched
+        messages. See `teahaz.analytics.MessageTable` for the aggregations
+        it offers.
 
-class Teacup:
-    """The object to manage all API related actions.
+        Returns:
+            The table.
 
-    This class itself doesn't actually do any networking, rather it creates
-    objects (`Chatroom`-s) that do all the dirty work.
+        Raises:
+            ImportError: NumPy is not installed.
+        """
 
-    Standard flow of using a Teacup:
+        # pylint: disable-next=import-outside-toplevel
+        from .analytics import MessageTable
 
-    ```python3
-    from teahaz import Teacup
+        table = MessageTable()
 
-    cup = Teacup()
-    chatroom = cup.login("username", "password", "chatroom-uuid", "url")
-    chatroom.send("hello world!")
-    ```
-    """
+        # Rows can be in any order, so new messages may be added before history
+        with self._store_lock:
+            messages = self.messages.snapshot()
+            self.analytics = table
 
-    def __init__(self) -> None:
-        """Initializes Teacup."""
+        table.extend(self._history(messages))
+        return table
 
-        self.chatrooms: list[Chatroom] = []
-        self._global_listeners: dict[Event, EventCallback] = {}
+    def enable_tiering(
+        self, directory: str | Path, hot_count: int = 1000
+    ) -> SegmentStore:
+        """Keeps only the newest messages of each channel in memory.
 
-    @classmethod
-    def from_dump(cls, save_root: str | Path) -> Teacup:
-        """Restore a dump."""
+        Older messages are spilled to a `teahaz.tiering.SegmentStore` on disk,
+        in batches, as new ones arrive. They stay available through `history`,
+        so memory use is bounded regardless of the amount of history. Batches
+        are written in the background; `stop` waits for them.
 
-        cup = cls()
-        for directory in os.listdir(save_root):
-            dirpath = Path(save_root) / directory
+        Args:
+            directory: The directory to keep spilled messages in. Messages
+                spilled into it earlier are reused.
+            hot_count: The amount of messages kept in `messages` (and in the
+                `messages` of each channel) per channel.
 
-            if not dirpath.is_dir():
-                continue
+        Returns:
+            The segment store.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from .tiering import SegmentStore
+
+        with self._store_lock:
+            self.hot_count = hot_count
+            self.cold = SegmentStore(directory, self.blob_store)
+            self._spill()
+
+        return self.cold
+
+    def _archived_until(self) -> float | None:
+        """Returns the send_time of the newest archived message, if any."""
+
+        if self.archive is None or len(self.archive) == 0:
+            return None
+
+        return self.archive.send_time[-1]
+
+    def history(
+        self, start: float | None = None, end: float | None = None
+    ) -> Iterator[Message]:
+        """Iterates over all known messages sent within `[start, end]`.
+
+        Archived messages come first, found by binary search without loading
+        the rest of the archive. They are followed by the messages in
+        `messages` that are newer than the archive, merged with the ones
+        spilled to disk if tiering is enabled (see `enable_tiering`).
+
+        Args:
+            start: The earliest send_time to include.
+            end: The latest send_time to include.
+        """
+
+        yield from self._history(self.messages.snapshot(), start, end)
+
+    def _history(
+        self,
+        messages: Iterable[Message],
+        start: float | None = None,
+        end: float | None = None,
+    ) -> Iterator[Message]:
+        """Iterates over archived messages, followed by the newer ones of messages.
+
+        See `history`.
+        """
+
+        if self.archive is not None:
+            yield from self.archive.messages(start, end)
+
+        until = self._archived_until()
+
+        def _newer() -> Iterator[Message]:
+            for message in messages:
+                if until is not None and message.send_time <= until:
+                    continue
+
+                if start is not None and message.send_time < start:
+                    continue
+
+                if end is not None and message.send_time > end:
+                    continue
+
+                yield message
+
+        if self.cold is None:
+            yield from _newer()
+            return
+
+        # Messages spilled since messages was taken are in both tiers
+        newer = list(_newer())
+        kept = {message.uid for message in newer}
+        spilled = (
+            message
+            for message in self.cold.messages(start, end)
+            if message.uid not in kept
+        )
+
+        # Spilled messages are interleaved with the kept ones of quieter channels
+        yield from heapq.merge(spilled, newer, key=lambda message: message.send_time)
+
+    def send(
+        self,
+        content: Union[str, bytes],
+        channel: Channel | None = None,
+        reply_id: str | None = None,
+    ) -> Message | None:
+        """Sends a message.
 
-            with open(dirpath / "data.json", "r", encoding="utf-8") as datafile:
-                data = json.load(datafile)
+        Args:
+            content: Message data. Currently only `str` is supported.
+            channel: The channel to send the message on. Defaults to self.active_channel.
+            reply_id: The optional id of the messages this one will reply to.
+
+        Returns:
+            None. The outgoing message can be acquired by subscribing to `Event.MSG_SENT`.
 
+        Raises:
+            ValueError: No channel was passed, and self.active_channel is None.
+
+        Sideeffect:
+            This changes self.active_channel to the provided one, if it isn't None.
+        """
+
+        if channel is not None:
+            self.active_channel = channel
+
+        elif self.active_channel is None:
+            raise ValueError(
+                "No active channel set. Please use either the Chatroom.set_channel() function"
+                + " or provide `channel` as a non-null value!"
+            )
+
+        return self._post(content, self.active_channel, reply_id)
+
+    def _post(
+        self,
+        content: Union[str, bytes],
+        channel: Channel,
+        reply_id: str | None = None,
+    ) -> Message | None:
+        """Posts a message to channel, without touching any chatroom state.
+
+        Args:
+            content: Message data.
+            channel: The channel to send the message on.
+            reply_id: The optional id of the messages this one will reply to.
+
+        Returns:
+            The locally instanced message on success, None otherwise.
+        """
+
+        sent_at = monotonic()
+        sent = self._request("post", **self._post_args(content, channel, reply_id))
+
+        if sent is not None:
+            return self._sent_message(content, sent, sent_at)
+
+        return None
+
+    def _post_args(
+        self,
+        content: Union[str, bytes],
+        channel: Channel,
+        reply_id: str | None = None,
+    ) -> dict[str, Any]:
+        """Returns the request arguments posting a message. See `_post`."""
+
+        is_file = isinstance(content, bytes)
+        endpoint = self.endpoints.files if is_file else self.endpoints.messages
+
+        if isinstance(content, str):
+            content = content.encode("ascii")
+
+        msg = {
+            "username": self.username,
+            "channelID": channel.uid,
+            "replyID": reply_id,
+            "data": self._encrypt(content),
+        }
+
+        return {"url": endpoint, "json": msg}
+
+    def _sent_message(
+        self, content: Union[str, bytes], sent: dict[str, Any], sent_at: float
+    ) -> Message:
+        """Creates the local instance of a posted message, waiting for its echo.
+
+        Args:
+            content: The message data.
+            sent: The JSON response of the post.
+            sent_at: The `time.monotonic` value from before the message was sent.
+        """
+
+        is_file = isinstance(content, bytes)
+        if isinstance(content, str):
+            content = content.encode("ascii")
+
+        sent["data"] = self._decode_payload(is_file, content)
+        message_out = Message.from_dict(sent)
+        message_out.is_delivered = False
+        message_out = self._add_pending(message_out, sent_at)
+        self._notify(Event.MSG_SENT, message_out)
+
+        return message_out
+
+    def configure_outbox(
+        self, rate: float = 5.0, burst: int = 10, coalesce_limit: int = 0
+    ) -> Outbox:
+        """Sets up the outgoing message queue used by `Chatroom.queue`.
+
+        Any previously configured outbox is stopped after sending its queued
+        messages.
+
+        Args:
+            rate: The maximum sustained messages sent per second.
+            burst: The maximum amount of messages sent at once.
+            coalesce_limit: The maximum length of a message created by joining
+                consecutive short texts to the same channel. 0 disables coalescing.
+
+        Returns:
+            The new `Outbox`.
+        """
+
+        if self.outbox is not None:
+            self.outbox.stop(drain=True)
+
+        self.outbox = Outbox(self, rate, burst, coalesce_limit)
+        return self.outbox
+
+    def queue(
+        self,
+        content: Union[str, bytes],
+        channel: Channel | None = None,
+        reply_id: str | None = None,
+    ) -> Future:
+        """Queues a message for sending by the outbox worker.
+
+        Unlike `send`, this is safe to call from many threads at once: it never
+        changes `active_channel`, and the outbox limits the rate at which
+        messages hit the server. An outbox with default settings is created on
+        first use, see `configure_outbox` to change them.
+
+        Args:
+            content: Message data.
+            channel: The channel to send the message on. Defaults to self.active_channel.
+            reply_id: The optional id of the messages this one will reply to.
+
+        Returns:
+            A future resolving to the sent `Message`, or None if sending failed
+            but the error was captured.
+
+        Raises:
+            ValueError: No channel was passed, and self.active_channel is None.
+        """
+
+        channel = channel or self.active_channel
+        if channel is None:
+            raise ValueError(
+                "No active channel set. Please use either the Chatroom.set_channel() function"
+                + " or provide `channel` as a non-null value!"
+            )
+
+        if self.outbox is None:
+            self.configure_outbox()
+
+        assert self.outbox is not None
+        return self.outbox.put(content, channel, reply_id)
+
+
+def _message_to_dict(message: Message) -> dict[str, Any]:
+    """Returns the dumped form of a message.
+
+    Blob payloads are stored by reference, as `{"blob": digest, "size": size}`.
+    """
+
+    if not isinstance(message.data, BlobHandle):
+        return asdict(message)
+
+    # Other fields are plain values, so there is nothing to convert recursively
+    data = {field.name: getattr(message, field.name) for field in fields(message)}
+    data["data"] = {"blob": message.data.digest, "size": message.data.size}
+
+    return data
+
+
+@dataclass
+class LoginResult:
+    """The outcome of logging into a single chatroom with `Teacup.login_many`."""
+
+    url: str
+    chatroom_id: str
+    username: str
+
+    chatroom: Chatroom | None = None
+    """The logged-in chatroom. Only set on success."""
+
+    error: Exception | None = None
+    """The exception that caused the login or warm-up to fail."""
+
+    elapsed: float = 0.0
+    """Seconds spent logging in and warming up."""
+
+    @property
+    def is_ok(self) -> bool:
+        """Whether the login succeeded."""
+
+        return self.error is None
+
+
+class Teacup:
+    """The object to manage all API related actions.
+
+    This class itself doesn't actually do any networking, rather it creates
+    objects (`Chatroom`-s) that do all the dirty work.
+
+    Standard flow of using a Teacup:
+
+    ```python3
+    from teahaz import Teacup
+
+    cup = Teacup()
+    chatroom = cup.login("username", "password", "chatroom-uuid", "url")
+    chatroom.send("hello world!")
+    ```
+    """
+
+    def __init__(self, blob_root: str | Path | None = None) -> None:
+        """Initializes Teacup.
+
+        Args:
+            blob_root: If set, the payloads of file messages in all chatrooms
+                are kept in a `teahaz.blobs.BlobStore` at this directory,
+                instead of in memory. It should not be inside a dump's root.
+        """
+
+        self.blob_store = None if blob_root is None else BlobStore(blob_root)
+        self.registry = ChatroomRegistry()
+        self.search_index: SearchIndex | None = None
+        self.budgets: dict[str, RequestBudget] = {}
+        self.transports: dict[str, HTTP2Transport] = {}
+        self.shared_polling = False
+        self._budget_args: tuple[float, int] | None = None
+        self._http2_args: dict[str, Any] | None = None
+        self._global_listeners: dict[Event, EventCallback] = {}
+        self._global_batch_listeners: dict[
+            Event, tuple[BatchCallback, int, float]
+        ] = {}
+        self._adapter: Any = None
+        self._adapter_size = 0
+
+    @property
+    def chatrooms(self) -> tuple[Chatroom, ...]:
+        """An immutable snapshot of all chatrooms, in the order they were added.
+
+        Taking it is free, and it is safe to iterate while other threads
+        add or remove chatrooms.
+        """
+
+        return self.registry.snapshot()
+
+    @staticmethod
+    def _load_chatroom(dirpath: Path) -> Chatroom:
+        """Restores a single chatroom from its dump directory.
+
+        Args:
+            dirpath: The directory written for the chatroom by `dump_to`.
+
+        Returns:
+            The restored chatroom. It is not subscribed to any events.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from .archive import ARCHIVE_NAME, HistoryArchive
+
+        with open(dirpath / "data.json", "r", encoding="utf-8") as datafile:
+            data = json.load(datafile)
+
+        messages = []
+        if (dirpath / "messages.json").is_file():
             with open(dirpath / "messages.json", "r", encoding="utf-8") as messagefile:
                 messages = json.load(messagefile)
 
-            with open(dirpath / "session.pickle", "rb") as picklefile:
-                session = pickle.load(picklefile)
+        with open(dirpath / "session.pickle", "rb") as picklefile:
+            session = pickle.load(picklefile)
 
-            chat = Chatroom(data["url"], session=session)
-            for channel in data["channels"]:
-                channel["channelID"] = channel["uid"]
+        chat = Chatroom(data["url"], session=session)
+        for channel in data["channels"]:
+            channel["channelID"] = channel["uid"]
 
-            for message in messages:
-                message["messageID"] = message["uid"]
-                message["time"] = message["send_time"]
-                message["type"] = message["message_type"]
-                message["channelID"] = message["channel_id"]
+        if data.get("blob_root") is not None:
+            chat.blob_store = BlobStore(data["blob_root"])
+
+        # Archived messages are only mapped, and read when they are accessed
+        if (dirpath / ARCHIVE_NAME).is_file():
+            chat.archive = HistoryArchive(dirpath / ARCHIVE_NAME, chat.blob_store)
+
+        for message in messages:
+            message["messageID"] = message["uid"]
+            message["time"] = message["send_time"]
+            message["type"] = message["message_type"]
+            message["channelID"] = message["channel_id"]
+
+            blob = message["data"]
+            if isinstance(blob, dict) and "blob" in blob and chat.blob_store:
+                message["data"] = BlobHandle(
+                    blob["blob"], blob["size"], chat.blob_store.path_of(blob["blob"])
+                )
+
+        chat.messages = [Message.from_dict(msg) for msg in messages]
+        chat.initialize_from_response(data)
+
+        for message in chat.messages:
+            if message.channel_id is None:
+                continue
+
+            channel = chat.channels.get(message.channel_id)
+            if channel is not None:
+                channel.messages.append(message)
+
+        # Messages spilled before the dump are left where they are
+        if data.get("cold_root") is not None:
+            chat.enable_tiering(data["cold_root"], data["hot_count"])
+
+        return chat
+
+    @classmethod
+    def from_dump(cls, save_root: str | Path, search: bool = False) -> Teacup:
+        """Restore a dump.
 
-            chat.messages = [Message.from_dict(msg) for msg in messages]
-            chat.initialize_from_response(data)
+        Args:
+            save_root: The root directory written by `dump_to`.
+            search: If set, an in-memory search index is built from the
+                restored history. See `enable_search`.
+        """
 
-            for channel in chat.channels:
-                for message in chat.messages:
-                    if channel.uid == message.channel_id:
-                        channel.messages.append(message)
+        # pylint: disable-next=import-outside-toplevel
+        from .snapshot import chatroom_directories
 
-            cup.chatrooms.append(chat)
+        cup = cls()
+        if search:
+            cup.enable_search()
+
+        for dirpath in chatroom_directories(save_root):
+            cup.add_chatroom(cls._load_chatroom(dirpath))
 
         return cup
 
@@ -862,6 +2269,7 @@ class Teacup:
         save_root: str | Path,
         remove_old: bool = True,
         max_msg_count: int | None = None,
+        archive: bool | None = None,
     ) -> None:
         """Dumps all chatrooms to the given save_root.
 
@@ -877,7 +2285,7 @@ class Teacup:
         |   |   |_ channels: <value>
         |   |   |_ users: <value>
         |   |
-        |   |_ messages.json
+        |   |_ messages.json or history.tharch
         |   |   |_ <list of chatroom.messages>
         |   |
         |   |_ session.pickle
@@ -887,57 +2295,110 @@ class Teacup:
             |_ ...
         ```
 
+        Args:
+            save_root: The root directory to save to. It is created if needed.
+            remove_old: If set, the dumps of chatrooms that are no longer in
+                this Teacup are removed, once all others are written.
+            max_msg_count: The maximum amount of messages dumped per chatroom.
+                Archived messages are not counted.
+            archive: If set, messages are written into a memory-mapped
+                `teahaz.archive.HistoryArchive` instead of JSON, which
+                `from_dump` can open without reading it. By default chatrooms
+                restored from an archive are dumped into one, others to JSON.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from .snapshot import ChatroomSnapshot, write_dump
+
+        snapshots = [
+            ChatroomSnapshot.capture(chatroom, max_msg_count)
+            for chatroom in self.chatrooms
+        ]
+
+        write_dump(save_root, snapshots, remove_old, archive)
+
+    def start_snapshots(  # pylint: disable=too-many-arguments
+        self,
+        save_root: str | Path,
+        interval: float | None = 60.0,
+        max_msg_count: int | None = None,
+        archive: bool | None = None,
+        remove_old: bool = True,
+    ) -> Snapshotter:
+        """Starts dumping all chatrooms in the background.
+
+        The dumps are the same as the ones written by `dump_to`. They are
+        taken every interval, and whenever `Snapshotter.request` is called
+        on the returned object. Stop them using `Snapshotter.stop`.
+
         Args:
             save_root: The root directory to save to.
-            remove_old: If set, the previous content of the root directory
-                will be wiped before dumping.
+            interval: The seconds between snapshots. If None, snapshots are
+                only taken on request.
+            max_msg_count: See `dump_to`.
+            archive: See `dump_to`.
+            remove_old: See `dump_to`.
+
+        Returns:
+            The running `teahaz.snapshot.Snapshotter`.
         """
 
-        if isinstance(save_root, Path):
-            root = save_root
-        else:
-            root = Path(save_root)
+        # pylint: disable-next=import-outside-toplevel
+        from .snapshot import Snapshotter
 
-        if remove_old:
-            for path in os.listdir(root):
-                if not os.path.isdir(path):
-                    continue
+        snapshotter = Snapshotter(
+            self, save_root, interval, max_msg_count, archive, remove_old
+        )
+        snapshotter.start()
 
-                shutil.rmtree(root / path)
+        return snapshotter
 
-        for chatroom in self.chatrooms:
-            assert chatroom.uid is not None
+    def _prepare_chatroom(self, chatroom: Chatroom) -> None:
+        """Gives chatroom what it needs before its first request.
 
-            datapath = root / chatroom.uid / "data.json"
-            messagepath = root / chatroom.uid / "messages.json"
-            picklepath = root / chatroom.uid / "session.pickle"
-
-            if not os.path.exists(root / chatroom.uid):
-                os.mkdir(root / chatroom.uid)
-
-            with open(datapath, "w", encoding="utf-8") as datafile:
-                # TODO: Change this once there is proper support for users
-                users = [{"username": chatroom.username}]
-
-                json.dump(
-                    {
-                        "chatroomID": chatroom.uid,
-                        "url": chatroom.url,
-                        "chatroom_name": chatroom.name,
-                        "users": users,
-                        "channels": [asdict(channel) for channel in chatroom.channels],
-                    },
-                    datafile,
-                )
+        It is given our blob store and its origin's request budget, unless it
+        already has them, and its history is added to our search index. With
+        HTTP/2, it shares its origin's connections.
+        """
 
-            with open(messagepath, "w", encoding="utf-8") as messagefile:
-                if max_msg_count is not None:
-                    chatroom.messages = chatroom.messages[:max_msg_count]
+        if chatroom.blob_store is None:
+            chatroom.blob_store = self.blob_store
 
-                json.dump([asdict(msg) for msg in chatroom.messages], messagefile)
+        if chatroom.budget is None:
+            chatroom.budget = self._budget_for(chatroom.url)
 
-            with open(picklepath, "wb") as picklefile:
-                pickle.dump(chatroom.session, picklefile)
+        if self._http2_args is not None:
+            chatroom.set_transport(self._transport_for(chatroom.url))
+
+        if self.search_index is not None and chatroom.search_index is None:
+            chatroom.search_index = self.search_index
+
+            if chatroom.uid is not None:
+                self.search_index.add(chatroom.uid, chatroom.history())
+
+        # Error listeners capture the errors of logging in, and don't start the loop
+        for event in (Event.ERROR, Event.NETWORK_EXCEPTION):
+            if event in self._global_listeners:
+                chatroom.subscribe(event, self._global_listeners[event])
+
+    def _register_chatroom(self, chatroom: Chatroom) -> None:
+        """Adds a prepared chatroom, subscribing it to all global events.
+
+        With shared polling, it follows another chatroom of the same room.
+        Subscribing starts the chatroom's event loop, so this is only done
+        once it is logged in.
+        """
+
+        if self.shared_polling:
+            self._join_poller(chatroom)
+
+        for event, callback in self._global_listeners.items():
+            chatroom.subscribe(event, callback)
+
+        for event, args in self._global_batch_listeners.items():
+            chatroom.subscribe_batch(event, *args)
+
+        self.registry.add(chatroom)
 
     def get_threads(self) -> list[str]:
         """Gets names of all chatroom threads."""
@@ -958,20 +2419,177 @@ class Teacup:
         """
 
         chat = Chatroom(url=url, uid=chatroom)
-
-        for event, callback in self._global_listeners.items():
-            chat.subscribe(event, callback)
+        self._prepare_chatroom(chat)
 
         chat.login(username, password)
-        self.chatrooms.append(chat)
+        self._register_chatroom(chat)
 
         return chat
 
-    def stop(self) -> None:
-        """Stops all chatroom threads."""
+    def _shared_adapter(self, pool_size: int) -> Any:
+        """Returns the HTTP adapter shared by chatrooms from `login_many`.
+
+        Mounting one adapter on many sessions makes them share a connection
+        pool, while keeping their cookies separate.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from requests.adapters import HTTPAdapter
+
+        if self._adapter is None or self._adapter_size < pool_size:
+            self._adapter = HTTPAdapter(pool_maxsize=pool_size)
+            self._adapter_size = pool_size
+
+        return self._adapter
+
+    def _login_one(
+        self,
+        credentials: tuple[str, str, str, str],
+        adapter: Any,
+        prefetch_channels: bool,
+        prefetch_users: bool,
+        prefetch_messages: int,
+    ) -> LoginResult:
+        """Logs into and warms up a single chatroom for `login_many`."""
+
+        url, uid, username, password = credentials
+        result = LoginResult(url, uid, username)
+        started = monotonic()
+
+        try:
+            chat = Chatroom(url=url, uid=uid)
+
+            if adapter is not None:
+                chat.session.mount("http://", adapter)
+                chat.session.mount("https://", adapter)
+
+            self._prepare_chatroom(chat)
+
+            if chat.login(username, password, fetch_channels=prefetch_channels) is None:
+                raise RuntimeError(f"Login to {uid!r} failed; the error was captured.")
+
+            if prefetch_users and chat.get_users() is None:
+                raise RuntimeError(f"Getting users of {uid!r} failed.")
+
+            if prefetch_messages > 0 and chat.prefetch(prefetch_messages) is None:
+                raise RuntimeError(f"Prefetching messages of {uid!r} failed.")
+
+        except Exception as exception:  # pylint: disable=broad-except
+            result.error = exception
+
+        else:
+            self._register_chatroom(chat)
+            result.chatroom = chat
+
+        result.elapsed = monotonic() - started
+        return result
+
+    def login_many(  # pylint: disable=too-many-arguments
+        self,
+        credentials: Iterable[tuple[str, str, str, str]],
+        concurrency: int = 16,
+        prefetch_channels: bool = True,
+        prefetch_users: bool = False,
+        prefetch_messages: int = 0,
+        share_transport: bool = True,
+    ) -> list[LoginResult]:
+        """Logs into many chatrooms in parallel.
+
+        A failing chatroom never aborts the batch: its exception is stored on
+        its result, and it is not added to this Teacup.
+
+        ```python3
+        results = cup.login_many(
+            [("https://teahaz.co.uk", "chatroom-uuid", "username", "password")],
+            prefetch_messages=50,
+        )
+        failed = [result for result in results if not result.is_ok]
+        ```
+
+        Args:
+            credentials: `(url, chatroom, username, password)` tuples, with the
+                same meaning as the arguments of `Teacup.login`.
+            concurrency: The maximum amount of logins in flight at once.
+            prefetch_channels: Whether to fetch channels during login. If not,
+                they are fetched by the event loop once it starts.
+            prefetch_users: Whether to fetch users after login.
+            prefetch_messages: How many of the last messages to fetch per
+                channel. See `Chatroom.prefetch`.
+            share_transport: If set, all chatrooms share a single connection
+                pool instead of opening their own.
+
+        Returns:
+            A `LoginResult` for every item of credentials, in the same order.
+        """
+
+        credentials = list(credentials)
+        if not credentials:
+            return []
+
+        concurrency = max(1, min(concurrency, len(credentials)))
+        adapter = self._shared_adapter(concurrency) if share_transport else None
+
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="Teacup.login_many"
+        ) as executor:
+            return list(
+                executor.map(
+                    lambda item: self._login_one(
+                        item,
+                        adapter,
+                        prefetch_channels,
+                        prefetch_users,
+                        prefetch_messages,
+                    ),
+                    credentials,
+                )
+            )
+
+    def stop(self, timeout: float | None = None, drain: bool = False) -> bool:
+        """Stops all chatroom threads, and waits for them to finish.
+
+        All chatrooms are signalled before waiting for any of them, so they
+        shut down concurrently.
+
+        Args:
+            timeout: The maximum seconds to wait for in total. If not set,
+                waits until all threads have finished.
+            drain: If set, pending polls, event dispatch and queued messages are
+                finished first. See `Chatroom.stop`.
+
+        Returns:
+            Whether all threads finished within the timeout.
+        """
+
+        # pylint: disable=protected-access
+        chatrooms = self.chatrooms
+        for chatroom in chatrooms:
+            chatroom._signal_stop(drain)
+
+        deadline = None if timeout is None else monotonic() + timeout
+        return all([chatroom._join(deadline, drain) for chatroom in chatrooms])
+
+    def start(self) -> None:
+        """Starts the event loops of all chatrooms. See `Chatroom.start`."""
 
         for chatroom in self.chatrooms:
-            chatroom.stop()
+            chatroom.start()
+
+    def restart(self, timeout: float | None = None, drain: bool = False) -> bool:
+        """Stops, then starts all chatrooms with fresh threads.
+
+        Args:
+            timeout: See `stop`.
+            drain: See `stop`.
+
+        Returns:
+            Whether the previous threads finished within the timeout.
+        """
+
+        finished = self.stop(timeout, drain)
+        self.start()
+
+        return finished
 
     def get_chatroom(self, name: str) -> Chatroom | None:
         """Gets first chatroom by matching name.
@@ -980,11 +2598,65 @@ class Teacup:
             name: The chatroom display name to search for.
         """
 
-        for chatroom in self.chatrooms:
-            if chatroom.name == name:
-                return chatroom
+        found = self.registry.by_name(name)
+        return found[0] if found else None
 
-        return None
+    def get_chatroom_by_uid(self, uid: str) -> Chatroom | None:
+        """Gets first chatroom by matching uid.
+
+        Args:
+            uid: The chatroom UUID to search for.
+        """
+
+        return self.registry.get(uid)
+
+    def get_chatrooms_by_url(self, url: str) -> tuple[Chatroom, ...]:
+        """Gets all chatrooms hosted on the same origin as url.
+
+        Args:
+            url: The server URL:PORT. Any path component is ignored.
+        """
+
+        return self.registry.by_origin(url)
+
+    def add_chatroom(self, chatroom: Chatroom) -> None:
+        """Adds an existing chatroom, subscribing it to all global events.
+
+        Args:
+            chatroom: The chatroom to add. It should already have a uid.
+        """
+
+        self._prepare_chatroom(chatroom)
+        self._register_chatroom(chatroom)
+
+    def remove_chatroom(self, chatroom: Chatroom | str) -> Chatroom | None:
+        """Stops and removes a chatroom.
+
+        Args:
+            chatroom: The chatroom instance, or the uid of the chatroom to remove.
+
+        Returns:
+            The removed chatroom, or None if it wasn't found.
+        """
+
+        if isinstance(chatroom, str):
+            found = self.registry.get(chatroom)
+            if found is None:
+                return None
+
+            chatroom = found
+
+        if not self.registry.remove(chatroom):
+            return None
+
+        chatroom.stop()
+        chatroom.unfollow()
+
+        if chatroom.search_index is self.search_index is not None:
+            assert chatroom.uid is not None
+            self.search_index.remove_chatroom(chatroom.uid)
+
+        return chatroom
 
     def create_chatroom(
         self, url: str, name: str, username: str, password: str
@@ -1006,15 +2678,13 @@ class Teacup:
 
         chat = Chatroom(url=url, name=name)
 
-        # Subscribe chatroom to all global events we are subscribed to
-        for event, callback in self._global_listeners.items():
-            chat.subscribe(event, callback)
+        self._prepare_chatroom(chat)
 
         if chat.create(username, password) is None:
             # Creation failed, but error was captured
             return None
 
-        self.chatrooms.append(chat)
+        self._register_chatroom(chat)
         return chat
 
     def use_invite(
@@ -1034,17 +2704,219 @@ class Teacup:
 
         chat = Chatroom(url=invite.url, uid=invite.chatroom_id)
 
-        # Subscribe chatroom to all global events we are subscribed to
-        for event, callback in self._global_listeners.items():
-            chat.subscribe(event, callback)
+        self._prepare_chatroom(chat)
 
         if chat.create_from_invite(invite, username, password) is None:
             # Creation failed, but error was captured
             return None
 
-        self.chatrooms.append(chat)
+        self._register_chatroom(chat)
         return chat
 
+    def share_polling(self, enabled: bool = True) -> None:
+        """Makes chatrooms of the same room (uid & origin) share a single poller.
+
+        This is meant for multiple accounts in the same room: one of them
+        polls, and the others get its messages, as described in
+        `Chatroom.follow`. Chatrooms added later join their room's poller.
+
+        Args:
+            enabled: If not set, every chatroom goes back to polling on its own.
+        """
+
+        self.shared_polling = enabled
+
+        for chatroom in self.chatrooms:
+            if enabled:
+                self._join_poller(chatroom)
+            else:
+                chatroom.unfollow()
+
+    def _join_poller(self, chatroom: Chatroom) -> None:
+        """Makes chatroom follow another chatroom of its room, if there is one."""
+
+        if chatroom.leader is not None or chatroom.uid is None:
+            return
+
+        origin = normalize_origin(chatroom.url)
+
+        for other in self.registry.by_uid(chatroom.uid):
+            if (
+                other is not chatroom
+                and other.leader is None
+                and normalize_origin(other.url) == origin
+            ):
+                chatroom.follow(other)
+                return
+
+    def _budget_for(self, url: str) -> RequestBudget | None:
+        """Returns the request budget of url's origin, creating it if needed."""
+
+        origin = normalize_origin(url)
+        budget = self.budgets.get(origin)
+
+        if budget is None and self._budget_args is not None:
+            budget = self.budgets[origin] = RequestBudget(*self._budget_args)
+
+        return budget
+
+    def set_request_budget(
+        self, rate: float, burst: int, url: str | None = None
+    ) -> None:
+        """Limits the rate of requests sent to a server by all of our chatrooms.
+
+        Chatrooms share their origin's budget according to their `priority`
+        (see `teahaz.budget.Priority`): interactive ones get requests through
+        first, while the others poll less often as the budget runs out. The
+        rate is halved when the server signals overload, and recovers gradually.
+
+        Args:
+            rate: The maximum sustained requests per second.
+            burst: The maximum amount of requests sent at once.
+            url: The URL of the server to limit. If not set, every server
+                gets a budget of its own with these limits, replacing the
+                existing budgets.
+        """
+
+        if url is None:
+            self._budget_args = (rate, burst)
+            self.budgets.clear()
+        else:
+            self.budgets[normalize_origin(url)] = RequestBudget(rate, burst)
+
+        for chatroom in self.chatrooms:
+            if url is None or normalize_origin(chatroom.url) == normalize_origin(url):
+                chatroom.budget = self._budget_for(chatroom.url)
+
+    def _transport_for(self, url: str) -> HTTP2Transport:
+        """Returns a new HTTP/2 transport sharing the connections of url's origin."""
+
+        assert self._http2_args is not None
+
+        origin = normalize_origin(url)
+        transport = self.transports.get(origin)
+
+        if transport is None:
+            transport = self.transports[origin] = HTTP2Transport(**self._http2_args)
+
+        return transport.fork()
+
+    def use_http2(
+        self, enabled: bool = True, max_connections: int = 2, cleartext: bool = False
+    ) -> None:
+        """Sends the requests of all chatrooms over HTTP/2, multiplexed per origin.
+
+        Chatrooms on the same server share at most `max_connections`
+        connections, instead of needing one for every request in flight,
+        while keeping their own cookies. This should be called before starting
+        chatrooms, as requests in flight on the replaced connections may fail.
+
+        See `teahaz.transport.HTTP2Transport` for the arguments. This needs the
+        optional `httpx` package, with its `http2` extra.
+
+        Args:
+            enabled: If not set, chatrooms go back to their `requests` sessions.
+
+        Raises:
+            ImportError: httpx or its HTTP/2 support is not installed.
+        """
+
+        previous = self.transports
+        self.transports = {}
+
+        if enabled:
+            # Fails before any chatroom is changed
+            _import_httpx()
+
+            self._http2_args = {
+                "max_connections": max_connections,
+                "cleartext": cleartext,
+            }
+
+            for chatroom in self.chatrooms:
+                chatroom.set_transport(self._transport_for(chatroom.url))
+
+        else:
+            self._http2_args = None
+
+            for chatroom in self.chatrooms:
+                chatroom.set_transport(SessionTransport(chatroom.session))
+
+        for transport in previous.values():
+            transport.close()
+
+    def enable_search(
+        self, path: str | Path | None = None, memory_budget: int | None = None
+    ) -> SearchIndex:
+        """Starts keeping a full-text search index of all chatrooms.
+
+        The history of current chatrooms (including archived messages) is
+        indexed right away, and new messages are indexed as they arrive.
+
+        Args:
+            path: The file to keep the index in. If not set, it is kept in memory.
+                An existing index file is reused, and extended with any history
+                missing from it.
+            memory_budget: The maximum amount of memory used by the index, in
+                bytes. See `teahaz.search.SearchIndex`.
+
+        Returns:
+            The index.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from .search import SearchIndex
+
+        self.search_index = SearchIndex(path, memory_budget)
+
+        for chatroom in self.chatrooms:
+            chatroom.search_index = self.search_index
+
+            if chatroom.uid is not None:
+                self.search_index.add(chatroom.uid, chatroom.history())
+
+        return self.search_index
+
+    def search(  # pylint: disable=too-many-arguments
+        self,
+        query: str,
+        chatroom: Chatroom | str | None = None,
+        channel: Channel | str | None = None,
+        user: str | None = None,
+        start: float | None = None,
+        end: float | None = None,
+        limit: int | None = 100,
+    ) -> list[SearchHit]:
+        """Searches the messages of all chatrooms.
+
+        Args:
+            query: The query. It is made of words, `"quoted phrases"` and
+                `prefixes*`, all of which need to match.
+            chatroom: Only match messages of this chatroom, or chatroom uid.
+            channel: Only match messages of this channel, or channel uid.
+            user: Only match messages sent by this username.
+            start: Only match messages sent at or after this time.
+            end: Only match messages sent at or before this time.
+            limit: The maximum amount of hits returned.
+
+        Returns:
+            The matching messages, newest first.
+
+        Raises:
+            RuntimeError: `enable_search` was not called.
+        """
+
+        if self.search_index is None:
+            raise RuntimeError("Search is not enabled, call enable_search first.")
+
+        if isinstance(chatroom, Chatroom):
+            chatroom = chatroom.uid
+
+        if isinstance(channel, Channel):
+            channel = channel.uid
+
+        return self.search_index.search(query, chatroom, channel, user, start, end, limit)
+
     def subscribe_all(self, event: Event, callback: EventCallback) -> None:
         """Subscribes callback to event in all (current & future) Chatrooms.
 
@@ -1057,3 +2929,21 @@ class Teacup:
             chatroom.subscribe(event, callback)
 
         self._global_listeners[event] = callback
+
+    def subscribe_batch_all(
+        self,
+        event: Event,
+        callback: BatchCallback,
+        max_batch: int = 100,
+        max_delay: float = 0.0,
+    ) -> None:
+        """Subscribes callback to batches of event in all (current & future) Chatrooms.
+
+        Each chatroom delivers its own batches. See `Chatroom.subscribe_batch`
+        for the arguments.
+        """
+
+        for chatroom in self.chatrooms:
+            chatroom.subscribe_batch(event, callback, max_batch, max_delay)
+
+        self._global_batch_listeners[event] = (callback, max_batch, max_delay)
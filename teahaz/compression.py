@@ -0,0 +1,78 @@
+"""The module containing the codecs used to compress request bodies.
+
+`gzip` is always available. `zstd` is used when the optional `zstandard`
+package is installed.
+"""
+
+from __future__ import annotations
+
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = [
+    "available_codecs",
+    "accept_encoding",
+    "compress",
+    "decompress",
+]
+
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def available_codecs() -> list[str]:
+    """Returns the names of all usable codecs, preferred first."""
+
+    if zstandard is not None:
+        return ["zstd", "gzip"]
+
+    return ["gzip"]
+
+
+def accept_encoding() -> str:
+    """Returns the `Accept-Encoding` header value matching `available_codecs`."""
+
+    return ", ".join(available_codecs() + ["deflate"])
+
+
+def compress(data: bytes, codec: str, level: int | None = None) -> bytes:
+    """Compresses data.
+
+    Args:
+        data: The bytes to compress.
+        codec: One of `available_codecs()`.
+        level: The compression level. Defaults to the codec's usual level.
+
+    Raises:
+        ValueError: The codec is not available.
+    """
+
+    if codec not in available_codecs():
+        raise ValueError(f"Compression codec {codec!r} is not available.")
+
+    level = DEFAULT_LEVELS[codec] if level is None else level
+
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+
+    # Compressor instances are not thread-safe, so they are not reused
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompresses data created by `compress`.
+
+    Raises:
+        ValueError: The codec is not available.
+    """
+
+    if codec not in available_codecs():
+        raise ValueError(f"Compression codec {codec!r} is not available.")
+
+    if codec == "gzip":
+        return gzip.decompress(data)
+
+    return zstandard.ZstdDecompressor().decompress(data)
@@ -0,0 +1,193 @@
+"""The module containing the end-to-end encryption used by `Chatroom`.
+
+Messages are encrypted with AES-256-GCM, using a key derived from a secret
+shared by the members of a chatroom. Key derivation is deliberately slow, so
+derived keys are cached per secret & chatroom, and each chatroom keeps a
+single `RoomCipher` instance around for its lifetime.
+"""
+
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+__all__ = [
+    "derive_key",
+    "RoomCipher",
+]
+
+MARKER = b"\x00TH1"
+"""The prefix of every encrypted payload, used to tell them apart from plain ones."""
+
+NONCE_SIZE = 12
+
+WORKER_BYTES = 512 * 1024
+"""The least bytes worth handing to a worker of the decryption pool.
+
+Batches smaller than twice this are decrypted on the calling thread, as the
+cost of dispatching them outweighs decrypting them.
+"""
+
+WORKERS = min(
+    8,
+    len(os.sched_getaffinity(0))
+    if hasattr(os, "sched_getaffinity")
+    else os.cpu_count() or 1,
+)
+"""The size of the decryption pool. With a single worker no pool is used.
+
+AES-GCM releases the GIL, so the workers are threads, limited to the CPUs
+the process can run on.
+"""
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Returns the shared decryption pool, creating it on first use."""
+
+    global _executor  # pylint: disable=global-statement
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=WORKERS, thread_name_prefix="teahaz-crypto"
+        )
+
+    return _executor
+
+
+@lru_cache(maxsize=256)
+def derive_key(secret: bytes, salt: bytes) -> bytes:
+    """Derives a 256-bit key from secret, caching the result.
+
+    Args:
+        secret: The secret shared by the chatroom's members.
+        salt: The salt to use. Chatrooms use their uid.
+
+    Returns:
+        The derived key.
+    """
+
+    return Scrypt(salt=salt, length=32, n=2**14, r=8, p=1).derive(secret)
+
+
+class RoomCipher:
+    """The authenticated cipher of a single chatroom.
+
+    The underlying `AESGCM` context is created once and reused for every
+    message. The chatroom's uid is bound to each ciphertext as associated
+    data, so payloads cannot be replayed into another chatroom.
+    """
+
+    def __init__(self, key: bytes, associated_data: bytes | None = None) -> None:
+        """Initializes the cipher.
+
+        Args:
+            key: A 256-bit key, usually from `derive_key`.
+            associated_data: Data authenticated (but not encrypted) along
+                every message.
+        """
+
+        self.associated_data = associated_data
+        self._aead = AESGCM(key)
+
+    @classmethod
+    def from_secret(cls, secret: str | bytes, chatroom_id: str) -> RoomCipher:
+        """Creates a cipher for a chatroom from its shared secret.
+
+        Args:
+            secret: The secret shared by the chatroom's members.
+            chatroom_id: The uid of the chatroom.
+        """
+
+        if isinstance(secret, str):
+            secret = secret.encode("utf-8")
+
+        salt = f"teahaz:{chatroom_id}".encode("utf-8")
+        return cls(derive_key(secret, salt), chatroom_id.encode("utf-8"))
+
+    @staticmethod
+    def is_encrypted(payload: bytes) -> bool:
+        """Determines whether payload was created by `RoomCipher.encrypt`."""
+
+        return payload.startswith(MARKER)
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        """Encrypts plaintext using a fresh random nonce.
+
+        Returns:
+            The marker, nonce & ciphertext, concatenated.
+        """
+
+        nonce = os.urandom(NONCE_SIZE)
+        return MARKER + nonce + self._aead.encrypt(nonce, plaintext, self.associated_data)
+
+    def decrypt(self, payload: bytes) -> bytes:
+        """Decrypts a payload created by `RoomCipher.encrypt`.
+
+        Payloads without the marker are returned unchanged, so messages sent
+        before encryption was enabled can still be read.
+
+        Raises:
+            cryptography.exceptions.InvalidTag: The payload was tampered with,
+                or encrypted using a different key.
+        """
+
+        if not self.is_encrypted(payload):
+            return payload
+
+        start = len(MARKER)
+        nonce = payload[start : start + NONCE_SIZE]
+
+        return self._aead.decrypt(
+            nonce, payload[start + NONCE_SIZE :], self.associated_data
+        )
+
+    def decrypt_many(self, payloads: Iterable[bytes]) -> list[bytes | None]:
+        """Decrypts a batch of payloads, in order.
+
+        Large batches are split into one slice per worker of a shared thread
+        pool, each slice holding at least `WORKER_BYTES`, as per-task overhead
+        easily outweighs the cost of decrypting a single message. The calling
+        thread decrypts the first slice itself.
+
+        Returns:
+            The decrypted payloads. Payloads `RoomCipher.decrypt` rejects are
+            returned as None, so a single bad payload doesn't fail the batch.
+        """
+
+        payloads = list(payloads)
+        parts = min(WORKERS, len(payloads), sum(map(len, payloads)) // WORKER_BYTES)
+
+        def _decrypt_part(part: list[bytes]) -> list[bytes | None]:
+            decrypted: list[bytes | None] = []
+
+            for payload in part:
+                try:
+                    decrypted.append(self.decrypt(payload))
+                except InvalidTag:
+                    decrypted.append(None)
+
+            return decrypted
+
+        if parts < 2:
+            return _decrypt_part(payloads)
+
+        slices = [payloads[index::parts] for index in range(parts)]
+        futures = [_get_executor().submit(_decrypt_part, part) for part in slices[1:]]
+
+        decrypted = [_decrypt_part(slices[0])]
+        decrypted.extend(future.result() for future in futures)
+
+        # Undo the interleaving of the slices
+        output: list[bytes | None] = [None] * len(payloads)
+        for index, part in enumerate(decrypted):
+            output[index::parts] = part
+
+        return output
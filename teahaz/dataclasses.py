@@ -2,13 +2,19 @@
 
 from __future__ import annotations
 
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from dataclasses import dataclass, field
 
+from .messagelog import MessageLog
+
+if TYPE_CHECKING:
+    from .blobs import BlobHandle
+
 __all__ = [
     "User",
     "Invite",
     "Channel",
+    "ChannelDelta",
     "Message",
     "SystemEvent",
 ]
@@ -37,8 +43,12 @@ class Message:
 
     The content & type of the data field depends on the message type:
     - text: `str`
-    - file: `bytes`
+    - file: `bytes`, or a `teahaz.blobs.BlobHandle` when the chatroom has a
+        blob store
     - system & system-silent: `SystemEvent`
+
+    Text & file messages that couldn't be decrypted keep the base64 data they
+    were received with, and have `is_decrypted` unset.
     """
 
     uid: str
@@ -50,7 +60,7 @@ class Message:
     message_type: str
     """Type of the message. See above for more info."""
 
-    data: str | bytes | SystemEvent
+    data: str | bytes | SystemEvent | BlobHandle
     """The data contained within the message."""
 
     channel_id: str | None
@@ -64,6 +74,10 @@ class Message:
     """Whether the message has been delivered. Set false for return value of
     Event.MSG_SENT."""
 
+    is_decrypted: bool = True
+    """Whether the data could be decrypted, see above. Messages encrypted using
+    a different secret than the chatroom's cannot be."""
+
     @classmethod
     def from_dict(cls, data: dict[str, Any]) -> Message:
         """Creates a Message from server-data."""
@@ -83,6 +97,7 @@ class Message:
             # Only none-system
             channel_id=data.get("channelID"),
             username=data.get("username"),
+            is_decrypted=data.get("is_decrypted", True),
         )
 
 
@@ -99,8 +114,18 @@ class Channel:
     permissions: dict[str, bool]
     """A dictionary of permissions the current user has in this channel. WIP."""
 
-    messages: list[Message] = field(default_factory=list)
-    """All stored messages within this channel."""
+    messages: MessageLog = field(default_factory=MessageLog, compare=False)
+    """All stored messages within this channel. Not used in comparisons.
+
+    Lists assigned to it are converted into a `teahaz.messagelog.MessageLog`."""
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        """Sets an attribute, converting assigned message lists."""
+
+        if name == "messages" and not isinstance(value, MessageLog):
+            value = MessageLog(value)
+
+        super().__setattr__(name, value)
 
     @classmethod
     def from_dict(cls, data: dict[str, Any]) -> Channel:
@@ -113,6 +138,20 @@ class Channel:
         )
 
 
+@dataclass
+class ChannelDelta:
+    """The changes caused by updating a chatroom's channels."""
+
+    added: list[Channel] = field(default_factory=list)
+    """Channels that were not known before."""
+
+    removed: list[Channel] = field(default_factory=list)
+    """Channels that are no longer available."""
+
+    renamed: list[tuple[Channel, str]] = field(default_factory=list)
+    """Pairs of renamed channels and their previous names."""
+
+
 @dataclass
 class User:
     """A dataclass to store user information."""
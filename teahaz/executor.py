@@ -0,0 +1,179 @@
+"""The module containing the shared thread pool behind `threaded`."""
+
+from __future__ import annotations
+
+import traceback
+from collections import deque
+from threading import Lock
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+__all__ = [
+    "threaded",
+    "get_executor",
+    "set_max_workers",
+]
+
+DEFAULT_MAX_WORKERS = 16
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the shared executor used by `threaded`, creating it on first use."""
+
+    global _executor  # pylint: disable=global-statement
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="teahaz"
+            )
+
+        return _executor
+
+
+def set_max_workers(max_workers: int) -> None:
+    """Replaces the shared executor with one of the given size.
+
+    Calls already submitted to the previous executor still finish.
+
+    Args:
+        max_workers: The maximum amount of threads running calls at once.
+    """
+
+    global _executor  # pylint: disable=global-statement
+
+    with _executor_lock:
+        previous = _executor
+        _executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="teahaz"
+        )
+
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+class _SerialQueues:
+    """Runs jobs sharing a key one after another, in submission order.
+
+    Only one job per key is on the executor at a time; the others wait in
+    a queue, so a busy key never holds more than a single worker.
+    """
+
+    def __init__(self) -> None:
+        """Initializes the queues."""
+
+        self._lock = Lock()
+        self._queues: dict[Hashable, deque[Callable[[], None]]] = {}
+
+    def submit(self, key: Hashable, job: Callable[[], None]) -> None:
+        """Queues job behind all others sharing its key."""
+
+        with self._lock:
+            queue = self._queues.get(key)
+
+            if queue is not None:
+                queue.append(job)
+                return
+
+            self._queues[key] = deque([job])
+
+        get_executor().submit(self._drain, key)
+
+    def _drain(self, key: Hashable) -> None:
+        """Runs the jobs of key until its queue is empty."""
+
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+
+                if not queue:
+                    del self._queues[key]
+                    return
+
+                job = queue.popleft()
+
+            # The key's later jobs wait for this loop, so it has to outlive any job
+            try:
+                job()
+            except Exception as exception:  # pylint: disable=broad-except
+                _print_exception(exception)
+
+
+_serial_queues = _SerialQueues()
+
+
+def _print_exception(exception: Exception) -> None:
+    """The default error handler, printing the traceback like `Thread` does."""
+
+    traceback.print_exception(type(exception), exception, exception.__traceback__)
+
+
+def threaded(
+    target: Callable[..., Any],
+    callback: Callable[..., Any] | None = None,
+    error_handler: Callable[[Exception], Any] | None = _print_exception,
+    serialize: bool | Callable[..., Hashable] = False,
+) -> Callable[..., Future]:
+    """Returns a callable running target on the shared executor.
+
+    Args:
+        target: The callable to thread.
+        callback: The callable that will be called with return value
+            of `target`.
+        error_handler: The callable that will be called with any exception
+            raised by `target` or `callback`. By default the traceback is
+            printed. The exception is also set on the returned future.
+        serialize: Calls sharing a key are run one at a time, in the order
+            they were made. If set to True, the key is the object `target` is
+            bound to, so `threaded(chatroom.send, serialize=True)` keeps sends
+            to each chatroom in order. A callable is called with the arguments
+            of each call to get its key.
+
+    Returns:
+        A function that schedules `target`, and returns a `Future` of its
+        return value. Calls that haven't started yet can be cancelled using
+        `Future.cancel`.
+    """
+
+    def _call_target(future: Future, args: Any, kwargs: Any) -> None:
+        """Calls the target, resolving future."""
+
+        if not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            returned = target(*args, **kwargs)
+            if callback is not None:
+                callback(returned)
+
+        except Exception as exception:  # pylint: disable=broad-except
+            future.set_exception(exception)
+
+            if error_handler is not None:
+                error_handler(exception)
+
+            return
+
+        future.set_result(returned)
+
+    def _schedule(*args: Any, **kwargs: Any) -> Future:
+        """Schedules a call of target."""
+
+        future: Future = Future()
+
+        if serialize is False:
+            get_executor().submit(_call_target, future, args, kwargs)
+            return future
+
+        if serialize is True:
+            key = getattr(target, "__self__", target)
+        else:
+            key = serialize(*args, **kwargs)
+
+        _serial_queues.submit(key, lambda: _call_target(future, args, kwargs))
+        return future
+
+    return _schedule
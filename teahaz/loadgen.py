@@ -0,0 +1,415 @@
+"""The module containing the load generator used to size Teahaz servers.
+
+A `LoadGenerator` provisions chatrooms through a `Teacup`: the first user of
+every room creates it, and the others join through invites. Every user then
+polls its chatroom, and sends messages at a fixed rate, through the same code
+paths (`Chatroom.send` & the event loop) an application would use.
+
+The report includes the throughput of sent & delivered messages, as well as
+the end-to-end latency of messages, measured from calling `Chatroom.send` to
+the echo of the message arriving in the sender's `Event.MSG_NEW`.
+
+It is usually run from the command line:
+
+```
+python -m teahaz.loadgen --rooms 4 --users 5 --send-rate 20 --duration 30
+```
+
+Without `--url`, a local `teahaz.standin.StandInServer` is started and used,
+and the requests it received are included in the report.
+"""
+
+from __future__ import annotations
+
+import sys
+import string
+import random
+import secrets
+import argparse
+from threading import Event as ThreadingEvent, Lock, Thread
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+from typing import Any
+
+from .client import Chatroom, Event, Teacup
+from .dataclasses import Message
+
+__all__ = [
+    "LoadGenerator",
+    "LoadReport",
+]
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+
+    if not values:
+        return float("nan")
+
+    rank = max(1, round(percent / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+@dataclass
+class LoadReport:  # pylint: disable=too-many-instance-attributes
+    """The results of a `LoadGenerator` run."""
+
+    rooms: int
+    users: int
+    duration: float
+    """The seconds messages were sent for."""
+
+    sent: int = 0
+    """The count of messages sent successfully."""
+
+    delivered: int = 0
+    """The count of `Event.MSG_NEW` events, in all chatrooms."""
+
+    lost: int = 0
+    """The count of sent messages whose echo never arrived."""
+
+    errors: int = 0
+    """The count of failed requests."""
+
+    latencies: list[float] = field(default_factory=list)
+    """The seconds from sending each message to its echo, sorted."""
+
+    requests: dict[str, int] = field(default_factory=dict)
+    """The requests handled by the stand-in server by endpoint, if it was used."""
+
+    def percentile(self, percent: float) -> float:
+        """Returns a percentile of the latencies, in seconds."""
+
+        return _percentile(self.latencies, percent)
+
+    def format(self) -> str:
+        """Returns the report as human-readable text."""
+
+        def _rate(count: int) -> str:
+            return f"{count:>8} ({count / self.duration:.1f}/s)"
+
+        latencies = ", ".join(
+            f"p{percent:g} {self.percentile(percent) * 1000:.1f} ms"
+            for percent in (50, 90, 99, 100)
+        )
+
+        lines = [
+            f"rooms: {self.rooms}, users per room: {self.users},"
+            f" duration: {self.duration:.1f}s",
+            f"sent:      {_rate(self.sent)}",
+            f"delivered: {_rate(self.delivered)}",
+            f"latency:   {latencies}",
+            f"lost: {self.lost}, errors: {self.errors}",
+        ]
+
+        for endpoint, count in sorted(self.requests.items()):
+            lines.append(f"{endpoint + ':':<16}{_rate(count)}")
+
+        return "\n".join(lines)
+
+
+class LoadGenerator:  # pylint: disable=too-many-instance-attributes
+    """Provisions chatrooms and users on a server, and drives traffic through them."""
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        rooms: int = 1,
+        users: int = 2,
+        send_rate: float = 10.0,
+        poll_interval: float = 1.0,
+        message_size: int = 32,
+        share_polling: bool = False,
+    ) -> None:
+        """Initializes the generator.
+
+        Args:
+            url: The server URL:PORT.
+            rooms: The amount of chatrooms created.
+            users: The amount of users in each chatroom, including its owner.
+            send_rate: The total messages sent per second, spread evenly
+                between all users.
+            poll_interval: The `Chatroom.interval` of every chatroom.
+            message_size: The characters in each message.
+            share_polling: Whether users in the same room share a poller,
+                see `Teacup.share_polling`.
+        """
+
+        if rooms < 1 or users < 1:
+            raise ValueError("There must be at least one room and user.")
+
+        self.url = url
+        self.rooms = rooms
+        self.users = users
+        self.send_rate = send_rate
+        self.poll_interval = poll_interval
+        self.message_size = message_size
+
+        self.teacup = Teacup()
+        self.teacup.share_polling(share_polling)
+
+        self.chatrooms: list[Chatroom] = []
+
+        self._lock = Lock()
+        self._sent_at: dict[str, float] = {}
+        self._echoed_at: dict[str, float] = {}
+        self._report = LoadReport(rooms, users, 0.0)
+
+        self.teacup.subscribe_all(Event.ERROR, self._on_error)
+        self.teacup.subscribe_all(Event.NETWORK_EXCEPTION, self._on_error)
+
+    def _on_error(self, *_: Any) -> None:
+        """Counts a failed request."""
+
+        with self._lock:
+            self._report.errors += 1
+
+    def provision(self) -> list[Chatroom]:
+        """Creates the chatrooms, and registers their users through invites.
+
+        Returns:
+            The chatroom of every user.
+
+        Raises:
+            RuntimeError: A chatroom or user could not be created.
+        """
+
+        for index in range(self.rooms):
+            owner = self.teacup.create_chatroom(
+                self.url, f"loadgen-{index}", "user-0", secrets.token_hex(8)
+            )
+            if owner is None:
+                raise RuntimeError(f"Could not create chatroom {index}.")
+
+            self.chatrooms.append(owner)
+
+            if self.users == 1:
+                continue
+
+            invite = owner.create_invite(uses=self.users - 1)
+            if invite is None:
+                raise RuntimeError(f"Could not create an invite to chatroom {index}.")
+
+            for user in range(1, self.users):
+                chatroom = self.teacup.use_invite(
+                    invite, f"user-{user}", secrets.token_hex(8)
+                )
+                if chatroom is None:
+                    raise RuntimeError(
+                        f"Could not join chatroom {index} as user {user}."
+                    )
+
+                self.chatrooms.append(chatroom)
+
+        return self.chatrooms
+
+    def _record_latency(
+        self, uid: str, sent_at: float | None, echoed_at: float | None
+    ) -> None:
+        """Pairs up the send & echo times of a message, whichever comes last.
+
+        This must be called with the lock held.
+        """
+
+        if sent_at is None:
+            sent_at = self._sent_at.pop(uid, None)
+
+        if echoed_at is None:
+            echoed_at = self._echoed_at.pop(uid, None)
+
+        if sent_at is None or echoed_at is None:
+            if sent_at is not None:
+                self._sent_at[uid] = sent_at
+            if echoed_at is not None:
+                self._echoed_at[uid] = echoed_at
+            return
+
+        self._report.latencies.append(echoed_at - sent_at)
+
+    def _listen(self, chatroom: Chatroom) -> None:
+        """Subscribes to the new messages of chatroom, which starts polling it."""
+
+        def _on_message(message: Message) -> None:
+            """Counts a delivery, and times it if it is the echo of our message."""
+
+            echoed_at = perf_counter()
+
+            with self._lock:
+                self._report.delivered += 1
+
+                # The echo can arrive before `send` returns
+                if message.username == chatroom.username:
+                    self._record_latency(message.uid, None, echoed_at)
+
+        chatroom.interval = self.poll_interval
+        chatroom.subscribe(Event.MSG_NEW, _on_message)
+
+    def _send_loop(
+        self, chatroom: Chatroom, offset: float, stop: ThreadingEvent
+    ) -> None:
+        """Sends messages from chatroom on a fixed schedule until stopped."""
+
+        period = len(self.chatrooms) / self.send_rate
+        due = perf_counter() + offset
+        alphabet = string.ascii_letters + string.digits
+
+        while not stop.wait(max(0.0, due - perf_counter())):
+            # The schedule is kept, so slow sends don't lower the offered load
+            due += period
+
+            content = "".join(random.choices(alphabet, k=self.message_size))
+            sent_at = perf_counter()
+            message = chatroom.send(content)
+
+            if message is None:
+                continue
+
+            with self._lock:
+                self._report.sent += 1
+                self._record_latency(message.uid, sent_at, None)
+
+    def run(self, duration: float, settle: float | None = None) -> LoadReport:
+        """Polls all chatrooms, and sends messages for duration seconds.
+
+        Chatrooms are provisioned first, unless `provision` was called already.
+
+        Args:
+            duration: The seconds to send messages for.
+            settle: The seconds to wait for outstanding echoes after sending
+                stopped. Defaults to two poll intervals.
+
+        Returns:
+            The report of the run.
+        """
+
+        if not self.chatrooms:
+            self.provision()
+
+        for chatroom in self.chatrooms:
+            self._listen(chatroom)
+
+        stop = ThreadingEvent()
+        senders = []
+
+        if self.send_rate > 0:
+            period = len(self.chatrooms) / self.send_rate
+            for index, chatroom in enumerate(self.chatrooms):
+                offset = period * index / len(self.chatrooms)
+                senders.append(
+                    Thread(
+                        target=self._send_loop,
+                        args=(chatroom, offset, stop),
+                        name=f"LoadGenerator-{index}",
+                        daemon=True,
+                    )
+                )
+
+        started = perf_counter()
+        for sender in senders:
+            sender.start()
+
+        stop.wait(duration)
+        stop.set()
+
+        for sender in senders:
+            sender.join()
+
+        elapsed = perf_counter() - started
+
+        sleep(2 * self.poll_interval if settle is None else settle)
+        self.teacup.stop(timeout=self.poll_interval + 5)
+
+        with self._lock:
+            report = self._report
+            report.duration = elapsed
+            report.lost = len(self._sent_at)
+            report.latencies.sort()
+
+        return report
+
+
+def main(argv: list[str]) -> None:
+    """Runs a load test, and prints its report."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m teahaz.loadgen",
+        description="Generate load on a Teahaz server, and report its throughput"
+        + " & latency.",
+    )
+    parser.add_argument(
+        "--url", help="the server URL:PORT; a local stand-in server is used if not set"
+    )
+    parser.add_argument("--rooms", type=int, default=1, help="chatrooms to create")
+    parser.add_argument("--users", type=int, default=2, help="users in each chatroom")
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="seconds to send messages for"
+    )
+    parser.add_argument(
+        "--send-rate", type=float, default=10.0, help="total messages sent per second"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=1.0, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--message-size", type=int, default=32, help="characters in each message"
+    )
+    parser.add_argument(
+        "--share-polling",
+        action="store_true",
+        help="share one poller between the users of a chatroom",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the stand-in server holds back every response",
+    )
+    args = parser.parse_args(argv)
+
+    # pylint: disable-next=import-outside-toplevel
+    from .standin import StandInServer
+
+    server = None
+    url = args.url
+
+    if url is None:
+        server = StandInServer(latency=args.latency)
+        server.start()
+        url = server.url
+
+    generator = LoadGenerator(
+        url,
+        args.rooms,
+        args.users,
+        args.send_rate,
+        args.poll_interval,
+        args.message_size,
+        args.share_polling,
+    )
+
+    try:
+        print(f"Provisioning {args.rooms} rooms of {args.users} users at {url}...")
+        generator.provision()
+
+        # Only requests made while generating load are reported
+        provisioned = dict(server.requests) if server is not None else {}
+
+        print(f"Generating load for {args.duration:g}s...")
+        report = generator.run(args.duration)
+
+    finally:
+        if server is not None:
+            server.stop()
+
+    if server is not None:
+        report.requests = {
+            f"{method} {endpoint}": count - provisioned.get((method, endpoint), 0)
+            for (method, endpoint), count in server.requests.items()
+            if count > provisioned.get((method, endpoint), 0)
+        }
+
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,267 @@
+"""The module containing the copy-on-write message sequence used for chat history.
+
+A `MessageLog` stores messages in immutable chunks: sealed chunks of (at most)
+`CHUNK_SIZE` messages, and a short tail that new messages are appended to.
+Every write replaces the tail with a new one, and publishes the result with a
+single attribute assignment. Sealed chunks are appended to a list shared by
+all states, in place; each state records how many of them it holds, so it
+never sees chunks sealed after it.
+
+Readers therefore never need a lock: `MessageLog.snapshot` returns a consistent,
+immutable `MessageView` in O(1), and iterating a log never sees messages added
+during the iteration. Writers are serialized by a lock, which readers never
+take, so they can't block the poll loop.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from itertools import chain, islice
+from threading import Lock
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Collection, Iterable, Iterator, NamedTuple, overload
+
+if TYPE_CHECKING:
+    from .dataclasses import Message
+
+__all__ = [
+    "MessageLog",
+    "MessageView",
+]
+
+CHUNK_SIZE = 256
+"""The amount of messages in a sealed chunk. Appends copy at most this many
+references."""
+
+
+class _State(NamedTuple):
+    """The content of a log at one point in time.
+
+    The lists of sealed chunks are only ever appended to, and only by the
+    newest state using them, so older states stay unchanged as long as they
+    only read their first `count` chunks.
+    """
+
+    chunks: list[tuple[Message, ...]]
+    """The sealed chunks, oldest first. Chunks past `count` are not ours."""
+
+    starts: list[int]
+    """The index of the first message of each sealed chunk."""
+
+    count: int
+    """The count of sealed chunks in this state."""
+
+    sealed: int
+    """The count of messages in sealed chunks."""
+
+    tail: tuple[Message, ...]
+    """The messages appended after the last sealed chunk."""
+
+    @property
+    def size(self) -> int:
+        """The count of messages."""
+
+        return self.sealed + len(self.tail)
+
+
+def _chunked(messages: tuple[Message, ...]) -> list[tuple[Message, ...]]:
+    """Splits messages into chunks of CHUNK_SIZE."""
+
+    return [
+        messages[start : start + CHUNK_SIZE]
+        for start in range(0, len(messages), CHUNK_SIZE)
+    ]
+
+
+def _sealed(
+    state: _State, chunks: list[tuple[Message, ...]], tail: tuple[Message, ...]
+) -> _State:
+    """Returns state with chunks sealed after its existing ones, and a new tail.
+
+    The chunks are appended to the lists of state in place, so state must be
+    the newest state using them.
+    """
+
+    sealed = state.sealed
+
+    for chunk in chunks:
+        state.starts.append(sealed)
+        state.chunks.append(chunk)
+        sealed += len(chunk)
+
+    return _State(state.chunks, state.starts, state.count + len(chunks), sealed, tail)
+
+
+def _built(messages: tuple[Message, ...]) -> _State:
+    """Returns a new state holding messages, with lists of its own."""
+
+    chunks = _chunked(messages)
+    tail = chunks.pop() if chunks and len(chunks[-1]) < CHUNK_SIZE else ()
+
+    return _sealed(_State([], [], 0, 0, ()), chunks, tail)
+
+
+class MessageView(Sequence):
+    """An immutable view of a `MessageLog` at one point in time."""
+
+    __slots__ = ("_state",)
+
+    def __init__(self, state: _State) -> None:
+        """Initializes the view."""
+
+        self._state = state
+
+    def __len__(self) -> int:
+        """Returns the count of messages."""
+
+        return self._state.size
+
+    def __iter__(self) -> Iterator[Message]:
+        """Iterates over the messages, oldest first."""
+
+        state = self._state
+        return chain(
+            chain.from_iterable(islice(state.chunks, state.count)), state.tail
+        )
+
+    @overload
+    def __getitem__(self, index: int) -> Message:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Message]:
+        ...
+
+    def __getitem__(self, index: int | slice) -> Message | list[Message]:
+        """Gets a message by index, or a list of messages by slice."""
+
+        state = self._state
+
+        if isinstance(index, slice):
+            # Slices of a log must come from a single state
+            view = MessageView(state)
+            start, stop, step = index.indices(state.size)
+
+            if step == 1:
+                return list(islice(view, start, max(start, stop)))
+
+            return [view[position] for position in range(start, stop, step)]
+
+        if index < 0:
+            index += state.size
+
+        if not 0 <= index < state.size:
+            raise IndexError("MessageLog index out of range")
+
+        if index >= state.sealed:
+            return state.tail[index - state.sealed]
+
+        chunk = bisect_right(state.starts, index, 0, state.count) - 1
+        return state.chunks[chunk][index - state.starts[chunk]]
+
+    def __repr__(self) -> str:
+        """Returns a short description of the view."""
+
+        return f"<{type(self).__name__} of {len(self)} messages>"
+
+
+class MessageLog(MessageView):
+    """A thread-safe, append-mostly sequence of messages with O(1) snapshots.
+
+    Every read of the log itself uses the state at the time of the call, so
+    for several consistent reads, take a `snapshot` first.
+    """
+
+    __slots__ = ("_lock",)
+
+    def __init__(self, messages: Iterable[Message] = ()) -> None:
+        """Initializes the log.
+
+        Args:
+            messages: The initial messages, oldest first.
+        """
+
+        super().__init__(_built(()))
+        self._lock = Lock()
+
+        self.extend(messages)
+
+    def __getstate__(self) -> tuple[Message, ...]:
+        """Returns the messages, for pickling."""
+
+        return tuple(self)
+
+    def __setstate__(self, messages: tuple[Message, ...]) -> None:
+        """Restores a pickled log."""
+
+        self.__init__(messages)  # type: ignore # pylint: disable=unnecessary-dunder-call
+
+    def snapshot(self) -> MessageView:
+        """Returns an immutable view of the current messages, in O(1)."""
+
+        return MessageView(self._state)
+
+    def append(self, message: Message) -> None:
+        """Adds a message to the end of the log."""
+
+        with self._lock:
+            state = self._state
+            tail = state.tail + (message,)
+
+            if len(tail) < CHUNK_SIZE:
+                self._state = state._replace(tail=tail)
+            else:
+                self._state = _sealed(state, [tail], ())
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        """Adds messages to the end of the log."""
+
+        messages = tuple(messages)
+        if not messages:
+            return
+
+        with self._lock:
+            state = self._state
+            chunks = _chunked(state.tail + messages)
+
+            tail = chunks.pop() if len(chunks[-1]) < CHUNK_SIZE else ()
+            self._state = _sealed(state, chunks, tail)
+
+    def prepend(self, messages: Iterable[Message]) -> None:
+        """Adds messages to the start of the log, such as older history."""
+
+        messages = tuple(messages)
+        if not messages:
+            return
+
+        with self._lock:
+            state = self._state
+            chunks = _chunked(messages) + state.chunks[: state.count]
+            self._state = _sealed(_State([], [], 0, 0, ()), chunks, state.tail)
+
+    def discard(self, uids: Collection[str]) -> int:
+        """Removes the messages with the given uids, such as ones moved elsewhere.
+
+        Returns:
+            The count of messages removed.
+        """
+
+        if not uids:
+            return 0
+
+        with self._lock:
+            state = self._state
+            kept = tuple(
+                message for message in MessageView(state) if message.uid not in uids
+            )
+
+            if len(kept) != state.size:
+                self._state = _built(kept)
+
+        return state.size - len(kept)
+
+    def clear(self) -> None:
+        """Removes all messages."""
+
+        with self._lock:
+            self._state = _built(())
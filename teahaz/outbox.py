@@ -0,0 +1,383 @@
+"""The module containing the rate-limited outgoing message queue of a `Chatroom`."""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import Future
+from threading import Thread, Condition, Lock, current_thread
+from time import monotonic
+from typing import TYPE_CHECKING, Union
+
+from .dataclasses import Channel, Message
+
+if TYPE_CHECKING:
+    from .client import Chatroom
+
+__all__ = [
+    "TokenBucket",
+    "Outbox",
+]
+
+
+class TokenBucket:
+    """A token bucket rate limiter that adapts to server errors.
+
+    Each failure halves the refill rate (down to `min_rate`), while each
+    success increases it additively back towards the configured maximum.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.2) -> None:
+        """Initializes the bucket.
+
+        Args:
+            rate: The maximum refill rate, in tokens per second.
+            burst: The capacity of the bucket.
+            min_rate: The rate will never be reduced below this.
+        """
+
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def _refill(self) -> None:
+        """Adds the tokens accumulated since the last refill. Lock must be held."""
+
+        now = monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token, returning how many seconds to wait before using it."""
+
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens / self.rate
+
+    def penalize(self) -> None:
+        """Halves the rate after a failed request."""
+
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self) -> None:
+        """Increases the rate after a successful request."""
+
+        with self._lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+@dataclass
+class _Outgoing:
+    """A queued message waiting to be sent."""
+
+    content: Union[str, bytes]
+    channel: Channel
+    reply_id: str | None
+    futures: list[Future] = field(default_factory=list)
+
+
+class Outbox:
+    """A per-chatroom queue of outgoing messages, sent by a worker thread.
+
+    Messages are routed to the channel they were queued for, sent at a rate
+    limited by a `TokenBucket`, and their futures resolve to the `Message`
+    returned by the server.
+
+    Messages have no client-side id the server could deduplicate them by, so
+    sends are only retried when they were certainly not stored: when the
+    server refused them as overloaded (429 or 503), or when the connection
+    could not be made. Overload & connection failures reduce the rate, and
+    retries back off further; other failures fail the message right away.
+
+    When `coalesce_limit` is set, consecutive texts waiting to be sent to the
+    same channel (and not replying to anything) are joined with newlines into
+    a single message of at most that length. All of their futures resolve to
+    the joined message.
+    """
+
+    def __init__(
+        self,
+        chatroom: Chatroom,
+        rate: float = 5.0,
+        burst: int = 10,
+        coalesce_limit: int = 0,
+        retries: int = 3,
+    ) -> None:
+        """Initializes the outbox & starts its worker.
+
+        Args:
+            chatroom: The chatroom to send messages with.
+            rate: The maximum sustained messages sent per second.
+            burst: The maximum amount of messages sent at once.
+            coalesce_limit: The maximum length of coalesced messages. 0 disables
+                coalescing.
+            retries: How many times a message failing in a retriable way is
+                retried before it fails.
+        """
+
+        self.chatroom = chatroom
+        self.bucket = TokenBucket(rate, burst)
+        self.coalesce_limit = coalesce_limit
+        self.retries = retries
+
+        self._queue: deque[_Outgoing] = deque()
+        self._condition = Condition()
+        self._in_flight = 0
+        self._is_stopped = False
+        self._generation = 0
+
+        self._thread = self._new_thread()
+        self._thread.start()
+
+    def _new_thread(self) -> Thread:
+        """Creates a worker thread."""
+
+        return Thread(
+            target=self._work,
+            args=(self._generation,),
+            name=f'Outbox(uid="{self.chatroom.uid}")',
+            daemon=True,
+        )
+
+    def __len__(self) -> int:
+        """Returns the count of messages waiting to be sent."""
+
+        return len(self._queue)
+
+    def _can_coalesce(self, item: _Outgoing, following: _Outgoing) -> bool:
+        """Determines whether following can be joined into item."""
+
+        return (
+            isinstance(item.content, str)
+            and isinstance(following.content, str)
+            and item.reply_id is None
+            and following.reply_id is None
+            and item.channel.uid == following.channel.uid
+            and len(item.content) + len(following.content) + 1 <= self.coalesce_limit
+        )
+
+    def _take(self, generation: int) -> _Outgoing | None:
+        """Takes the next item to send, waiting for one if needed.
+
+        Args:
+            generation: The generation of the calling worker.
+
+        Returns:
+            The next item, or None if the outbox was stopped, or the worker
+            was replaced by `start`.
+        """
+
+        with self._condition:
+            while not self._queue and not self._is_stopped:
+                if generation != self._generation:
+                    return None
+
+                self._condition.wait()
+
+            if not self._queue or generation != self._generation:
+                return None
+
+            item = self._queue.popleft()
+
+            # Replies are never joined, as their neighbours would become replies too
+            if self.coalesce_limit > 0 and item.reply_id is None:
+                joined = _Outgoing(
+                    item.content, item.channel, item.reply_id, item.futures[:]
+                )
+
+                while self._queue and self._can_coalesce(joined, self._queue[0]):
+                    following = self._queue.popleft()
+                    joined.content = f"{joined.content}\n{following.content}"
+                    joined.futures.extend(following.futures)
+
+                item = joined
+
+            self._in_flight += 1
+            return item
+
+    def _wait(self, delay: float) -> None:
+        """Waits for delay seconds, or until the outbox is stopped."""
+
+        if delay > 0:
+            with self._condition:
+                self._condition.wait_for(lambda: self._is_stopped, timeout=delay)
+
+    def _send(self, item: _Outgoing) -> Message | None:
+        """Sends an item, retrying failures that certainly didn't store it.
+
+        Returns:
+            The sent message, or None if sending failed but the error was
+            captured by the chatroom's handlers.
+
+        Raises:
+            Exception: Sending failed, and the chatroom had no handler for it.
+        """
+
+        # pylint: disable=protected-access
+        chatroom = self.chatroom
+        req_args = chatroom._post_args(item.content, item.channel, item.reply_id)
+
+        for attempt in range(self.retries + 1):
+            delay = self.bucket.reserve()
+
+            # Retries wait for at least one token at the reduced rate
+            if attempt > 0:
+                delay = max(delay, 1 / self.bucket.rate)
+
+            self._wait(delay)
+            is_last = attempt == self.retries or self._is_stopped
+
+            sent_at = monotonic()
+            try:
+                response = chatroom._send_request("post", capture=False, **req_args)
+            except Exception as exception:  # pylint: disable=broad-except
+                self.bucket.penalize()
+
+                if is_last or not chatroom.transport.never_sent(exception):
+                    return chatroom._handle_exception(exception, "post", req_args)
+
+                continue
+
+            assert response is not None
+            status = response.status_code
+
+            if status == 200:
+                self.bucket.reward()
+                return chatroom._sent_message(item.content, response.json(), sent_at)
+
+            if status == 429 or status >= 500:
+                self.bucket.penalize()
+
+            # Other errors may have stored the message, or would fail again
+            if status not in (429, 503) or is_last:
+                return chatroom._handle_response(response, "post", req_args)
+
+        return None
+
+    def _work(self, generation: int) -> None:
+        """Sends queued items until stopped.
+
+        Args:
+            generation: The value of `_generation` when the worker was started.
+        """
+
+        while True:
+            item = self._take(generation)
+            if item is None:
+                break
+
+            try:
+                message = self._send(item)
+            except Exception as exception:  # pylint: disable=broad-except
+                for future in item.futures:
+                    future.set_exception(exception)
+            else:
+                for future in item.futures:
+                    future.set_result(message)
+
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def put(
+        self, content: Union[str, bytes], channel: Channel, reply_id: str | None = None
+    ) -> Future:
+        """Queues a message.
+
+        Args:
+            content: Message data.
+            channel: The channel to send the message on.
+            reply_id: The optional id of the messages this one will reply to.
+
+        Returns:
+            A future resolving to the sent `Message`, or None if sending failed
+            but the error was captured.
+
+        Raises:
+            RuntimeError: The outbox was already stopped.
+        """
+
+        future: Future = Future()
+
+        with self._condition:
+            if self._is_stopped:
+                raise RuntimeError("Cannot queue messages on a stopped outbox.")
+
+            self._queue.append(_Outgoing(content, channel, reply_id, [future]))
+            self._condition.notify_all()
+
+        return future
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every queued message has been sent.
+
+        Args:
+            timeout: The maximum seconds to wait for.
+
+        Returns:
+            Whether the outbox was emptied within the timeout.
+        """
+
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and self._in_flight == 0, timeout=timeout
+            )
+
+    def stop(self, drain: bool = False, timeout: float | None = None) -> bool:
+        """Stops the worker, and waits for it to finish.
+
+        Args:
+            drain: If set, queued messages are sent before stopping. Otherwise
+                they are cancelled.
+            timeout: The maximum seconds to wait for, including draining.
+
+        Returns:
+            Whether the worker finished within the timeout.
+        """
+
+        deadline = None if timeout is None else monotonic() + timeout
+
+        if drain:
+            self.flush(timeout)
+
+        with self._condition:
+            self._is_stopped = True
+
+            while self._queue:
+                for future in self._queue.popleft().futures:
+                    future.cancel()
+
+            self._condition.notify_all()
+
+        if self._thread is current_thread():
+            return True
+
+        self._thread.join(None if deadline is None else max(0.0, deadline - monotonic()))
+        return not self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts a fresh worker, if the outbox was stopped."""
+
+        with self._condition:
+            if not self._is_stopped:
+                return
+
+            self._is_stopped = False
+            self._generation += 1
+
+            # A previous worker still sending exits once it sees a newer generation
+            self._thread = self._new_thread()
+            self._thread.start()
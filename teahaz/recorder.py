@@ -0,0 +1,412 @@
+"""The module containing the traffic recorder, and the server replaying its recordings.
+
+A `TrafficRecorder` attached to chatrooms writes every request they send, along
+with its response and timing, into a gzipped JSON-lines file. Secrets (such as
+passwords) are redacted before anything is written.
+
+A `ReplayServer` then serves a recording on a local port, so a client can be
+run against real traffic patterns offline:
+
+```python3
+from teahaz import Teacup
+from teahaz.recorder import ReplayServer
+
+with ReplayServer("traffic.jsonl.gz", speed=4.0) as server:
+    cup = Teacup()
+    chatroom = cup.login(server.url, "<recorded chatroom id>", "user", "<anything>")
+```
+
+The same can be done from the command line, using
+`python -m teahaz.recorder <recording> [--speed N] [--port N]`.
+"""
+
+from __future__ import annotations
+
+import sys
+import json
+import gzip
+import argparse
+from pathlib import Path
+from threading import Lock, Thread
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, perf_counter, sleep
+from typing import TYPE_CHECKING, Any, Iterator
+
+if TYPE_CHECKING:
+    import requests
+
+    from .client import Chatroom
+
+__all__ = [
+    "TrafficRecorder",
+    "ReplayServer",
+    "read_recording",
+]
+
+REDACTED = "<redacted>"
+
+DEFAULT_REDACTED_KEYS = frozenset(
+    {"password", "secret", "token", "authorization", "cookie", "set-cookie"}
+)
+"""Keys whose values are redacted, compared case-insensitively."""
+
+RESPONSE_HEADERS = ["Content-Type", "ETag"]
+"""The response headers kept in recordings."""
+
+
+def _redact(value: Any, keys: frozenset[str]) -> Any:
+    """Returns a copy of value, with the values of all secret keys redacted."""
+
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in keys else _redact(item, keys)
+            for key, item in value.items()
+        }
+
+    if isinstance(value, list):
+        return [_redact(item, keys) for item in value]
+
+    return value
+
+
+def _target(url: str) -> str:
+    """Returns the path & query of url, which is what recordings are matched by."""
+
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+class TrafficRecorder:
+    """Records the requests of chatrooms into a gzipped JSON-lines file.
+
+    Each line describes one request:
+
+    - `t`: Seconds between the start of the recording and the request.
+    - `duration`: Seconds it took to get the response.
+    - `chatroom`: The uid of the chatroom that sent it.
+    - `method`, `target`: The HTTP method, and the path & query of the URL.
+    - `headers`, `params`, `json`: The request's arguments.
+    - `status`, `response_headers`, `body`: The response, or `error` with
+      the exception raised instead.
+    """
+
+    def __init__(
+        self, path: str | Path, redacted_keys: frozenset[str] = DEFAULT_REDACTED_KEYS
+    ) -> None:
+        """Initializes the recorder, creating its file.
+
+        Args:
+            path: The file to write. It is overwritten if it already exists.
+            redacted_keys: Request & response keys whose values are never
+                written, compared case-insensitively.
+        """
+
+        self.path = Path(path)
+        self.redacted_keys = frozenset(key.lower() for key in redacted_keys)
+
+        self._lock = Lock()
+        self._start = perf_counter()
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._chatrooms: list[Chatroom] = []
+
+    def __enter__(self) -> TrafficRecorder:
+        """Returns self."""
+
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        """Closes the recorder."""
+
+        self.close()
+
+    def attach(self, *chatrooms: Chatroom) -> None:
+        """Starts recording the requests of chatrooms."""
+
+        for chatroom in chatrooms:
+            chatroom.recorder = self
+            self._chatrooms.append(chatroom)
+
+    def detach(self, *chatrooms: Chatroom) -> None:
+        """Stops recording the requests of chatrooms."""
+
+        for chatroom in chatrooms:
+            if chatroom.recorder is self:
+                chatroom.recorder = None
+
+            if chatroom in self._chatrooms:
+                self._chatrooms.remove(chatroom)
+
+    def record(  # pylint: disable=too-many-arguments
+        self,
+        chatroom: Chatroom,
+        method_name: str,
+        req_args: dict[str, Any],
+        started: float,
+        response: requests.Response | None = None,
+        error: Exception | None = None,
+    ) -> None:
+        """Records a request. This is called by `Chatroom` for attached chatrooms.
+
+        Args:
+            chatroom: The chatroom that sent the request.
+            method_name: The HTTP method used.
+            req_args: The arguments of the request, before compression.
+            started: The `time.perf_counter()` value when the request was sent.
+            response: The response received.
+            error: The exception raised instead of receiving a response.
+        """
+
+        entry: dict[str, Any] = {
+            "t": round(started - self._start, 6),
+            "duration": round(perf_counter() - started, 6),
+            "chatroom": chatroom.uid,
+            "method": method_name.upper(),
+            "target": _target(req_args["url"]),
+        }
+
+        for key in ["headers", "params", "json"]:
+            value = req_args.get(key)
+            if value is None:
+                continue
+
+            if key != "json":
+                value = dict(value)
+
+            entry[key] = _redact(value, self.redacted_keys)
+
+        if response is not None:
+            entry["status"] = response.status_code
+            entry["response_headers"] = {
+                key: response.headers[key]
+                for key in RESPONSE_HEADERS
+                if key in response.headers
+            }
+
+            try:
+                entry["body"] = _redact(response.json(), self.redacted_keys)
+            except ValueError:
+                entry["text"] = response.text
+
+        if error is not None:
+            entry["error"] = repr(error)
+
+        line = json.dumps(entry, separators=(",", ":"))
+
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def close(self) -> None:
+        """Detaches all chatrooms, and closes the file."""
+
+        self.detach(*list(self._chatrooms))
+
+        with self._lock:
+            self._file.close()
+
+
+def read_recording(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Iterates over the entries of a recording, in the order they were written."""
+
+    with gzip.open(path, "rt", encoding="utf-8") as recording:
+        for line in recording:
+            yield json.loads(line)
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """Answers requests from the recording of its server."""
+
+    server: _ReplayHTTPServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *_: Any) -> None:  # pylint: disable=arguments-differ
+        """Silences the default request logging."""
+
+    def _answer(self) -> None:
+        """Answers a request with the next matching entry."""
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        entry = self.server.replay.next_entry(self.command, self.path)
+
+        if entry is None:
+            self._send(404, {"Content-Type": "application/json"}, b'"not recorded"')
+            return
+
+        if "body" in entry:
+            content = json.dumps(entry["body"]).encode("utf-8")
+        else:
+            content = entry.get("text", "").encode("utf-8")
+
+        self._send(entry.get("status", 502), entry.get("response_headers", {}), content)
+
+    def _send(self, status: int, headers: dict[str, str], content: bytes) -> None:
+        """Sends a response."""
+
+        self.send_response(status)
+
+        for key, value in headers.items():
+            self.send_header(key, value)
+
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _answer
+
+
+class _ReplayHTTPServer(ThreadingHTTPServer):
+    """The HTTP server of a `ReplayServer`."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], replay: ReplayServer) -> None:
+        """Initializes the server."""
+
+        self.replay = replay
+        super().__init__(address, _ReplayHandler)
+
+
+class ReplayServer:
+    """A local stand-in server answering requests from a recording.
+
+    Requests are matched to entries of the recording by method and target
+    (including the chatroom uid), in recorded order. Each entry is held back
+    until its original time (scaled by `speed`) since the server started, and
+    then for its original duration, so clients see the recorded load shape.
+
+    Once the entries of a target run out, GET requests get the last response
+    again, except for lists, which are answered with an empty list (so polls
+    keep working without repeating messages).
+    """
+
+    def __init__(
+        self,
+        recording: str | Path,
+        speed: float = 1.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """Initializes the server, and loads the recording.
+
+        Args:
+            recording: The file written by `TrafficRecorder`.
+            speed: How many times faster than recorded to replay. Use
+                `float("inf")` to answer requests as fast as possible.
+            host: The host to listen on.
+            port: The port to listen on. By default, a free port is chosen.
+        """
+
+        self.speed = speed
+        self._lock = Lock()
+        self._entries: dict[tuple[str, str], deque[dict[str, Any]]] = defaultdict(deque)
+        self._last: dict[tuple[str, str], dict[str, Any]] = {}
+
+        for entry in read_recording(recording):
+            if "error" in entry and "status" not in entry:
+                continue
+
+            self._entries[(entry["method"], entry["target"])].append(entry)
+
+        self._server = _ReplayHTTPServer((host, port), self)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._started = monotonic()
+
+    @property
+    def url(self) -> str:
+        """The URL clients should use, in place of the recorded one."""
+
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> ReplayServer:
+        """Starts the server."""
+
+        self.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        """Stops the server."""
+
+        self.stop()
+
+    def _scaled(self, seconds: float) -> float:
+        """Returns seconds, scaled by speed."""
+
+        return seconds / self.speed
+
+    def next_entry(self, method: str, target: str) -> dict[str, Any] | None:
+        """Pops the next entry for a request, waiting until it is due.
+
+        Returns:
+            The entry to answer with, or None if the target was never recorded.
+        """
+
+        key = (method, target)
+
+        with self._lock:
+            entries = self._entries.get(key)
+            entry = entries.popleft() if entries else None
+
+            if entry is not None:
+                self._last[key] = entry
+
+        if entry is None:
+            last = self._last.get(key)
+            if last is None or method != "GET":
+                return None
+
+            if isinstance(last.get("body"), list):
+                return {**last, "body": []}
+
+            return last
+
+        due = self._started + self._scaled(entry["t"] + entry["duration"])
+        delay = max(self._scaled(entry["duration"]), due - monotonic())
+        sleep(delay)
+
+        return entry
+
+    def start(self) -> None:
+        """Starts serving in a background thread."""
+
+        self._started = monotonic()
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving."""
+
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv: list[str]) -> None:
+    """Serves a recording until interrupted."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m teahaz.recorder",
+        description="Serve a traffic recording from a local stand-in server.",
+    )
+    parser.add_argument("recording", help="a file written by TrafficRecorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    server = ReplayServer(args.recording, args.speed, args.host, args.port)
+    server.start()
+    print(f"Replaying {args.recording} at {server.url} ({args.speed}x)")
+
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
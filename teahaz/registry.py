@@ -0,0 +1,336 @@
+"""The module containing the indexed containers used by `Teacup` & `Chatroom`."""
+
+from __future__ import annotations
+
+from threading import Lock
+from urllib.parse import urlsplit
+from typing import Any, Iterable, Iterator, Tuple, Dict
+
+from .dataclasses import Channel, ChannelDelta
+
+__all__ = [
+    "ChannelIndex",
+    "ChatroomRegistry",
+    "normalize_origin",
+]
+
+_IndexKeys = Tuple[str, str, str]
+_Index = Dict[str, Tuple[Any, ...]]
+
+
+def normalize_origin(url: str) -> str:
+    """Returns the normalized `scheme://host:port` origin of a URL.
+
+    Args:
+        url: The URL to normalize. It may or may not include a path.
+    """
+
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url.lower().rstrip("/")
+
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+def _index_add(index: _Index, key: str, item: Any) -> None:
+    """Adds item to the entry of key inside a multi-valued index."""
+
+    index[key] = index.get(key, ()) + (item,)
+
+
+def _index_remove(index: _Index, key: str, item: Any) -> None:
+    """Removes item from the entry of key inside a multi-valued index."""
+
+    remaining = tuple(value for value in index.get(key, ()) if value is not item)
+
+    if remaining:
+        index[key] = remaining
+    else:
+        index.pop(key, None)
+
+
+class ChatroomRegistry:
+    """A registry of chatrooms with O(1) lookups by uid, name and origin.
+
+    Every index is multi-valued: the same uid can be registered more than once
+    when several accounts are logged into one chatroom. Index entries are
+    immutable tuples, and `snapshot` returns the tuple of all chatrooms in
+    insertion order. Both are replaced on every mutation, so readers never
+    need to copy or lock anything while poll threads change state.
+    """
+
+    def __init__(self) -> None:
+        """Initializes the registry."""
+
+        self._lock = Lock()
+        self._keys: dict[Any, _IndexKeys] = {}
+        self._by_uid: _Index = {}
+        self._by_name: _Index = {}
+        self._by_origin: _Index = {}
+        self._snapshot: tuple[Any, ...] = ()
+
+    def __len__(self) -> int:
+        """Returns the count of registered chatrooms."""
+
+        return len(self._snapshot)
+
+    def __iter__(self) -> Iterator[Any]:
+        """Iterates over a snapshot of the registered chatrooms."""
+
+        return iter(self._snapshot)
+
+    def __contains__(self, chatroom: Any) -> bool:
+        """Determines whether chatroom is registered."""
+
+        return chatroom in self._keys
+
+    def _unindex(self, chatroom: Any) -> None:
+        """Removes chatroom from all indices. Lock must be held."""
+
+        uid, name, origin = self._keys.pop(chatroom)
+
+        _index_remove(self._by_uid, uid, chatroom)
+        _index_remove(self._by_name, name, chatroom)
+        _index_remove(self._by_origin, origin, chatroom)
+
+    def add(self, chatroom: Any) -> None:
+        """Registers a chatroom, or re-indexes it if it is already registered.
+
+        Args:
+            chatroom: The chatroom to add. Its `uid`, `name` and `url` are
+                used as index keys.
+        """
+
+        keys = (str(chatroom.uid), str(chatroom.name), normalize_origin(chatroom.url))
+
+        with self._lock:
+            if chatroom in self._keys:
+                self._unindex(chatroom)
+
+            self._keys[chatroom] = keys
+
+            _index_add(self._by_uid, keys[0], chatroom)
+            _index_add(self._by_name, keys[1], chatroom)
+            _index_add(self._by_origin, keys[2], chatroom)
+
+            self._snapshot = tuple(self._keys)
+
+    def remove(self, chatroom: Any) -> bool:
+        """Unregisters a chatroom.
+
+        Args:
+            chatroom: The chatroom to remove.
+
+        Returns:
+            Whether the chatroom was registered.
+        """
+
+        with self._lock:
+            if chatroom not in self._keys:
+                return False
+
+            self._unindex(chatroom)
+            self._snapshot = tuple(self._keys)
+
+        return True
+
+    def snapshot(self) -> tuple[Any, ...]:
+        """Returns an immutable snapshot of all chatrooms, in insertion order."""
+
+        return self._snapshot
+
+    def get(self, uid: str) -> Any | None:
+        """Gets the first chatroom registered with the given uid.
+
+        Args:
+            uid: The chatroom uid to look up.
+        """
+
+        found = self._by_uid.get(uid)
+        return found[0] if found else None
+
+    def by_uid(self, uid: str) -> tuple[Any, ...]:
+        """Gets all chatrooms registered with the given uid."""
+
+        return self._by_uid.get(uid, ())
+
+    def by_name(self, name: str) -> tuple[Any, ...]:
+        """Gets all chatrooms with the given display name."""
+
+        return self._by_name.get(name, ())
+
+    def by_origin(self, url: str) -> tuple[Any, ...]:
+        """Gets all chatrooms hosted on the origin of the given URL."""
+
+        return self._by_origin.get(normalize_origin(url), ())
+
+
+class ChannelIndex:
+    """The channels of a chatroom, keyed by uid with a secondary name index.
+
+    Iterating yields `Channel` instances in the order they were added, so it
+    can be used anywhere a list of channels was expected. Lookups never
+    compare `Channel` objects, and thus never touch their message lists.
+    """
+
+    def __init__(self, channels: Iterable[Channel] = ()) -> None:
+        """Initializes the index.
+
+        Args:
+            channels: The initial channels.
+        """
+
+        self._by_uid: dict[str, Channel] = {}
+        self._by_name: _Index = {}
+
+        for channel in channels:
+            self.add(channel)
+
+    def __len__(self) -> int:
+        """Returns the count of channels."""
+
+        return len(self._by_uid)
+
+    def __iter__(self) -> Iterator[Channel]:
+        """Iterates over a snapshot of the channels."""
+
+        return iter(tuple(self._by_uid.values()))
+
+    def __contains__(self, channel: Channel | str) -> bool:
+        """Determines whether a channel (or uid) is indexed."""
+
+        if isinstance(channel, Channel):
+            channel = channel.uid
+
+        return channel in self._by_uid
+
+    def __getitem__(self, index: int) -> Channel:
+        """Gets a channel by its position, for compatibility with lists."""
+
+        return tuple(self._by_uid.values())[index]
+
+    def __repr__(self) -> str:
+        """Returns the names of all channels."""
+
+        return f"ChannelIndex({[channel.name for channel in self]})"
+
+    def get(self, uid: str) -> Channel | None:
+        """Gets a channel by its uid.
+
+        Args:
+            uid: The channel UUID to look up.
+        """
+
+        return self._by_uid.get(uid)
+
+    def get_by_name(self, name: str) -> Channel | None:
+        """Gets the first channel with the given display name.
+
+        Args:
+            name: The display name to look up.
+        """
+
+        found = self._by_name.get(name)
+        return found[0] if found else None
+
+    def first(self) -> Channel | None:
+        """Gets the earliest added channel, if there is any."""
+
+        return next(iter(self._by_uid.values()), None)
+
+    def add(self, channel: Channel) -> bool:
+        """Adds a channel.
+
+        Args:
+            channel: The channel to add.
+
+        Returns:
+            False if a channel with the same uid was already indexed, in which
+            case nothing is changed.
+        """
+
+        if channel.uid in self._by_uid:
+            return False
+
+        self._by_uid[channel.uid] = channel
+        _index_add(self._by_name, channel.name, channel)
+        return True
+
+    def remove(self, uid: str) -> Channel | None:
+        """Removes a channel by its uid.
+
+        Args:
+            uid: The channel UUID to remove.
+
+        Returns:
+            The removed channel, or None if it wasn't indexed.
+        """
+
+        channel = self._by_uid.pop(uid, None)
+        if channel is not None:
+            _index_remove(self._by_name, channel.name, channel)
+
+        return channel
+
+    def rename(self, uid: str, name: str) -> str | None:
+        """Renames a channel in place.
+
+        Args:
+            uid: The channel UUID to rename.
+            name: The new display name.
+
+        Returns:
+            The previous name, or None if nothing was renamed.
+        """
+
+        channel = self._by_uid.get(uid)
+        if channel is None or channel.name == name:
+            return None
+
+        old_name = channel.name
+        _index_remove(self._by_name, old_name, channel)
+        channel.name = name
+        _index_add(self._by_name, name, channel)
+
+        return old_name
+
+    def apply(self, channels: Iterable[Channel], complete: bool = True) -> ChannelDelta:
+        """Applies a set of channels from the server, updating existing ones in place.
+
+        Known channels keep their identity (and their messages); only their
+        names and permissions are updated.
+
+        Args:
+            channels: The channels received from the server.
+            complete: Whether `channels` is the full list of available
+                channels. If set, indexed channels missing from it are removed.
+
+        Returns:
+            The `ChannelDelta` describing what changed.
+        """
+
+        delta = ChannelDelta()
+        seen = set()
+
+        for channel in channels:
+            seen.add(channel.uid)
+            existing = self._by_uid.get(channel.uid)
+
+            if existing is None:
+                self.add(channel)
+                delta.added.append(channel)
+                continue
+
+            existing.permissions = channel.permissions
+
+            old_name = self.rename(channel.uid, channel.name)
+            if old_name is not None:
+                delta.renamed.append((existing, old_name))
+
+        if complete:
+            for uid in [uid for uid in self._by_uid if uid not in seen]:
+                removed = self.remove(uid)
+                assert removed is not None
+                delta.removed.append(removed)
+
+        return delta
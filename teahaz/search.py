@@ -0,0 +1,392 @@
+"""The module containing the full-text search index over chat history.
+
+The index is an inverted index stored in SQLite (from the standard library),
+either in memory or in a file. Queries are made of space-separated clauses,
+all of which have to match:
+
+- `word`: messages containing the word.
+- `"some words"`: messages containing the words next to each other.
+- `wor*`: messages containing a word starting with `wor`.
+
+Matching is case-insensitive, and words are sequences of letters, digits and
+underscores.
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+import weakref
+from pathlib import Path
+from threading import Lock
+from dataclasses import dataclass
+from typing import Iterable
+
+from .dataclasses import Message
+
+__all__ = [
+    "tokenize",
+    "SearchHit",
+    "SearchIndex",
+]
+
+_WORD = re.compile(r"\w+")
+_CLAUSE = re.compile(r'"([^"]*)"|(\S+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chatroom TEXT NOT NULL,
+    uid TEXT NOT NULL,
+    channel TEXT,
+    username TEXT,
+    send_time REAL NOT NULL,
+    UNIQUE (chatroom, uid)
+);
+CREATE INDEX IF NOT EXISTS messages_time ON messages (send_time);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    message INTEGER NOT NULL,
+    positions TEXT NOT NULL,
+    PRIMARY KEY (term, message)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_message ON postings (message);
+"""
+
+LOW_WATERMARK = 0.5
+"""The fraction of the memory budget an index over budget is evicted down to.
+
+Evicting only frees space within pages, so the index is compacted with a VACUUM
+afterwards, which rewrites all of it. Evicting well below the budget keeps this
+rare: the rewrites amount to a constant cost per indexed byte."""
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lowercase words."""
+
+    return _WORD.findall(text.lower())
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    """A message matching a search query."""
+
+    chatroom_uid: str
+    message_uid: str
+    channel_id: str | None
+    username: str | None
+    send_time: float
+
+    message: Message | None
+    """The message itself, if it is still held by its chatroom."""
+
+
+class SearchIndex:
+    """An incrementally updated inverted index of text messages.
+
+    Only messages with `str` data are indexed. Adding a message that is already
+    indexed does nothing, so history can safely be re-added. The index can be
+    shared by multiple threads.
+    """
+
+    def __init__(
+        self, path: str | Path | None = None, memory_budget: int | None = None
+    ) -> None:
+        """Initializes the index.
+
+        Args:
+            path: The SQLite file to keep the index in. If not set, the index
+                is kept in memory.
+            memory_budget: The maximum amount of memory used, in bytes. An index
+                kept in memory evicts its oldest messages once it grows beyond
+                this, while an on-disk index uses it to limit its page cache.
+        """
+
+        self.path = None if path is None else Path(path)
+        self.memory_budget = memory_budget
+
+        self._lock = Lock()
+        self._messages: weakref.WeakValueDictionary[
+            tuple[str, str], Message
+        ] = weakref.WeakValueDictionary()
+
+        self._db = sqlite3.connect(
+            ":memory:" if self.path is None else str(self.path),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.executescript(_SCHEMA)
+
+        if self.path is not None:
+            self._db.execute("PRAGMA journal_mode = WAL")
+
+            if memory_budget is not None:
+                self._db.execute(f"PRAGMA cache_size = {-(memory_budget // 1024)}")
+
+    def __len__(self) -> int:
+        """Returns the count of indexed messages."""
+
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def _memory_used(self) -> int:
+        """Returns the size of the in-memory database, in bytes."""
+
+        page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+
+        return page_count * page_size
+
+    def _enforce_budget(self) -> None:
+        """Evicts the oldest messages once the in-memory index is over budget.
+
+        Messages are evicted until the index is below `LOW_WATERMARK` of the
+        budget.
+        """
+
+        if self.path is not None or self.memory_budget is None:
+            return
+
+        used = self._memory_used()
+        if used <= self.memory_budget:
+            return
+
+        target = self.memory_budget * LOW_WATERMARK
+
+        while used > target:
+            count = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            if count == 0:
+                return
+
+            # Messages take up about the same space, so this usually takes one pass
+            evicted = "SELECT id FROM messages ORDER BY send_time LIMIT ?"
+            limit = max(1, int(count * (1 - target / used)))
+
+            self._db.execute(f"DELETE FROM postings WHERE message IN ({evicted})", (limit,))
+            self._db.execute(f"DELETE FROM messages WHERE id IN ({evicted})", (limit,))
+
+            # Freed pages are only returned by VACUUM
+            self._db.execute("VACUUM")
+            used = self._memory_used()
+
+    def add(self, chatroom_uid: str, messages: Iterable[Message]) -> int:
+        """Indexes messages of a chatroom.
+
+        Args:
+            chatroom_uid: The uid of the chatroom the messages belong to.
+            messages: The messages to index.
+
+        Returns:
+            The count of newly indexed messages.
+        """
+
+        added = 0
+
+        with self._lock:
+            self._db.execute("BEGIN")
+
+            try:
+                for message in messages:
+                    if not isinstance(message.data, str):
+                        continue
+
+                    self._messages[(chatroom_uid, message.uid)] = message
+
+                    cursor = self._db.execute(
+                        "INSERT OR IGNORE INTO messages"
+                        " (chatroom, uid, channel, username, send_time)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (
+                            chatroom_uid,
+                            message.uid,
+                            message.channel_id,
+                            message.username,
+                            message.send_time,
+                        ),
+                    )
+
+                    if cursor.rowcount == 0:
+                        continue
+
+                    positions: dict[str, list[str]] = {}
+                    for position, term in enumerate(tokenize(message.data)):
+                        positions.setdefault(term, []).append(str(position))
+
+                    self._db.executemany(
+                        "INSERT INTO postings VALUES (?, ?, ?)",
+                        [
+                            (term, cursor.lastrowid, ",".join(indices))
+                            for term, indices in positions.items()
+                        ],
+                    )
+                    added += 1
+
+                self._db.execute("COMMIT")
+
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+            if added:
+                self._enforce_budget()
+
+        return added
+
+    def remove_chatroom(self, chatroom_uid: str) -> None:
+        """Removes every message of a chatroom from the index."""
+
+        selected = "SELECT id FROM messages WHERE chatroom = ?"
+
+        with self._lock:
+            self._db.execute(
+                f"DELETE FROM postings WHERE message IN ({selected})", (chatroom_uid,)
+            )
+            self._db.execute("DELETE FROM messages WHERE chatroom = ?", (chatroom_uid,))
+
+    @staticmethod
+    def _parse(query: str) -> list[tuple[str, list[str]]]:
+        """Parses query into `(kind, terms)` clauses.
+
+        Kind is one of "term", "prefix" or "phrase".
+        """
+
+        clauses = []
+
+        for phrase, word in _CLAUSE.findall(query):
+            if phrase:
+                terms = tokenize(phrase)
+                if len(terms) == 1:
+                    clauses.append(("term", terms))
+                elif terms:
+                    clauses.append(("phrase", terms))
+
+                continue
+
+            terms = tokenize(word)
+            if word.endswith("*") and len(terms) == 1:
+                clauses.append(("prefix", terms))
+
+            elif len(terms) > 1:
+                # Punctuated words, like "e-mail", are matched as phrases
+                clauses.append(("phrase", terms))
+
+            elif terms:
+                clauses.append(("term", terms))
+
+        return clauses
+
+    def _matches_phrases(self, message_id: int, phrases: list[list[str]]) -> bool:
+        """Determines whether a message contains all of the given phrases."""
+
+        terms = {term for phrase in phrases for term in phrase}
+        rows = self._db.execute(
+            "SELECT term, positions FROM postings WHERE message = ?"
+            f" AND term IN ({', '.join('?' * len(terms))})",
+            (message_id, *terms),
+        )
+
+        positions = {
+            term: {int(index) for index in indices.split(",")} for term, indices in rows
+        }
+
+        for phrase in phrases:
+            starts = positions.get(phrase[0], set())
+
+            for offset, term in enumerate(phrase[1:], start=1):
+                following = positions.get(term, set())
+                starts = {start for start in starts if start + offset in following}
+
+            if not starts:
+                return False
+
+        return True
+
+    def search(  # pylint: disable=too-many-arguments, too-many-locals
+        self,
+        query: str,
+        chatroom: str | None = None,
+        channel: str | None = None,
+        user: str | None = None,
+        start: float | None = None,
+        end: float | None = None,
+        limit: int | None = 100,
+    ) -> list[SearchHit]:
+        """Searches the index.
+
+        Args:
+            query: The query, see the module documentation for its syntax.
+            chatroom: Only match messages of the chatroom with this uid.
+            channel: Only match messages of the channel with this uid.
+            user: Only match messages sent by this username.
+            start: Only match messages sent at or after this time.
+            end: Only match messages sent at or before this time.
+            limit: The maximum amount of hits returned.
+
+        Returns:
+            The matching messages, newest first.
+        """
+
+        clauses = self._parse(query)
+        if not clauses:
+            return []
+
+        selects = []
+        params: list[object] = []
+
+        for kind, terms in clauses:
+            if kind == "prefix":
+                selects.append(
+                    "SELECT message FROM postings WHERE term >= ? AND term < ?"
+                )
+                params.extend([terms[0], terms[0] + "\U0010ffff"])
+                continue
+
+            # Phrases are narrowed down to messages containing all their terms
+            for term in terms:
+                selects.append("SELECT message FROM postings WHERE term = ?")
+                params.append(term)
+
+        sql = (
+            "SELECT id, chatroom, uid, channel, username, send_time FROM messages"
+            f" WHERE id IN ({' INTERSECT '.join(selects)})"
+        )
+
+        for column, value in [
+            ("chatroom = ?", chatroom),
+            ("channel = ?", channel),
+            ("username = ?", user),
+            ("send_time >= ?", start),
+            ("send_time <= ?", end),
+        ]:
+            if value is not None:
+                sql += f" AND {column}"
+                params.append(value)
+
+        sql += " ORDER BY send_time DESC"
+
+        phrases = [terms for kind, terms in clauses if kind == "phrase"]
+        if not phrases and limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        hits: list[SearchHit] = []
+
+        with self._lock:
+            for row in self._db.execute(sql, params).fetchall():
+                if limit is not None and len(hits) >= limit:
+                    break
+
+                if phrases and not self._matches_phrases(row[0], phrases):
+                    continue
+
+                hits.append(
+                    SearchHit(*row[1:], message=self._messages.get((row[1], row[2])))
+                )
+
+        return hits
+
+    def close(self) -> None:
+        """Closes the underlying database."""
+
+        with self._lock:
+            self._db.close()
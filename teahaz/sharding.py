@@ -0,0 +1,658 @@
+"""The module containing the multi-process, sharded version of `Teacup`.
+
+A single process running thousands of chatroom loops quickly runs into the
+GIL, long before the network is saturated. `ShardedTeacup` spreads its
+chatrooms over a set of worker processes, each of which runs a plain `Teacup`.
+Chatrooms are assigned to workers using consistent hashing on their uid, and
+events are sent back to the parent process over a single queue.
+"""
+
+# pylint: disable=too-many-instance-attributes
+
+from __future__ import annotations
+
+import os
+import shutil
+import hashlib
+import traceback
+import multiprocessing
+from bisect import bisect
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Any, Callable
+
+from .client import Event, Teacup, Chatroom
+from .dataclasses import Invite
+from .types import EventCallback
+from .registry import ChatroomRegistry
+
+__all__ = [
+    "HashRing",
+    "RemoteChatroom",
+    "ShardedTeacup",
+]
+
+
+class HashRing:
+    """A consistent hash ring mapping keys onto shard indices.
+
+    Every shard is placed on the ring `replicas` times, so keys are spread
+    evenly and changing the shard count only moves a small part of them.
+    """
+
+    def __init__(self, shards: int, replicas: int = 64) -> None:
+        """Initializes the ring.
+
+        Args:
+            shards: The number of shards to distribute keys over.
+            replicas: How many points each shard occupies on the ring.
+        """
+
+        if shards < 1:
+            raise ValueError(f"Shard count must be positive, not {shards}.")
+
+        self.shards = shards
+
+        points = sorted(
+            (self._hash(f"{shard}:{replica}"), shard)
+            for shard in range(shards)
+            for replica in range(replicas)
+        )
+
+        self._points = [point for point, _ in points]
+        self._nodes = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        """Returns a stable 64-bit hash of key."""
+
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get(self, key: str) -> int:
+        """Gets the shard index key belongs to.
+
+        Args:
+            key: The key to look up, usually a chatroom uid.
+        """
+
+        index = bisect(self._points, self._hash(key)) % len(self._points)
+        return self._nodes[index]
+
+
+class _Forwarder:  # pylint: disable=too-few-public-methods
+    """An event callback that sends its arguments to the parent process."""
+
+    def __init__(self, queue: Any, event: Event) -> None:
+        """Initializes the forwarder."""
+
+        self.queue = queue
+        self.event = event
+
+    def __call__(self, *data: Any) -> None:
+        """Puts a compact `(event_value, data)` record on the queue."""
+
+        self.queue.put((self.event.value, data))
+
+
+def _describe(chatroom: Chatroom) -> dict[str, Any]:
+    """Returns the picklable information of a chatroom."""
+
+    return {
+        "uid": chatroom.uid,
+        "url": chatroom.url,
+        "name": chatroom.name,
+        "username": chatroom.username,
+    }
+
+
+class _ShardWorker:
+    """The command handler running inside each shard process."""
+
+    def __init__(self, events: Any) -> None:
+        """Initializes the worker."""
+
+        self.cup = Teacup()
+        self.events = events
+
+    def _find(self, uid: str) -> Chatroom:
+        """Finds a chatroom owned by this shard."""
+
+        chatroom = self.cup.get_chatroom_by_uid(uid)
+        if chatroom is not None:
+            return chatroom
+
+        raise KeyError(f"Chatroom {uid!r} is not owned by this shard.")
+
+    def cmd_login(self, url: str, uid: str, username: str, password: str) -> Any:
+        """Logs into a chatroom."""
+
+        return _describe(self.cup.login(url, uid, username, password))
+
+    def cmd_create_chatroom(self, *args: Any) -> Any:
+        """Creates a chatroom."""
+
+        chatroom = self.cup.create_chatroom(*args)
+        return None if chatroom is None else _describe(chatroom)
+
+    def cmd_use_invite(self, invite: Invite, username: str, password: str) -> Any:
+        """Uses an invite."""
+
+        chatroom = self.cup.use_invite(invite, username, password)
+        return None if chatroom is None else _describe(chatroom)
+
+    def cmd_subscribe(self, event_value: int, callback: EventCallback | None) -> None:
+        """Subscribes all chatrooms to an event.
+
+        When no callback is given the event is forwarded to the parent.
+        """
+
+        event = Event(event_value)
+        self.cup.subscribe_all(event, callback or _Forwarder(self.events, event))
+
+    def cmd_call(
+        self, uid: str, method: str, args: tuple[Any, ...], kwargs: dict[str, Any]
+    ) -> Any:
+        """Calls a method of one of our chatrooms."""
+
+        returned = getattr(self._find(uid), method)(*args, **kwargs)
+
+        if isinstance(returned, Chatroom):
+            return _describe(returned)
+
+        return returned
+
+    def cmd_load(self, dirpaths: list[Path]) -> list[dict[str, Any]]:
+        """Restores the given dump directories."""
+
+        loaded = []
+        for dirpath in dirpaths:
+            chatroom = Teacup._load_chatroom(  # pylint: disable=protected-access
+                dirpath
+            )
+            self.cup.add_chatroom(chatroom)
+            loaded.append(_describe(chatroom))
+
+        return loaded
+
+    def cmd_remove(self, uid: str) -> bool:
+        """Stops and removes one of our chatrooms."""
+
+        return self.cup.remove_chatroom(uid) is not None
+
+    def cmd_dump_to(
+        self, save_root: Path, max_msg_count: int | None, archive: bool | None
+    ) -> None:
+        """Dumps our chatrooms into the shared save_root."""
+
+        self.cup.dump_to(
+            save_root, remove_old=False, max_msg_count=max_msg_count, archive=archive
+        )
+
+    def cmd_start(self) -> None:
+        """Starts our chatrooms' event loops."""
+
+        self.cup.start()
+
+    def cmd_restart(self, timeout: float | None, drain: bool) -> bool:
+        """Restarts our chatrooms."""
+
+        return self.cup.restart(timeout, drain)
+
+    def cmd_get_threads(self) -> list[str]:
+        """Gets our chatroom thread names."""
+
+        return self.cup.get_threads()
+
+
+def _shard_main(conn: Any, events: Any) -> None:
+    """The entrypoint of a shard process.
+
+    Commands arrive over `conn` as `(name, args)` tuples, and are answered
+    with `(ok, value)` tuples. Failed commands send back their exception.
+    """
+
+    worker = _ShardWorker(events)
+
+    while True:
+        try:
+            command, args = conn.recv()
+        except EOFError:
+            # The parent went away without stopping us
+            worker.cup.stop()
+            break
+
+        if command == "stop":
+            conn.send((True, worker.cup.stop(*args)))
+            break
+
+        try:
+            conn.send((True, getattr(worker, f"cmd_{command}")(*args)))
+        except Exception as exception:  # pylint: disable=broad-except
+            conn.send((False, exception))
+
+
+class RemoteChatroom:
+    """A handle to a chatroom living inside a shard process.
+
+    Attribute access of unknown names returns a proxy that calls the method
+    of the same name on the real `Chatroom`. Arguments and return values must
+    be picklable.
+    """
+
+    def __init__(self, owner: ShardedTeacup, shard: int, info: dict[str, Any]) -> None:
+        """Initializes the handle.
+
+        Args:
+            owner: The ShardedTeacup this chatroom belongs to.
+            shard: The index of the shard process owning the chatroom.
+            info: The chatroom's data, as sent by the shard.
+        """
+
+        self.uid: str = info["uid"]
+        self.url: str = info["url"]
+        self.name: str | None = info["name"]
+        self.username: str | None = info["username"]
+        self.shard = shard
+
+        self._owner = owner
+
+    def __repr__(self) -> str:
+        """Returns a simple representation of the handle."""
+
+        return f'RemoteChatroom(uid="{self.uid}", shard={self.shard})'
+
+    def __getattr__(self, method: str) -> Callable[..., Any]:
+        """Returns a callable running `method` inside the owning shard."""
+
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def _call_remote(*args: Any, **kwargs: Any) -> Any:
+            """Calls the remote method."""
+
+            # pylint: disable=protected-access
+            return self._owner._call(
+                self.shard, "call", self.uid, method, args, kwargs
+            )
+
+        return _call_remote
+
+
+class ShardedTeacup:
+    """A `Teacup` that spreads its chatrooms over worker processes.
+
+    Its interface mirrors `Teacup`, except that the chatrooms it returns are
+    `RemoteChatroom` handles. Callbacks registered with `subscribe_all` are
+    called inside the parent process by default, on a dedicated dispatcher
+    thread. Pass `in_worker=True` to run them inside the shards instead, which
+    requires the callback to be picklable (e.g. a module-level function).
+
+    ```python3
+    from teahaz import ShardedTeacup, Event
+
+    cup = ShardedTeacup(shards=4)
+    cup.subscribe_all(Event.MSG_NEW, print)
+    cup.login("https://teahaz.co.uk", "chatroom-uuid", "username", "password")
+    ```
+    """
+
+    def __init__(self, shards: int | None = None, start_method: str = "spawn") -> None:
+        """Initializes the shard processes.
+
+        Args:
+            shards: The number of worker processes. Defaults to the CPU count.
+            start_method: The `multiprocessing` start method to use.
+        """
+
+        self.ring = HashRing(shards or os.cpu_count() or 1)
+        self.registry = ChatroomRegistry()
+
+        context = multiprocessing.get_context(start_method)
+        self._events = context.Queue()
+        self._global_listeners: dict[Event, EventCallback] = {}
+        self._placement: dict[str, int] = {}
+        self._processes = []
+        self._connections = []
+        self._locks = []
+
+        for index in range(self.ring.shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_shard_main,
+                args=(child_conn, self._events),
+                name=f"ShardedTeacup-{index}",
+                daemon=True,
+            )
+            process.start()
+
+            self._processes.append(process)
+            self._connections.append(parent_conn)
+            self._locks.append(Lock())
+
+        # `stop` joins the dispatcher, but a forgotten one can't block exiting
+        self._dispatcher = Thread(
+            target=self._dispatch, name="ShardedTeacup-events", daemon=True
+        )
+        self._dispatcher.start()
+
+    @property
+    def chatrooms(self) -> tuple[RemoteChatroom, ...]:
+        """An immutable snapshot of all chatroom handles, across every shard."""
+
+        return self.registry.snapshot()
+
+    def _call(self, shard: int, command: str, *args: Any) -> Any:
+        """Runs a command inside a shard and returns its result.
+
+        Raises:
+            Any exception raised by the command inside the shard.
+        """
+
+        with self._locks[shard]:
+            self._connections[shard].send((command, args))
+            is_ok, value = self._connections[shard].recv()
+
+        if not is_ok:
+            raise value
+
+        return value
+
+    def _call_all(self, command: str, *args: Any) -> list[Any]:
+        """Runs a command inside every shard concurrently, returning all results.
+
+        Raises:
+            The first exception raised by the command inside any shard.
+        """
+
+        shards = range(self.ring.shards)
+
+        # Locks are always taken in shard order, so this can't deadlock with _call
+        for shard in shards:
+            self._locks[shard].acquire()
+
+        try:
+            for shard in shards:
+                self._connections[shard].send((command, args))
+
+            replies = [self._connections[shard].recv() for shard in shards]
+
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+
+        for is_ok, value in replies:
+            if not is_ok:
+                raise value
+
+        return [value for _, value in replies]
+
+    def _dispatch(self) -> None:
+        """Calls the parent-side listeners of events sent by the shards."""
+
+        while True:
+            record = self._events.get()
+            if record is None:
+                break
+
+            event_value, data = record
+            callback = self._global_listeners.get(Event(event_value))
+
+            if callback is None:
+                continue
+
+            # Printed like an uncaught thread exception, so later events still arrive
+            try:
+                callback(*data)
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+
+    def _add(self, shard: int, info: dict[str, Any] | None) -> RemoteChatroom | None:
+        """Registers a chatroom described by a shard."""
+
+        if info is None:
+            return None
+
+        chatroom = RemoteChatroom(self, shard, info)
+        self._placement[chatroom.uid] = shard
+        self.registry.add(chatroom)
+
+        return chatroom
+
+    def shard_for(self, uid: str) -> int:
+        """Gets the index of the shard owning (or that would own) a chatroom.
+
+        Args:
+            uid: The chatroom's uid.
+        """
+
+        placed = self._placement.get(uid)
+        if placed is not None:
+            return placed
+
+        return self.ring.get(uid)
+
+    @classmethod
+    def from_dump(
+        cls, save_root: str | Path, shards: int | None = None
+    ) -> ShardedTeacup:
+        """Restores a dump, loading each chatroom inside its own shard.
+
+        Args:
+            save_root: The root directory written by `dump_to`.
+            shards: The number of worker processes to use.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from .snapshot import chatroom_directories
+
+        cup = cls(shards)
+        assigned: dict[int, list[Path]] = {}
+
+        for dirpath in chatroom_directories(save_root):
+            assigned.setdefault(cup.ring.get(dirpath.name), []).append(dirpath)
+
+        for shard, dirpaths in assigned.items():
+            for info in cup._call(shard, "load", dirpaths):
+                cup._add(shard, info)
+
+        return cup
+
+    def dump_to(
+        self,
+        save_root: str | Path,
+        remove_old: bool = True,
+        max_msg_count: int | None = None,
+        archive: bool | None = None,
+    ) -> None:
+        """Dumps all chatrooms of all shards to the given save_root.
+
+        The resulting structure is identical to `Teacup.dump_to`.
+
+        Args:
+            save_root: The root directory to save to.
+            remove_old: If set, the dumps of chatrooms that are no longer in
+                any shard are removed, once all others are written.
+            max_msg_count: The maximum amount of messages dumped per chatroom.
+            archive: Whether messages are written into a history archive. See
+                `Teacup.dump_to`.
+        """
+
+        # pylint: disable-next=import-outside-toplevel
+        from .snapshot import chatroom_directories
+
+        root = Path(save_root)
+        self._call_all("dump_to", root, max_msg_count, archive)
+
+        if remove_old:
+            # Only chatroom dumps are listed, so blob stores are left alone
+            for path in chatroom_directories(root):
+                if path.name not in self._placement:
+                    shutil.rmtree(path)
+
+    def get_threads(self) -> list[str]:
+        """Gets names of all chatroom threads across every shard."""
+
+        names: list[str] = []
+        for shard_names in self._call_all("get_threads"):
+            names.extend(shard_names)
+
+        return names
+
+    def login(
+        self, url: str, chatroom: str, username: str, password: str
+    ) -> RemoteChatroom:
+        """Creates a logged-in chatroom inside the shard owning its uid.
+
+        Args:
+            url: The server URL:PORT.
+            chatroom: The UUID of the chatroom.
+            username: Login username for chatroom.
+            password: Login password for chatroom.
+
+        Returns:
+            A handle to the chatroom with the given user logged in.
+        """
+
+        shard = self.shard_for(chatroom)
+        remote = self._add(
+            shard, self._call(shard, "login", url, chatroom, username, password)
+        )
+
+        assert remote is not None
+        return remote
+
+    def create_chatroom(
+        self, url: str, name: str, username: str, password: str
+    ) -> RemoteChatroom | None:
+        """Creates a new chatroom.
+
+        As the uid of a new chatroom is only known after it was created, the
+        shard is chosen by hashing its name instead. The placement is
+        remembered for the lifetime of this object.
+
+        Args:
+            url: The server URL:PORT.
+            name: The display name for the new chatroom.
+            username: The login username.
+            password: The login password.
+
+        Returns:
+            A handle to the logged-in chatroom, or None if its creation was
+            unsuccessful **and** the error raised was captured.
+        """
+
+        shard = self.ring.get(name)
+        return self._add(
+            shard, self._call(shard, "create_chatroom", url, name, username, password)
+        )
+
+    def use_invite(
+        self, invite: Invite, username: str, password: str
+    ) -> RemoteChatroom | None:
+        """Creates a chatroom from an invite, inside the shard owning it.
+
+        Args:
+            invite: Invite instance.
+            username: Username for new chatroom user.
+            password: Password for new chatroom user.
+
+        Returns:
+            A handle to the logged-in chatroom, or None when creation failed but
+            error was captured.
+        """
+
+        shard = self.shard_for(invite.chatroom_id)
+        return self._add(
+            shard, self._call(shard, "use_invite", invite, username, password)
+        )
+
+    def get_chatroom_by_uid(self, uid: str) -> RemoteChatroom | None:
+        """Gets the handle of a chatroom by its uid.
+
+        Args:
+            uid: The chatroom UUID to search for.
+        """
+
+        return self.registry.get(uid)
+
+    def remove_chatroom(self, chatroom: RemoteChatroom | str) -> RemoteChatroom | None:
+        """Stops and removes a chatroom inside its shard.
+
+        Args:
+            chatroom: The handle, or the uid of the chatroom to remove.
+
+        Returns:
+            The removed handle, or None if it wasn't found.
+        """
+
+        if isinstance(chatroom, str):
+            found = self.registry.get(chatroom)
+            if found is None:
+                return None
+
+            chatroom = found
+
+        if not self.registry.remove(chatroom):
+            return None
+
+        self._call(chatroom.shard, "remove", chatroom.uid)
+        self._placement.pop(chatroom.uid, None)
+
+        return chatroom
+
+    def subscribe_all(
+        self, event: Event, callback: EventCallback, in_worker: bool = False
+    ) -> None:
+        """Subscribes callback to event in all (current & future) chatrooms.
+
+        Args:
+            event: The event to subscribe to.
+            callback: The callback that shall be called.
+            in_worker: If set, callback is sent to and run inside the shard
+                processes, instead of the parent.
+        """
+
+        if in_worker:
+            self._global_listeners.pop(event, None)
+            self._call_all("subscribe", event.value, callback)
+            return
+
+        self._global_listeners[event] = callback
+        self._call_all("subscribe", event.value, None)
+
+    def start(self) -> None:
+        """Starts the event loops of all chatrooms. See `Teacup.start`."""
+
+        self._call_all("start")
+
+    def restart(self, timeout: float | None = None, drain: bool = False) -> bool:
+        """Restarts the chatrooms of all shards concurrently. See `Teacup.restart`.
+
+        Returns:
+            Whether the previous threads of every shard finished within the timeout.
+        """
+
+        return all(self._call_all("restart", timeout, drain))
+
+    def stop(self, timeout: float | None = None, drain: bool = False) -> bool:
+        """Stops all chatrooms and shuts down the shard processes.
+
+        Args:
+            timeout: The maximum seconds each shard waits for its chatrooms'
+                threads. Shards stop concurrently. If not set, they wait until
+                all threads have finished.
+            drain: See `Teacup.stop`.
+
+        Returns:
+            Whether every shard's threads finished within the timeout.
+        """
+
+        finished = all(self._call_all("stop", timeout, drain))
+
+        for process in self._processes:
+            process.join()
+
+        self._events.put(None)
+        self._dispatcher.join()
+
+        return finished
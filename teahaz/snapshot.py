@@ -0,0 +1,507 @@
+"""The module containing crash-safe dumps, and the background snapshotter writing them.
+
+Every chatroom of a dump is written into a temporary directory, flushed to disk
+and then renamed over its previous version. A crash mid-write therefore leaves
+each chatroom either fully old or fully new, never a mix of both. If a crash
+interrupts the two renames replacing a chatroom, its previous version is
+restored by `chatroom_directories`, which `Teacup.from_dump` reads dumps with.
+`Teacup.dump_to` writes its dumps this way.
+
+A `Snapshotter` writes the same dumps on a worker thread, on a schedule and
+whenever `Snapshotter.request` is called:
+
+```python3
+from teahaz import Teacup
+
+cup = Teacup()
+snapshotter = cup.start_snapshots("saves", interval=60)
+
+# Make sure something important is saved soon, without waiting for it
+snapshotter.request()
+```
+
+Capturing the state of the chatrooms is cheap, as their histories are taken as
+O(1) `MessageLog` snapshots, so chatrooms keep running while the dump is
+serialized. Requests made while a snapshot is pending are coalesced into it.
+"""
+
+from __future__ import annotations
+
+import os
+import copy
+import json
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+from threading import Event, Lock, Thread
+from concurrent.futures import Future
+from dataclasses import dataclass
+from time import monotonic, time as epoch
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Sequence
+
+from .client import _message_to_dict
+from .archive import ARCHIVE_NAME, HistoryArchive, write_archive
+
+if TYPE_CHECKING:
+    from .client import Chatroom, Teacup
+    from .dataclasses import Message
+
+__all__ = [
+    "ChatroomSnapshot",
+    "Snapshotter",
+    "chatroom_directories",
+    "write_atomic",
+    "write_dump",
+]
+
+TEMP_PREFIX = ".tmp-"
+"""The name prefix of chatroom directories that are being written."""
+
+OLD_PREFIX = ".old-"
+"""The name prefix of chatroom directories that are being replaced."""
+
+
+def _fsync_directory(path: Path) -> None:
+    """Flushes the entries of a directory, such as renames, to disk."""
+
+    # Directories can't be opened on Windows, where renames are durable anyway
+    if os.name != "posix":
+        return
+
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def write_atomic(path: str | Path, data: bytes) -> None:
+    """Replaces the file at path with data, so it is never seen half-written.
+
+    Args:
+        path: The file to write. Its directory has to exist.
+        data: The new content of the file.
+    """
+
+    path = Path(path)
+    descriptor, temp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.tmp-")
+
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp, path)
+
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+    _fsync_directory(path.parent)
+
+
+def _replace_directory(temp: Path, path: Path) -> None:
+    """Moves the complete directory temp to path, replacing any directory there.
+
+    Directories can't be renamed over non-empty ones, so the previous one is
+    moved aside first, and only removed once temp is in its place.
+    """
+
+    old = path.with_name(OLD_PREFIX + path.name)
+    if old.exists():
+        shutil.rmtree(old)
+
+    if path.exists():
+        os.rename(path, old)
+
+    os.rename(temp, path)
+    _fsync_directory(path.parent)
+
+    if old.exists():
+        shutil.rmtree(old)
+
+
+def chatroom_directories(root: str | Path) -> list[Path]:
+    """Returns the chatroom directories of a dump, recovering interrupted writes.
+
+    Chatrooms whose replacement was interrupted are restored to their previous
+    version, and unfinished directories are removed.
+
+    Args:
+        root: The root directory of the dump.
+    """
+
+    root = Path(root)
+    directories = []
+
+    for name in sorted(os.listdir(root)):
+        path = root / name
+
+        if name.startswith(TEMP_PREFIX):
+            shutil.rmtree(path)
+            continue
+
+        if name.startswith(OLD_PREFIX):
+            current = root / name[len(OLD_PREFIX) :]
+
+            if current.exists():
+                shutil.rmtree(path)
+                continue
+
+            os.rename(path, current)
+            path = current
+
+        if (path / "data.json").is_file():
+            directories.append(path)
+
+    return sorted(set(directories))
+
+
+def _session_of(chatroom: Chatroom) -> Any:
+    """Returns chatroom's session, with the cookies of its transport.
+
+    Transports other than the session itself (such as HTTP/2 ones) keep their
+    cookies in a jar of their own, so the session's cookies are stale.
+    """
+
+    session = chatroom.session
+    cookies = chatroom.transport.cookies
+
+    if cookies is session.cookies:
+        return session
+
+    session = copy.copy(session)
+    session.cookies = type(session.cookies)()
+
+    for cookie in cookies:
+        session.cookies.set_cookie(cookie)
+
+    return session
+
+
+@dataclass
+class ChatroomSnapshot:
+    """The state of a chatroom at one point in time, as dumped by `dump_to`."""
+
+    uid: str
+    data: dict[str, Any]
+    """The content of data.json."""
+
+    messages: Sequence[Message]
+    """The stored messages, oldest first."""
+
+    archive: HistoryArchive | None
+    """The archive the chatroom was restored with, if any."""
+
+    session: bytes
+    """The pickled session."""
+
+    @classmethod
+    def capture(
+        cls, chatroom: Chatroom, max_msg_count: int | None = None
+    ) -> ChatroomSnapshot:
+        """Captures the state of a chatroom. This doesn't copy its messages.
+
+        Args:
+            chatroom: The chatroom to capture.
+            max_msg_count: The maximum amount of messages kept. Archived
+                messages are not counted.
+        """
+
+        assert chatroom.uid is not None
+
+        messages: Sequence[Message] = chatroom.messages.snapshot()
+        if max_msg_count is not None:
+            messages = messages[:max_msg_count]
+
+        # Messages spilled before the snapshot above are only in memory until written
+        if chatroom.cold is not None:
+            chatroom.cold.flush()
+
+        # The logged-in user, as the server lists it, see `initialize_from_response`
+        users = [{"username": chatroom.username}]
+
+        data = {
+            "chatroomID": chatroom.uid,
+            "url": chatroom.url,
+            "chatroom_name": chatroom.name,
+            "blob_root": None
+            if chatroom.blob_store is None
+            else str(chatroom.blob_store.root),
+            "cold_root": None if chatroom.cold is None else str(chatroom.cold.directory),
+            "hot_count": chatroom.hot_count,
+            "users": users,
+            "channels": [
+                {
+                    "uid": channel.uid,
+                    "name": channel.name,
+                    "permissions": channel.permissions,
+                }
+                for channel in chatroom.channels
+            ],
+        }
+
+        session = pickle.dumps(_session_of(chatroom))
+        return cls(chatroom.uid, data, messages, chatroom.archive, session)
+
+    def _newer_messages(self) -> Iterator[Message]:
+        """Iterates over the messages that are not in the archive."""
+
+        until = None
+        if self.archive is not None and len(self.archive) > 0:
+            until = self.archive.send_time[-1]
+
+        for message in self.messages:
+            if until is None or message.send_time > until:
+                yield message
+
+    def write(self, root: Path, archive: bool | None = None) -> None:
+        """Writes the snapshot into its own directory under root, replacing it whole.
+
+        Args:
+            root: The root directory of the dump.
+            archive: See `Teacup.dump_to`.
+        """
+
+        directory = Path(tempfile.mkdtemp(dir=root, prefix=TEMP_PREFIX))
+
+        try:
+            write_atomic(
+                directory / "data.json", json.dumps(self.data).encode("utf-8")
+            )
+
+            if archive is None:
+                archive = self.archive is not None
+
+            if archive:
+                write_archive(
+                    directory / ARCHIVE_NAME, self._newer_messages(), base=self.archive
+                )
+
+            else:
+                history: Iterable[Message] = self._newer_messages()
+                if self.archive is not None:
+                    history = [*self.archive, *history]
+
+                write_atomic(
+                    directory / "messages.json",
+                    json.dumps([_message_to_dict(msg) for msg in history]).encode(
+                        "utf-8"
+                    ),
+                )
+
+            write_atomic(directory / "session.pickle", self.session)
+
+        except BaseException:
+            shutil.rmtree(directory)
+            raise
+
+        _replace_directory(directory, root / self.uid)
+
+
+def write_dump(
+    root: str | Path,
+    snapshots: Iterable[ChatroomSnapshot],
+    remove_old: bool = True,
+    archive: bool | None = None,
+) -> None:
+    """Writes chatroom snapshots into a dump.
+
+    Args:
+        root: The root directory of the dump. It is created if needed.
+        snapshots: The chatrooms to write.
+        remove_old: If set, the dumps of other chatrooms are removed from
+            root, once all snapshots are written. So are unfinished ones left
+            by crashes, so no other dump may be writing to root at the time.
+        archive: See `Teacup.dump_to`.
+    """
+
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+
+    written = set()
+    for snapshot in snapshots:
+        snapshot.write(root, archive)
+        written.add(snapshot.uid)
+
+    if not remove_old:
+        return
+
+    # Only chatroom dumps are listed, so blob stores are left alone
+    for path in chatroom_directories(root):
+        if path.name not in written:
+            shutil.rmtree(path)
+
+
+class Snapshotter:  # pylint: disable=too-many-instance-attributes
+    """Dumps a `Teacup` in the background, periodically and on request.
+
+    Snapshots run on a single worker thread, so they never overlap. Errors
+    are stored in `last_error`, and set on the futures of requests; the
+    schedule continues regardless.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        teacup: Teacup,
+        save_root: str | Path,
+        interval: float | None = 60.0,
+        max_msg_count: int | None = None,
+        archive: bool | None = None,
+        remove_old: bool = True,
+    ) -> None:
+        """Initializes the snapshotter. It has to be started with `start`.
+
+        Args:
+            teacup: The Teacup to dump.
+            save_root: The root directory to dump into.
+            interval: The seconds between scheduled snapshots. If None,
+                snapshots are only taken on request.
+            max_msg_count: See `Teacup.dump_to`.
+            archive: See `Teacup.dump_to`.
+            remove_old: See `Teacup.dump_to`.
+        """
+
+        self.teacup = teacup
+        self.save_root = Path(save_root)
+        self.interval = interval
+        self.max_msg_count = max_msg_count
+        self.archive = archive
+        self.remove_old = remove_old
+
+        self.last_snapshot: float | None = None
+        """The epoch time the last successful snapshot was captured at."""
+
+        self.last_error: Exception | None = None
+        """The exception raised by the last snapshot, if it failed."""
+
+        self._lock = Lock()
+        self._wake = Event()
+        self._pending: Future | None = None
+        self._stopping = False
+        self._thread: Thread | None = None
+
+    @property
+    def is_running(self) -> bool:
+        """Whether the worker thread is running."""
+
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts the worker thread, unless it is already running."""
+
+        if self.is_running:
+            return
+
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="Snapshotter", daemon=True)
+        self._thread.start()
+
+    def request(self) -> Future:
+        """Asks for a snapshot as soon as possible, without waiting for it.
+
+        Requests made before the snapshot starts are coalesced into it, so
+        calling this often is cheap.
+
+        Returns:
+            A future resolved once a snapshot taken after this call is written.
+        """
+
+        with self._lock:
+            if self._pending is None:
+                self._pending = Future()
+
+            future = self._pending
+
+        self._wake.set()
+        return future
+
+    def snapshot(self, timeout: float | None = None) -> None:
+        """Requests a snapshot, and waits until it is written.
+
+        Raises:
+            Exception: The snapshot failed.
+            TimeoutError: The snapshot wasn't written within timeout.
+        """
+
+        self.request().result(timeout)
+
+    def stop(self, timeout: float | None = None, flush: bool = False) -> bool:
+        """Stops the worker thread, after finishing the snapshot it is writing.
+
+        Args:
+            timeout: The maximum amount of seconds to wait for.
+            flush: If set, a final snapshot is taken before stopping.
+
+        Returns:
+            Whether the worker stopped within the timeout.
+        """
+
+        if flush:
+            self.request()
+
+        self._stopping = True
+        self._wake.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        return not self.is_running
+
+    def _take(self) -> None:
+        """Captures the state of the Teacup, and writes it."""
+
+        captured_at = epoch()
+        snapshots = [
+            ChatroomSnapshot.capture(chatroom, self.max_msg_count)
+            for chatroom in self.teacup.chatrooms
+            if chatroom.uid is not None
+        ]
+
+        write_dump(self.save_root, snapshots, self.remove_old, self.archive)
+        self.last_snapshot = captured_at
+
+    def _run(self) -> None:
+        """Takes snapshots when they are due or requested, until stopped."""
+
+        due = None if self.interval is None else monotonic() + self.interval
+
+        while True:
+            # A final snapshot requested by `stop` has been written by now
+            with self._lock:
+                if self._stopping and self._pending is None:
+                    return
+
+            self._wake.wait(None if due is None else max(0.0, due - monotonic()))
+
+            with self._lock:
+                self._wake.clear()
+                future, self._pending = self._pending, None
+
+            if future is None:
+                if self._stopping:
+                    return
+
+                if due is None or monotonic() < due:
+                    continue
+
+                future = Future()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                self._take()
+
+            except Exception as error:  # pylint: disable=broad-except
+                self.last_error = error
+                future.set_exception(error)
+
+            else:
+                self.last_error = None
+                future.set_result(None)
+
+            if self.interval is not None:
+                due = monotonic() + self.interval
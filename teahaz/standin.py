@@ -0,0 +1,629 @@
+"""The module containing a local, in-memory stand-in for a Teahaz server.
+
+A `StandInServer` implements the parts of the Teahaz API the client uses:
+creating chatrooms, logging in, channels, invites, users, and sending & polling
+messages. State only lives in memory, and there is no authentication beyond
+checking passwords on login, so it is meant for tests and load generation
+(see `teahaz.loadgen`), not for real use:
+
+```python3
+from teahaz import Teacup
+from teahaz.standin import StandInServer
+
+with StandInServer() as server:
+    cup = Teacup()
+    chatroom = cup.create_chatroom(server.url, "test", "owner", "password")
+```
+
+The same can be done from the command line, using
+`python -m teahaz.standin [--port N] [--latency SECONDS] [--http2]`.
+"""
+
+from __future__ import annotations
+
+import sys
+import json
+import argparse
+from uuid import uuid4
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread
+from socketserver import BaseRequestHandler, TCPServer, ThreadingTCPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time as epoch
+from typing import Any, Dict, Tuple
+
+from .compression import decompress
+
+__all__ = [
+    "StandInServer",
+]
+
+DEFAULT_PERMISSIONS = [{"classID": "1", "r": True, "w": True, "x": False}]
+
+_Response = Tuple[int, Any, Dict[str, str]]
+
+
+@dataclass
+class _Channel:
+    """A channel of a stand-in chatroom, with its messages in send_time order."""
+
+    uid: str
+    name: str
+    permissions: list[dict[str, Any]]
+    messages: list[dict[str, Any]] = field(default_factory=list)
+    times: list[float] = field(default_factory=list)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Returns the server-data of the channel."""
+
+        return {
+            "channelID": self.uid,
+            "name": self.name,
+            "permissions": self.permissions,
+        }
+
+
+@dataclass
+class _Room:
+    """A stand-in chatroom."""
+
+    uid: str
+    name: str
+    passwords: dict[str, str] = field(default_factory=dict)
+    channels: dict[str, _Channel] = field(default_factory=dict)
+    invites: dict[str, list[float]] = field(default_factory=dict)
+    """Invite uids, mapped to their remaining uses & expiration time."""
+
+    version: int = 0
+    """Bumped whenever users or channels change, to derive ETags from."""
+
+    def as_dict(self, username: str) -> dict[str, Any]:
+        """Returns the server-data of the chatroom, as seen by username."""
+
+        users = [username] + [user for user in self.passwords if user != username]
+
+        return {
+            "chatroomID": self.uid,
+            "chatroom_name": self.name,
+            "channels": [channel.as_dict() for channel in self.channels.values()],
+            "users": [{"username": user} for user in users],
+        }
+
+    def add_channel(self, name: str, permissions: list[dict[str, Any]]) -> _Channel:
+        """Creates a channel."""
+
+        channel = _Channel(str(uuid4()), name, permissions)
+        self.channels[channel.uid] = channel
+        self.version += 1
+
+        return channel
+
+
+class StandInServer:
+    """An in-memory Teahaz server, serving on a local port.
+
+    Requests are counted by method & endpoint in `requests`, which is useful
+    to measure the load a client generates.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        http2: bool = False,
+    ) -> None:
+        """Initializes the server.
+
+        Args:
+            host: The host to listen on.
+            port: The port to listen on. By default, a free port is chosen.
+            latency: Seconds every response is held back for, to simulate a
+                remote server.
+            http2: If set, HTTP/2 is served instead of HTTP/1.1, without TLS.
+                Clients need prior knowledge of this, such as a
+                `teahaz.transport.HTTP2Transport` with `cleartext` set. This
+                needs the optional `h2` package.
+
+        Raises:
+            ImportError: http2 is set, but h2 is not installed.
+        """
+
+        self.latency = latency
+        self.requests: Counter[tuple[str, str]] = Counter()
+        """The count of handled requests, by method & endpoint such as "messages"."""
+
+        self.connections = 0
+        """The count of connections accepted."""
+
+        self._lock = Lock()
+        self._rooms: dict[str, _Room] = {}
+
+        self._server: TCPServer
+        if http2:
+            # pylint: disable-next=import-outside-toplevel,unused-import
+            import h2
+
+            self._server = _StandInHTTP2Server((host, port), self)
+        else:
+            self._server = _StandInHTTPServer((host, port), self)
+
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """The URL clients should connect to."""
+
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> StandInServer:
+        """Starts the server."""
+
+        self.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        """Stops the server."""
+
+        self.stop()
+
+    def start(self) -> None:
+        """Starts serving in a background thread."""
+
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving."""
+
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count_connection(self) -> None:
+        """Counts a new connection."""
+
+        with self._lock:
+            self.connections += 1
+
+    def respond(
+        self, method: str, path: str, headers: dict[str, str], body: Any
+    ) -> _Response:
+        """Answers a request.
+
+        Args:
+            method: The HTTP method, such as "GET".
+            path: The request target, such as `/api/v0/messages/<chatroom id>`.
+            headers: The request headers. Their names are case-insensitive.
+            body: The decoded JSON body, or None.
+
+        Returns:
+            The status code, the JSON content and the extra headers of the response.
+        """
+
+        parts = path.split("?")[0].strip("/").split("/")
+        if len(parts) < 3 or parts[:2] != ["api", "v0"]:
+            return 404, "Unknown endpoint.", {}
+
+        endpoint = parts[2]
+        uid = parts[3] if len(parts) > 3 else None
+        headers = {key.lower(): value for key, value in headers.items()}
+
+        with self._lock:
+            self.requests[(method, endpoint)] += 1
+
+        if self.latency > 0:
+            sleep(self.latency)
+
+        if method == "POST" and endpoint == "chatroom":
+            return self._create_chatroom(body)
+
+        handler = getattr(self, f"_{method.lower()}_{endpoint}", None)
+        if handler is None:
+            return 405, "Method not allowed.", {}
+
+        with self._lock:
+            room = self._rooms.get(uid or "")
+            if room is None:
+                return 404, "Chatroom does not exist.", {}
+
+            try:
+                return handler(room, headers, body)
+            except (KeyError, TypeError, ValueError):
+                return 400, "Malformed request.", {}
+
+    def _create_chatroom(self, body: Any) -> _Response:
+        """Creates a chatroom, with a default channel."""
+
+        try:
+            room = _Room(str(uuid4()), body["chatroom-name"])
+            room.passwords[body["username"]] = body["password"]
+        except (KeyError, TypeError):
+            return 400, "Malformed request.", {}
+
+        room.add_channel("default", DEFAULT_PERMISSIONS)
+
+        with self._lock:
+            self._rooms[room.uid] = room
+
+        return 200, room.as_dict(body["username"]), {}
+
+    def _post_login(self, room: _Room, _: dict[str, str], body: Any) -> _Response:
+        """Checks the password of a user."""
+
+        if room.passwords.get(body["username"]) != body["password"]:
+            return 401, "Invalid username or password.", {}
+
+        return 200, room.as_dict(body["username"]), {}
+
+    def _post_channels(self, room: _Room, _: dict[str, str], body: Any) -> _Response:
+        """Creates a channel."""
+
+        permissions = body.get("permissions") or DEFAULT_PERMISSIONS
+        return 200, room.add_channel(body["channel-name"], permissions).as_dict(), {}
+
+    def _get_invites(self, room: _Room, headers: dict[str, str], _: Any) -> _Response:
+        """Creates an invite."""
+
+        uses = int(headers.get("uses") or 1)
+        expiration = float(headers.get("expiration-time") or 0)
+
+        uid = str(uuid4())
+        room.invites[uid] = [uses, expiration]
+
+        invite = {
+            "uid": uid,
+            "uses": uses,
+            "chatroom_id": room.uid,
+            "expiration_time": expiration,
+        }
+        return 200, invite, {}
+
+    def _post_invites(self, room: _Room, _: dict[str, str], body: Any) -> _Response:
+        """Registers a user through an invite."""
+
+        invite = room.invites.get(body["inviteID"])
+        if invite is None or invite[0] < 1 or 0 < invite[1] < epoch():
+            return 403, "Invalid invite.", {}
+
+        username = body["username"]
+        if username in room.passwords:
+            return 409, "Username is taken.", {}
+
+        invite[0] -= 1
+        room.passwords[username] = body["password"]
+        room.version += 1
+
+        return 200, room.as_dict(username), {}
+
+    def _get_channels(self, room: _Room, headers: dict[str, str], _: Any) -> _Response:
+        """Lists channels, answering 304 if the client's copy is current."""
+
+        etag = f'"channels-{room.version}"'
+        if headers.get("if-none-match") == etag:
+            return 304, None, {"ETag": etag}
+
+        channels = [channel.as_dict() for channel in room.channels.values()]
+        return 200, channels, {"ETag": etag}
+
+    def _get_users(self, room: _Room, headers: dict[str, str], _: Any) -> _Response:
+        """Lists users, answering 304 if the client's copy is current."""
+
+        etag = f'"users-{room.version}"'
+        if headers.get("if-none-match") == etag:
+            return 304, None, {"ETag": etag}
+
+        users = [
+            {"username": user, "color": {"r": 255, "g": 255, "b": 255}}
+            for user in room.passwords
+        ]
+        return 200, users, {"ETag": etag}
+
+    def _store_message(self, room: _Room, body: Any, message_type: str) -> _Response:
+        """Stores a message of the given type."""
+
+        channel = room.channels.get(body["channelID"])
+        if channel is None:
+            return 404, "Channel does not exist.", {}
+
+        if body["username"] not in room.passwords:
+            return 401, "Unknown user.", {}
+
+        # Times are kept unique, so polls since a message's time never repeat it
+        send_time = epoch()
+        if channel.times and send_time <= channel.times[-1]:
+            send_time = channel.times[-1] + 1e-6
+
+        message = {
+            "messageID": str(uuid4()),
+            "time": send_time,
+            "type": message_type,
+            "data": body["data"],
+            "channelID": channel.uid,
+            "username": body["username"],
+            "replyID": body.get("replyID"),
+        }
+
+        channel.messages.append(message)
+        channel.times.append(send_time)
+
+        return 200, message, {}
+
+    def _post_messages(self, room: _Room, _: dict[str, str], body: Any) -> _Response:
+        """Stores a text message."""
+
+        return self._store_message(room, body, "text")
+
+    def _post_files(self, room: _Room, _: dict[str, str], body: Any) -> _Response:
+        """Stores a file message."""
+
+        return self._store_message(room, body, "file")
+
+    def _get_messages(self, room: _Room, headers: dict[str, str], _: Any) -> _Response:
+        """Returns messages of a channel, by time or count."""
+
+        channel = room.channels.get(headers["channelid"])
+        if channel is None:
+            return 404, "Channel does not exist.", {}
+
+        if headers.get("get-method") == "count":
+            count = int(headers["count"])
+            return 200, channel.messages[-count:] if count > 0 else [], {}
+
+        start = bisect_right(channel.times, float(headers.get("time") or 0))
+        return 200, channel.messages[start:], {}
+
+
+def _answer(
+    standin: StandInServer, method: str, path: str, headers: dict[str, str], raw: bytes
+) -> tuple[int, bytes, dict[str, str]]:
+    """Decodes a request, answers it, and encodes the response.
+
+    Args:
+        standin: The server answering the request.
+        method: The HTTP method, such as "GET".
+        path: The request target.
+        headers: The request headers, with lowercase names.
+        raw: The request body, as sent.
+
+    Returns:
+        The status code, the body and the headers of the response.
+    """
+
+    codec = headers.get("content-encoding")
+    if raw and codec is not None:
+        raw = decompress(raw, codec)
+
+    try:
+        body = json.loads(raw) if raw else None
+    except ValueError:
+        status, content, extra = 400, "Malformed JSON.", {}
+    else:
+        status, content, extra = standin.respond(method, path, headers, body)
+
+    if status == 304:
+        return status, b"", extra
+
+    return (
+        status,
+        json.dumps(content).encode("utf-8"),
+        {**extra, "Content-Type": "application/json"},
+    )
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers HTTP/1.1 requests using the state of its server."""
+
+    server: _StandInHTTPServer
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        """Counts the connection."""
+
+        super().setup()
+        self.server.standin.count_connection()
+
+    def log_message(self, *_: Any) -> None:  # pylint: disable=arguments-differ
+        """Silences the default request logging."""
+
+    def _handle(self) -> None:
+        """Answers a request."""
+
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        status, data, extra = _answer(
+            self.server.standin, self.command, self.path, headers, raw
+        )
+
+        self.send_response(status)
+
+        for key, value in extra.items():
+            self.send_header(key, value)
+
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class _StandInHTTPServer(ThreadingHTTPServer):
+    """The HTTP/1.1 server of a `StandInServer`."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], standin: StandInServer) -> None:
+        """Initializes the server."""
+
+        self.standin = standin
+        super().__init__(address, _StandInHandler)
+
+
+class _StandInHTTP2Handler(BaseRequestHandler):
+    """Answers the HTTP/2 streams of a connection concurrently, each on a thread."""
+
+    server: _StandInHTTP2Server
+
+    def setup(self) -> None:
+        """Sets up the connection state, and counts the connection."""
+
+        # pylint: disable-next=import-outside-toplevel
+        from h2.connection import H2Connection, H2Configuration
+
+        self.connection = H2Connection(
+            H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        self.condition = Condition()
+        self.streams: dict[int, tuple[dict[str, str], bytearray]] = {}
+        self.closed = False
+
+        self.server.standin.count_connection()
+
+    def _flush(self) -> None:
+        """Sends the pending frames. Must be called with the condition held."""
+
+        data = self.connection.data_to_send()
+        if data:
+            self.request.sendall(data)
+
+    def handle(self) -> None:
+        """Reads frames until the connection is closed, starting complete requests."""
+
+        # pylint: disable-next=import-outside-toplevel
+        from h2 import events
+
+        with self.condition:
+            self.connection.initiate_connection()
+            self._flush()
+
+        try:
+            while not self.closed:
+                data = self.request.recv(65536)
+                if not data:
+                    break
+
+                with self.condition:
+                    for event in self.connection.receive_data(data):
+                        self._on_event(event, events)
+
+                    self._flush()
+
+                    # Wakes up responses waiting for flow control windows
+                    self.condition.notify_all()
+
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+
+    def _on_event(self, event: Any, events: Any) -> None:
+        """Handles a received event. Must be called with the condition held."""
+
+        if isinstance(event, events.RequestReceived):
+            headers = {key.lower(): value for key, value in event.headers}
+            self.streams[event.stream_id] = (headers, bytearray())
+
+        elif isinstance(event, events.DataReceived):
+            self.streams[event.stream_id][1].extend(event.data)
+            self.connection.acknowledge_received_data(
+                event.flow_controlled_length, event.stream_id
+            )
+
+        elif isinstance(event, events.StreamEnded):
+            headers, body = self.streams.pop(event.stream_id)
+            Thread(
+                target=self._respond,
+                args=(event.stream_id, headers, bytes(body)),
+                daemon=True,
+            ).start()
+
+        elif isinstance(event, events.ConnectionTerminated):
+            self.closed = True
+
+    def _respond(self, stream_id: int, headers: dict[str, str], raw: bytes) -> None:
+        """Answers a stream, sending the body as flow control allows."""
+
+        status, data, extra = _answer(
+            self.server.standin, headers[":method"], headers[":path"], headers, raw
+        )
+
+        response_headers = [
+            (":status", str(status)),
+            ("content-length", str(len(data))),
+        ]
+        response_headers += [(key.lower(), value) for key, value in extra.items()]
+
+        with self.condition:
+            if self.closed:
+                return
+
+            self.connection.send_headers(
+                stream_id, response_headers, end_stream=not data
+            )
+            self._flush()
+
+            while data:
+                window = min(
+                    self.connection.local_flow_control_window(stream_id),
+                    self.connection.max_outbound_frame_size,
+                )
+
+                if window <= 0:
+                    self.condition.wait()
+
+                    if self.closed:
+                        return
+
+                    continue
+
+                chunk, data = data[:window], data[window:]
+                self.connection.send_data(stream_id, chunk, end_stream=not data)
+                self._flush()
+
+
+class _StandInHTTP2Server(ThreadingTCPServer):
+    """The HTTP/2 server of a `StandInServer`."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], standin: StandInServer) -> None:
+        """Initializes the server."""
+
+        self.standin = standin
+        super().__init__(address, _StandInHTTP2Handler)
+
+
+def main(argv: list[str]) -> None:
+    """Serves a stand-in server until interrupted."""
+
+    parser = argparse.ArgumentParser(
+        prog="python -m teahaz.standin",
+        description="Run an in-memory stand-in Teahaz server.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--http2", action="store_true", help="serve HTTP/2 without TLS (needs h2)"
+    )
+    args = parser.parse_args(argv)
+
+    server = StandInServer(args.host, args.port, args.latency, args.http2)
+    server.start()
+    print(f"Serving a stand-in Teahaz server at {server.url}")
+
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
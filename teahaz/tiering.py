@@ -0,0 +1,434 @@
+"""The module containing the on-disk segment store backing tiered chat history.
+
+With tiering enabled (see `Chatroom.enable_tiering`), a chatroom only keeps the
+newest messages of each channel as `Message` objects. Older ones are spilled, in
+batches, into a `SegmentStore`: a directory of immutable
+`teahaz.archive.HistoryArchive` files ("segments"), which are memory-mapped when
+read, and can be evicted from memory by the OS at any time.
+
+Spilled batches are written by a background thread, so the poll loop never
+waits for the disk; until then, they are read from memory. Segments are merged
+size-tiered: only adjacent segments of similar size are merged, so each
+message is rewritten a logarithmic amount of times.
+
+Reads go through `Chatroom.history`, which merges the tiers transparently. Only
+a few segments are kept open at once, and the rows of a range are prefetched
+ahead of the reader, so scanning old history is sequential I/O.
+"""
+
+from __future__ import annotations
+
+import os
+import heapq
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from threading import Condition, Lock, Thread
+from collections import OrderedDict
+from typing import Iterable, Iterator, NamedTuple
+
+from .blobs import BlobStore
+from .dataclasses import Message
+from .archive import ArchiveWriter, HistoryArchive, write_archive
+
+__all__ = [
+    "SegmentStore",
+]
+
+SEGMENT_GLOB = "segment-*.tharch"
+
+TEMP_GLOB = ".tmp-*"
+"""Files left behind by writes interrupted by a crash."""
+
+READAHEAD_ROWS = 256
+"""The amount of rows prefetched ahead of a reader."""
+
+
+class _Segment(NamedTuple):
+    """The location & bounds of a segment file."""
+
+    path: Path
+    first: float
+    last: float
+    rows: int
+
+    lowest: int
+    """The id of the oldest segment merged into this one, or its own id."""
+
+    highest: int
+    """The id of the newest segment merged into this one, or its own id."""
+
+    def covers(self, other: _Segment) -> bool:
+        """Determines whether other was merged into this segment."""
+
+        return (
+            self.lowest <= other.lowest
+            and other.highest <= self.highest
+            and self.path != other.path
+        )
+
+
+def _segment_path(directory: Path, lowest: int, highest: int) -> Path:
+    """Returns the path of a segment made of the segments lowest..highest."""
+
+    if lowest == highest:
+        return directory / f"segment-{lowest:08d}.tharch"
+
+    return directory / f"segment-{lowest:08d}-{highest:08d}.tharch"
+
+
+def _segment_ids(path: Path) -> tuple[int, int]:
+    """Returns the lowest & highest segment id in the name of a segment."""
+
+    ids = [int(part) for part in path.stem.split("-")[1:]]
+    return ids[0], ids[-1]
+
+
+def _between(
+    batch: list[Message], start: float | None, end: float | None
+) -> list[Message]:
+    """Returns the messages of a sorted batch sent within `[start, end]`."""
+
+    times = [message.send_time for message in batch]
+    low = 0 if start is None else bisect_left(times, start)
+    high = len(batch) if end is None else bisect_right(times, end)
+
+    return batch[low:high]
+
+
+class SegmentStore:  # pylint: disable=too-many-instance-attributes
+    """A directory of immutable, time-sorted history segments.
+
+    Segments may overlap in time, as channels spill at different rates; reads
+    merge them. The store can be shared by multiple threads, and reopened
+    from its directory later.
+
+    Every segment is named after the ids of the segments merged into it. A
+    crash between writing a merged segment and removing its sources leaves
+    both behind, so the sources are removed when the store is reopened.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        blob_store: BlobStore | None = None,
+        max_open: int = 4,
+        max_segments: int = 32,
+        fanout: int = 4,
+    ) -> None:
+        """Initializes the store, loading any segments already in directory.
+
+        Args:
+            directory: The directory to keep segments in. It is created if needed.
+            blob_store: The store used to resolve file messages into handles.
+            max_open: The maximum amount of segments kept mapped between reads.
+            max_segments: Once there are more segments than this, they are
+                merged in the background.
+            fanout: The amount of adjacent segments merged at once. The ones
+                with the fewest rows are picked, so merged segments are only
+                merged again once their neighbours have grown as large.
+        """
+
+        if fanout < 2:
+            raise ValueError("At least two segments have to be merged at once.")
+
+        self.directory = Path(directory)
+        self.blob_store = blob_store
+        self.max_open = max_open
+        self.max_segments = max_segments
+        self.fanout = fanout
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = Lock()
+        self._idle = Condition(self._lock)
+        self._compact_lock = Lock()
+        self._segments: list[_Segment] = []
+        self._pending: list[list[Message]] = []
+        self._writer: Thread | None = None
+        self._open: OrderedDict[Path, HistoryArchive] = OrderedDict()
+        self._next_id = 0
+
+        for path in self.directory.glob(TEMP_GLOB):
+            path.unlink()
+
+        segments = [
+            self._describe(path) for path in self.directory.glob(SEGMENT_GLOB)
+        ]
+
+        for segment in sorted(segments, key=lambda segment: segment.lowest):
+            self._next_id = max(self._next_id, segment.highest + 1)
+
+            # The sources of a merge interrupted before removing them
+            if any(other.covers(segment) for other in segments):
+                os.unlink(segment.path)
+                continue
+
+            if segment.rows > 0:
+                self._segments.append(segment)
+
+    def __len__(self) -> int:
+        """Returns the count of stored messages, including ones not written yet."""
+
+        with self._lock:
+            return sum(segment.rows for segment in self._segments) + sum(
+                len(batch) for batch in self._pending
+            )
+
+    def __repr__(self) -> str:
+        """Returns a short description of the store."""
+
+        return (
+            f"<SegmentStore of {len(self)} messages in {len(self._segments)}"
+            f" segments at {self.directory}>"
+        )
+
+    @staticmethod
+    def _describe(path: Path) -> _Segment:
+        """Reads the bounds of a segment file."""
+
+        lowest, highest = _segment_ids(path)
+
+        with HistoryArchive(path) as archive:
+            if len(archive) == 0:
+                return _Segment(path, 0.0, 0.0, 0, lowest, highest)
+
+            first, last = archive.send_time[0], archive.send_time[-1]
+            return _Segment(path, first, last, len(archive), lowest, highest)
+
+    def _archive(self, path: Path) -> HistoryArchive:
+        """Returns the mapped archive of a segment, keeping recently used ones open.
+
+        Archives pushed out are not closed, only dropped, so readers still
+        iterating them are not affected; they are unmapped once released.
+
+        This must be called with the lock held, so merges can't remove the
+        segment's file before it is mapped.
+        """
+
+        archive = self._open.get(path)
+
+        if archive is None:
+            archive = self._open[path] = HistoryArchive(path, self.blob_store)
+
+        self._open.move_to_end(path)
+
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+        return archive
+
+    def add(self, messages: Iterable[Message]) -> None:
+        """Queues messages to be written into a new segment.
+
+        They are readable right away, and written by a background thread.
+        """
+
+        messages = sorted(messages, key=lambda message: message.send_time)
+        if not messages:
+            return
+
+        with self._lock:
+            self._pending.append(messages)
+
+            if self._writer is None:
+                self._writer = Thread(
+                    target=self._write_pending,
+                    name=f"SegmentStore({self.directory.name})",
+                    daemon=True,
+                )
+                self._writer.start()
+
+    def _write_pending(self) -> None:
+        """Writes queued batches into segments, compacting them as needed."""
+
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._writer = None
+                    self._idle.notify_all()
+                    return
+
+                messages = self._pending[0]
+                segment_id = self._next_id
+                self._next_id += 1
+
+            path = _segment_path(self.directory, segment_id, segment_id)
+            write_archive(path, messages)
+
+            with self._lock:
+                # Readers see the batch either in memory, or in its segment
+                first, last = messages[0].send_time, messages[-1].send_time
+                self._segments.append(
+                    _Segment(path, first, last, len(messages), segment_id, segment_id)
+                )
+                self._pending.pop(0)
+
+            while self._compact_window():
+                pass
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every queued batch has been written.
+
+        Args:
+            timeout: The maximum seconds to wait for.
+
+        Returns:
+            Whether all batches were written within the timeout.
+        """
+
+        with self._idle:
+            return self._idle.wait_for(lambda: self._writer is None, timeout=timeout)
+
+    def _compact_window(self) -> bool:
+        """Merges the adjacent `fanout` segments with the fewest rows, if needed.
+
+        Returns:
+            Whether segments were merged.
+        """
+
+        with self._lock:
+            segments = self._segments
+            if len(segments) <= self.max_segments:
+                return False
+
+            size = min(self.fanout, len(segments))
+            first = min(
+                range(len(segments) - size + 1),
+                key=lambda index: sum(
+                    segment.rows for segment in segments[index : index + size]
+                ),
+            )
+            window = segments[first : first + size]
+
+        return self._merge(window)
+
+    def compact(self, count: int | None = None) -> None:
+        """Merges segments into one, without decoding their messages.
+
+        Queued batches are written first.
+
+        Args:
+            count: The amount of newest segments to merge. If not set, all
+                segments are merged. Segments are also merged automatically
+                once there are more than `max_segments`, see `fanout`.
+        """
+
+        self.flush()
+
+        with self._lock:
+            first = 0 if count is None else max(0, len(self._segments) - count)
+            segments = self._segments[first:]
+
+        self._merge(segments)
+
+    def _merge(self, segments: list[_Segment]) -> bool:
+        """Replaces adjacent segments with one made of their rows.
+
+        Returns:
+            Whether the segments were merged. They aren't if there are fewer
+            than two of them, or another merge got to them first.
+        """
+
+        if len(segments) < 2:
+            return False
+
+        with self._compact_lock:
+            with self._lock:
+                current = self._segments
+                if segments[0] not in current:
+                    return False
+
+                first = current.index(segments[0])
+                if current[first : first + len(segments)] != segments:
+                    return False
+
+            writer = ArchiveWriter()
+            for segment in segments:
+                with HistoryArchive(segment.path) as archive:
+                    writer.extend_from(archive)
+
+            # The name records the merged ids, see `covers`
+            path = _segment_path(
+                self.directory, segments[0].lowest, segments[-1].highest
+            )
+            writer.write(path)
+            merged = self._describe(path)
+
+            with self._lock:
+                # Only writes append segments, and merges are serialized
+                current = self._segments
+                first = current.index(segments[0])
+                self._segments = (
+                    current[:first] + [merged] + current[first + len(segments) :]
+                )
+
+                for segment in segments:
+                    self._open.pop(segment.path, None)
+
+            # Maps of the removed files stay valid until they are released
+            for segment in segments:
+                os.unlink(segment.path)
+
+        return True
+
+    @staticmethod
+    def _read(
+        archive: HistoryArchive, start: float | None, end: float | None
+    ) -> Iterator[Message]:
+        """Iterates over a segment's messages in `[start, end]`, prefetching ahead."""
+
+        rows = archive.between(start, end)
+
+        for index in rows:
+            # Every block prefetches itself & the next one, which is usually
+            # already under way
+            if (index - rows.start) % READAHEAD_ROWS == 0:
+                ahead = min(index + 2 * READAHEAD_ROWS, rows.stop)
+                archive.prefetch(range(index, ahead))
+
+            yield archive[index]
+
+    def messages(
+        self, start: float | None = None, end: float | None = None
+    ) -> Iterator[Message]:
+        """Iterates over the messages sent within `[start, end]`, in send_time order."""
+
+        with self._lock:
+            segments = [
+                segment
+                for segment in self._segments
+                if (start is None or segment.last >= start)
+                and (end is None or segment.first <= end)
+            ]
+            batches = [_between(batch, start, end) for batch in self._pending]
+
+            # Mapped segments stay readable after merges remove their files
+            archives = [self._archive(segment.path) for segment in segments]
+
+        sources: list[Iterable[Message]] = [
+            self._read(archive, start, end) for archive in archives
+        ]
+        sources.extend(batch for batch in batches if batch)
+
+        if len(sources) == 1:
+            yield from sources[0]
+            return
+
+        yield from heapq.merge(*sources, key=lambda message: message.send_time)
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Writes queued batches, and drops all open segments.
+
+        Args:
+            timeout: The maximum seconds to wait for the writes.
+
+        Returns:
+            Whether all batches were written within the timeout.
+        """
+
+        finished = self.flush(timeout)
+
+        with self._lock:
+            self._open.clear()
+
+        return finished
@@ -0,0 +1,303 @@
+"""The module containing the HTTP transports chatrooms send their requests through.
+
+Every request of a chatroom goes through its `Chatroom.transport`:
+
+- `SessionTransport` (the default) uses the chatroom's `requests.Session`.
+  It speaks HTTP/1.1, so every request in flight to a server needs its own
+  connection.
+- `HTTP2Transport` uses `httpx` over HTTP/2. Its forks share connections, so
+  the polls & sends of all chatrooms on a server are multiplexed over a few
+  sockets, while each chatroom keeps its own cookies. It needs the optional
+  `httpx` package, with its `http2` extra.
+
+`Teacup.use_http2` switches all chatrooms of a Teacup to HTTP/2:
+
+```python3
+from teahaz import Teacup
+
+cup = Teacup()
+cup.use_http2(max_connections=2)
+```
+
+Other transports can be used by subclassing `Transport`, and passing an
+instance to `Chatroom.set_transport`.
+"""
+
+from __future__ import annotations
+
+from threading import Thread
+from typing import TYPE_CHECKING, Any, MutableMapping
+
+if TYPE_CHECKING:
+    from http.cookiejar import CookieJar
+
+    import requests
+
+__all__ = [
+    "Transport",
+    "SessionTransport",
+    "HTTP2Transport",
+]
+
+
+class Transport:
+    """The HTTP layer under `Chatroom._request`.
+
+    Responses have to provide the parts of the `requests.Response` interface
+    the library uses: `status_code`, `headers`, `text` and `json()`.
+    """
+
+    @property
+    def headers(self) -> MutableMapping[str, str]:
+        """The headers sent with every request."""
+
+        raise NotImplementedError
+
+    @property
+    def cookies(self) -> CookieJar:
+        """The cookies stored from responses, and sent with requests."""
+
+        raise NotImplementedError
+
+    def request(self, method: str, url: str, **req_args: Any) -> requests.Response:
+        """Sends a request.
+
+        Args:
+            method: The HTTP method, in lowercase.
+            url: The URL to send the request to.
+            **req_args: Any of `headers` (values of None are left out), `json`,
+                `data` (the raw body) and `timeout`.
+
+        Returns:
+            The response, regardless of its status code.
+        """
+
+        raise NotImplementedError
+
+    def never_sent(self, exception: Exception) -> bool:
+        """Determines whether a request that raised exception never reached the server.
+
+        Such requests can be retried safely, even if they aren't idempotent.
+        Transports that can't tell return False.
+        """
+
+        return False
+
+    def close(self) -> None:
+        """Closes the connections of the transport."""
+
+
+class SessionTransport(Transport):
+    """Sends requests using a `requests.Session`."""
+
+    def __init__(self, session: requests.Session) -> None:
+        """Initializes the transport.
+
+        Args:
+            session: The session to send requests with.
+        """
+
+        self.session = session
+
+    @property
+    def headers(self) -> MutableMapping[str, str]:
+        """The headers of the session."""
+
+        return self.session.headers
+
+    @property
+    def cookies(self) -> CookieJar:
+        """The cookies of the session."""
+
+        return self.session.cookies
+
+    def request(self, method: str, url: str, **req_args: Any) -> requests.Response:
+        """Sends a request. See `Transport.request`.
+
+        Raises:
+            ValueError: Invalid HTTP method was passed.
+        """
+
+        send = getattr(self.session, method, None)
+        if send is None:
+            raise ValueError(f'Session does not have a method for "{method}".')
+
+        return send(url=url, **req_args)
+
+    def never_sent(self, exception: Exception) -> bool:
+        """Determines whether exception was raised before connecting to the server."""
+
+        # pylint: disable=import-outside-toplevel
+        from requests.exceptions import ConnectionError as RequestsConnectionError
+        from urllib3.exceptions import ConnectTimeoutError
+
+        if not isinstance(exception, RequestsConnectionError) or not exception.args:
+            return False
+
+        # Refused & timed out connections, and failed name resolutions
+        reason = getattr(exception.args[0], "reason", exception.args[0])
+        return isinstance(reason, ConnectTimeoutError)
+
+    def close(self) -> None:
+        """Closes the session."""
+
+        self.session.close()
+
+
+def _import_httpx() -> Any:
+    """Imports httpx, making sure its HTTP/2 support is installed.
+
+    Raises:
+        ImportError: httpx or its HTTP/2 support is not installed.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    try:
+        import h2  # pylint: disable=unused-import
+        import httpx
+    except ImportError as error:
+        raise ImportError(
+            "HTTP/2 requires the httpx package with HTTP/2 support,"
+            + ' install it using `pip install "httpx[http2]"`.'
+        ) from error
+
+    return httpx
+
+
+class _EventLoopPool:
+    """An async HTTP/2 connection pool, driven by an event loop on its own thread.
+
+    httpx only multiplexes requests over a connection safely from a single
+    event loop, so the requests of all threads are handed over to it.
+    """
+
+    def __init__(self, transport: Any) -> None:
+        """Initializes the pool, and starts its event loop.
+
+        Args:
+            transport: The `httpx.AsyncHTTPTransport` holding the connections.
+        """
+
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        self.transport = transport
+        self.loop = asyncio.new_event_loop()
+        self._run_threadsafe = asyncio.run_coroutine_threadsafe
+
+        self._thread = Thread(
+            target=self.loop.run_forever, name="HTTP2Transport", daemon=True
+        )
+        self._thread.start()
+
+    def run(self, coroutine: Any) -> Any:
+        """Runs coroutine on the event loop, and returns its result."""
+
+        return self._run_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        """Closes the connections, and stops the event loop."""
+
+        if self.loop.is_closed():
+            return
+
+        self.run(self.transport.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class HTTP2Transport(Transport):
+    """Sends requests over HTTP/2, sharing connections with its forks.
+
+    A transport owns a connection pool; `fork` creates transports using the
+    same pool, but with their own cookies & headers. Concurrent requests are
+    sent as streams over the pooled connections, instead of each taking a
+    connection of its own. The streams of a pool are driven by a single
+    background thread, so requests can be sent from any thread.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 2,
+        cleartext: bool = False,
+        verify: bool = True,
+        pool: Any = None,
+    ) -> None:
+        """Initializes the transport.
+
+        Args:
+            max_connections: The maximum amount of connections in the pool.
+            cleartext: If set, plain `http://` URLs are also spoken to in HTTP/2
+                (with prior knowledge), instead of HTTP/1.1. Over TLS, HTTP/2
+                is negotiated either way. The server has to support this.
+            verify: Whether TLS certificates are verified.
+            pool: The pool of another transport to share. Use `fork` instead of
+                passing this directly.
+
+        Raises:
+            ImportError: httpx or its HTTP/2 support is not installed.
+        """
+
+        httpx = _import_httpx()
+
+        if pool is None:
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            )
+            pool = _EventLoopPool(
+                httpx.AsyncHTTPTransport(
+                    http1=not cleartext, http2=True, verify=verify, limits=limits
+                )
+            )
+
+        self.pool = pool
+        self.client = httpx.AsyncClient(transport=pool.transport)
+
+    @property
+    def headers(self) -> MutableMapping[str, str]:
+        """The headers of this transport. Forks don't share them."""
+
+        return self.client.headers
+
+    @property
+    def cookies(self) -> CookieJar:
+        """The cookies of this transport. Forks don't share them."""
+
+        return self.client.cookies.jar
+
+    def fork(self) -> HTTP2Transport:
+        """Returns a transport using our connections, with its own cookies & headers."""
+
+        return HTTP2Transport(pool=self.pool)
+
+    def request(self, method: str, url: str, **req_args: Any) -> requests.Response:
+        """Sends a request. See `Transport.request`."""
+
+        headers = req_args.get("headers") or {}
+
+        response = self.pool.run(
+            self.client.request(
+                method.upper(),
+                url,
+                headers={
+                    key: value for key, value in headers.items() if value is not None
+                },
+                json=req_args.get("json"),
+                content=req_args.get("data"),
+                timeout=req_args.get("timeout"),
+            )
+        )
+
+        return response  # type: ignore
+
+    def never_sent(self, exception: Exception) -> bool:
+        """Determines whether exception was raised before connecting to the server."""
+
+        httpx = _import_httpx()
+        return isinstance(exception, (httpx.ConnectError, httpx.ConnectTimeout))
+
+    def close(self) -> None:
+        """Closes the connection pool, shared with all forks."""
+
+        self.pool.close()
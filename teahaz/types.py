@@ -1,15 +1,20 @@
 """The module containing the common types used by the library."""
 
-from typing import Callable, Union, Any, Dict
+from __future__ import annotations
 
-import requests
+from typing import TYPE_CHECKING, Callable, Union, Any, Dict, List
 
 from .dataclasses import Message
 
+if TYPE_CHECKING:
+    import requests
+
 MessageCallback = Callable[[Message], Any]
 
+BatchCallback = Callable[[List[Message]], Any]
+
 ErrorCallback = Callable[
-    [requests.Response, str, Dict[str, Any]],
+    ["requests.Response", str, Dict[str, Any]],
     Any,
 ]
 
@@ -0,0 +1,397 @@
+"""Benchmarks for the performance-sensitive parts of the library.
+
+Run with `python3 tests/benchmark.py [section ...]`. Without arguments, every
+section is run.
+"""
+
+import sys
+import json
+import random
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from os import urandom
+from base64 import b64encode
+from time import perf_counter
+from typing import Callable
+
+from teahaz.crypto import WORKERS, RoomCipher
+from teahaz.dataclasses import Message
+from teahaz.archive import HistoryArchive, write_archive
+from teahaz.messagelog import MessageLog
+from teahaz.compression import available_codecs, compress
+
+PAYLOAD_SIZES = [64, 1024, 16 * 1024, 256 * 1024]
+
+
+def measure(callback: Callable[[], object], duration: float = 0.5) -> float:
+    """Returns how many times callback can be called per second."""
+
+    count = 0
+    start = perf_counter()
+
+    while (elapsed := perf_counter() - start) < duration:
+        callback()
+        count += 1
+
+    return count / elapsed
+
+
+def report(name: str, value: float, unit: str) -> None:
+    """Prints an aligned result line."""
+
+    print(f"{name:<40} {value:>14,.1f} {unit}")
+
+
+def bench_crypto() -> None:
+    """Benchmark: encryption & decryption throughput per payload size."""
+
+    cipher = RoomCipher.from_secret("benchmark-secret", "benchmark-chatroom")
+
+    for size in PAYLOAD_SIZES:
+        plaintext = urandom(size)
+        payload = cipher.encrypt(plaintext)
+        batch = [cipher.encrypt(plaintext) for _ in range(64)]
+
+        report(f"encrypt {size}B", measure(lambda: cipher.encrypt(plaintext)), "msg/s")
+        report(f"decrypt {size}B", measure(lambda: cipher.decrypt(payload)), "msg/s")
+
+        # A batch doesn't fit in the cache like a single payload, so the pool
+        # is compared to decrypting the same batch one by one
+        report(
+            f"decrypt {size}B (x64, one by one)",
+            64 * measure(lambda: [cipher.decrypt(payload) for payload in batch]),
+            "msg/s",
+        )
+        report(
+            f"decrypt_many {size}B (x64, {WORKERS} workers)",
+            64 * measure(lambda: cipher.decrypt_many(batch)),
+            "msg/s",
+        )
+
+
+IMPORT_GUARDS = {
+    "import teahaz": ["teahaz.dataclasses", "teahaz.client"],
+    "import teahaz; teahaz.Invite; teahaz.Message": ["teahaz.client"],
+    "import teahaz; teahaz.Teacup": [],
+}
+"""Statements to measure, and the package modules they must not import.
+
+None of them may import the HTTP stack, `cryptography` or the optional
+backends, which are only needed once a feature using them is enabled."""
+
+HEAVY_MODULES = [
+    "requests",
+    "urllib3",
+    "cryptography",
+    "httpx",
+    "h2",
+    "numpy",
+    "multiprocessing",
+    "sqlite3",
+]
+
+FAILURES: list = []
+"""The guards that failed, reported once every section has run."""
+
+
+def import_times(code: str) -> dict:
+    """Runs code in a fresh interpreter, returning cumulative import times.
+
+    Only modules imported directly by `code` (not by other modules) are
+    returned, so the values can be summed.
+    """
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        times[name[1:]] = int(cumulative)
+
+    return times
+
+
+def imported_modules(code: str) -> set:
+    """Runs code in a fresh interpreter, returning the modules it imported."""
+
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; before = set(sys.modules)\n"
+            + code
+            + "\nprint('\\n'.join(set(sys.modules) - before))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return set(process.stdout.split())
+
+
+def bench_import() -> None:
+    """Benchmark: import time of the package, guarding its lazy imports.
+
+    Times are compared to `import requests`, which every `Chatroom` needs
+    anyway; they vary too much between machines to be guarded. The guards
+    check which modules are imported instead.
+    """
+
+    baseline = import_times("pass")
+    requests_time = import_times("import requests")["requests"]
+    report("import requests (reference)", requests_time, "us")
+
+    for code, forbidden in IMPORT_GUARDS.items():
+        times = import_times(code)
+        added = {name: value for name, value in times.items() if name not in baseline}
+
+        total = sum(value for name, value in added.items() if not name.startswith(" "))
+        report(code, total, "us")
+        report("  relative to import requests", 100 * total / requests_time, "%")
+
+        imported = imported_modules(code)
+        for module in forbidden + HEAVY_MODULES:
+            if module in imported:
+                FAILURES.append(f"{code!r} imported {module}")
+
+
+def message_body(data: bytes) -> bytes:
+    """Returns the JSON body `Chatroom.send` would post for data."""
+
+    return json.dumps(
+        {
+            "username": "benchmark",
+            "channelID": "00000000-0000-0000-0000-000000000000",
+            "replyID": None,
+            "data": b64encode(data).decode("ascii"),
+        }
+    ).encode("utf-8")
+
+
+def bench_compression() -> None:
+    """Benchmark: compression ratio & throughput of request bodies.
+
+    Text bodies are made of random dictionary words, file bodies of random
+    bytes (the worst case, as they only gain from undoing base64).
+    """
+
+    words = [bytes(random.choices(b"abcdefghijklmnopqrstuvwxyz", k=6)) for _ in range(500)]
+    bodies = {
+        "text 1KB": message_body(b" ".join(random.choices(words, k=150))),
+        "text 64KB": message_body(b" ".join(random.choices(words, k=9000))),
+        "file 256KB": message_body(urandom(256 * 1024)),
+        "history 100x1KB": json.dumps(
+            [json.loads(message_body(b" ".join(random.choices(words, k=150)))) for _ in range(100)]
+        ).encode("utf-8"),
+    }
+
+    for name, body in bodies.items():
+        for codec in available_codecs():
+            for level in [1, None, 9]:
+                compressed = compress(body, codec, level)
+                speed = measure(lambda: compress(body, codec, level)) * len(body) / 1e6
+
+                report(
+                    f"{name} {codec} level={level or 'default'}",
+                    100 * len(compressed) / len(body),
+                    f"% of {len(body):,}B @ {speed:,.1f} MB/s",
+                )
+
+
+def bench_archive(rows: int = 200_000) -> None:
+    """Benchmark: opening & querying a history archive, compared to JSON."""
+
+    messages = [
+        Message(
+            uid=f"{index:032x}",
+            send_time=1_600_000_000 + index,
+            message_type="text",
+            data="lorem ipsum dolor sit amet " * 4,
+            channel_id=f"channel-{index % 8}",
+            username=f"user-{index % 50}",
+        )
+        for index in range(rows)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        archivepath = Path(directory) / "history.tharch"
+        jsonpath = Path(directory) / "messages.json"
+
+        start = perf_counter()
+        write_archive(archivepath, messages)
+        report(f"write archive ({rows:,} rows)", perf_counter() - start, "s")
+
+        jsonpath.write_text(json.dumps([message.__dict__ for message in messages]))
+        report("open archive", 1e6 / measure(lambda: HistoryArchive(archivepath).close()), "us")
+        report("load JSON", 1 / measure(lambda: json.loads(jsonpath.read_text()), 2), "s")
+
+        with HistoryArchive(archivepath) as archive:
+            middle = 1_600_000_000 + rows // 2
+            report(
+                "range query (100 rows)",
+                measure(lambda: list(archive.messages(middle, middle + 99))),
+                "query/s",
+            )
+
+
+def bench_messagelog(size: int = 100_000) -> None:
+    """Benchmark: MessageLog appends & snapshots, compared to copying a list."""
+
+    messages = [object() for _ in range(size)]
+    log = MessageLog(messages)
+
+    report(f"list copy ({size:,})", measure(lambda: list(messages)), "op/s")
+    report(f"MessageLog.snapshot ({size:,})", measure(log.snapshot), "op/s")
+    report("list append", measure(lambda: messages.append(None)), "op/s")
+    report("MessageLog.append", measure(lambda: log.append(None)), "op/s")
+    report(f"MessageLog iterate ({size:,})", measure(lambda: sum(1 for _ in log)), "op/s")
+    report("MessageLog index", measure(lambda: log[size // 2]), "op/s")
+
+    # Polls seal a chunk every CHUNK_SIZE messages, however large the log is
+    large = MessageLog(messages[:size] * 10)
+    batch = messages[:300]
+    report(
+        f"MessageLog.extend (300, {len(large):,})",
+        measure(lambda: large.extend(batch)),
+        "op/s",
+    )
+
+
+def bench_analytics(rows: int = 200_000) -> None:
+    """Benchmark: MessageTable aggregations, compared to looping over messages."""
+
+    try:
+        from teahaz.analytics import MessageTable
+
+        table = MessageTable()
+    except ImportError:
+        print("numpy is not installed, skipping")
+        return
+
+    messages = [
+        Message(
+            uid=f"{index:032x}",
+            send_time=1_600_000_000 + index * 7.5,
+            message_type="text",
+            data="lorem ipsum",
+            channel_id=f"channel-{index % 8}",
+            username=f"user-{random.randrange(500)}",
+        )
+        for index in range(rows)
+    ]
+
+    def loop_top_users() -> list:
+        counts: dict = {}
+        for message in messages:
+            counts[message.username] = counts.get(message.username, 0) + 1
+
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:10]
+
+    start = perf_counter()
+    table.extend(messages)
+    report(f"build table ({rows:,} rows)", perf_counter() - start, "s")
+
+    report("top users, Python loop", measure(loop_top_users), "op/s")
+    report("top users, MessageTable", measure(table.top_users), "op/s")
+    report("hourly histogram, MessageTable", measure(table.histogram), "op/s")
+    report("channel counts, MessageTable", measure(table.channel_counts), "op/s")
+
+
+def bench_transport(chatrooms: int = 32, duration: float = 2.0) -> None:
+    """Benchmark: concurrent polls of many chatrooms over HTTP/1.1 & HTTP/2.
+
+    Every chatroom polls a stand-in server from its own thread. The stand-in
+    holds each response back for 5ms, so requests overlap like they do
+    against a remote server.
+    """
+
+    from teahaz import Teacup
+    from teahaz.standin import StandInServer
+
+    def run(http2: bool) -> None:
+        name = "HTTP/2 (httpx)" if http2 else "HTTP/1.1 (requests)"
+
+        with StandInServer(latency=0.005, http2=http2) as server:
+            cup = Teacup()
+            if http2:
+                cup.use_http2(max_connections=2, cleartext=True)
+
+            owner = cup.create_chatroom(server.url, "benchmark", "user-0", "password")
+            invite = owner.create_invite(uses=chatrooms)
+            rooms = [owner] + [
+                cup.use_invite(invite, f"user-{index}", "password")
+                for index in range(1, chatrooms)
+            ]
+
+            polls = dict.fromkeys(range(len(rooms)), 0)
+            stop = threading.Event()
+
+            def poll(index: int) -> None:
+                while not stop.is_set():
+                    rooms[index].get_since(0)
+                    polls[index] += 1
+
+            threads = [threading.Thread(target=poll, args=(index,)) for index in polls]
+
+            start = perf_counter()
+            for thread in threads:
+                thread.start()
+
+            stop.wait(duration)
+            stop.set()
+
+            for thread in threads:
+                thread.join()
+
+            elapsed = perf_counter() - start
+
+            report(f"{name}, polls", sum(polls.values()) / elapsed, "req/s")
+            report(f"{name}, connections", server.connections, "sockets")
+
+            cup.use_http2(False)
+
+    run(http2=False)
+
+    try:
+        run(http2=True)
+    except ImportError:
+        print("httpx or h2 is not installed, skipping HTTP/2")
+
+
+SECTIONS = {
+    "crypto": bench_crypto,
+    "import": bench_import,
+    "compression": bench_compression,
+    "archive": bench_archive,
+    "messagelog": bench_messagelog,
+    "analytics": bench_analytics,
+    "transport": bench_transport,
+}
+
+
+def main(argv: list) -> None:
+    """Main method"""
+
+    for name in argv or SECTIONS:
+        print(f"== {name} ==")
+        SECTIONS[name]()
+
+    if FAILURES:
+        print("== failures ==")
+        print("\n".join(FAILURES))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+"""Shared fixtures for the test suite.
+
+Tests talk to a `teahaz.standin.StandInServer`, so they run offline.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Iterator
+
+import pytest
+
+from teahaz import Teacup
+from teahaz.standin import StandInServer
+
+
+@pytest.fixture
+def server() -> Iterator[StandInServer]:
+    """A running stand-in server."""
+
+    with StandInServer() as standin:
+        yield standin
+
+
+@pytest.fixture
+def teacup() -> Iterator[Teacup]:
+    """A Teacup, whose chatrooms are stopped after the test."""
+
+    cup = Teacup()
+    yield cup
+    assert cup.stop(timeout=10)
+
+
+@pytest.fixture(autouse=True)
+def no_leaked_threads() -> Iterator[None]:
+    """Fails tests that leave non-daemon threads running."""
+
+    before = set(threading.enumerate())
+    yield
+
+    leaked = [
+        thread
+        for thread in threading.enumerate()
+        if thread not in before and not thread.daemon and thread.is_alive()
+    ]
+
+    for thread in leaked:
+        thread.join(5)
+
+    assert not [thread.name for thread in leaked if thread.is_alive()]
@@ -0,0 +1,114 @@
+"""Tests for `teahaz.analytics`."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz import Event
+from teahaz.dataclasses import Message, SystemEvent
+
+numpy = pytest.importorskip("numpy")
+
+# pylint: disable-next=wrong-import-position
+from teahaz.analytics import HOUR, MessageTable
+
+
+def _message(send_time, user, channel="general", data="hello", message_type="text"):
+    return Message(
+        uid=f"{user}-{send_time}",
+        send_time=send_time,
+        message_type=message_type,
+        data=data,
+        channel_id=channel,
+        username=user,
+    )
+
+
+@pytest.fixture
+def table():
+    return MessageTable(
+        [
+            _message(0.5 * HOUR, "alice"),
+            _message(0.6 * HOUR, "alice", "random", "hey"),
+            _message(2.5 * HOUR, "bob", data=b"\0" * 10, message_type="file"),
+            _message(2.6 * HOUR, "alice"),
+            _message(
+                3.0 * HOUR, None, None, SystemEvent("user_joined", {}), "system"
+            ),
+        ],
+        capacity=2,
+    )
+
+
+def test_rows_hold_codes_and_lengths(table):
+    assert len(table) == 5
+    assert table.users == ["alice", "bob", None]
+    assert table.channels == ["general", "random", None]
+    assert list(table.rows["length"]) == [5, 3, 10, 5, 0]
+
+    with pytest.raises(ValueError):
+        table.rows["length"][0] = 1
+
+
+def test_filters_select_rows(table):
+    assert len(table.select(user="alice")) == 3
+    assert len(table.select(user="alice", channel="general")) == 2
+    assert len(table.select(start=HOUR, end=2.6 * HOUR)) == 2
+    assert len(table.select(message_type="file")) == 1
+    assert len(table.select(user="missing")) == 0
+
+
+def test_aggregations(table):
+    starts, counts = table.histogram(HOUR, message_type="text")
+    assert list(starts) == [0, HOUR, 2 * HOUR]
+    assert list(counts) == [2, 0, 1]
+
+    hours = table.busiest_hours(utc_offset=HOUR)
+    assert hours[1] == 2 and hours[3] == 2 and hours[4] == 1 and hours.sum() == 5
+
+    assert table.top_users(1) == [("alice", 3)]
+    assert table.top_users(message_type="file") == [("bob", 1)]
+    assert table.channel_counts(user="alice") == {"general": 2, "random": 1}
+    assert table.total_length() == 23
+    assert table.user_rates(per=HOUR, user="alice") == {
+        "alice": pytest.approx(3 / 2.1)
+    }
+
+
+def test_empty_selections(table):
+    starts, counts = table.histogram(user="missing")
+    assert len(starts) == len(counts) == 0
+
+    assert table.busiest_hours(user="missing").sum() == 0
+    assert table.top_users(user="missing") == []
+    assert table.user_rates(user="missing") == {}
+
+
+def test_snapshots_survive_appends(table):
+    snapshot = table.rows
+
+    table.extend(_message(10 * HOUR + index, "carol") for index in range(100))
+
+    assert len(snapshot) == 5 and len(table) == 105
+    assert list(snapshot["user"]) == [0, 0, 1, 0, 2]
+
+
+def test_chatrooms_keep_their_table_up_to_date(server, teacup):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.interval = 0.05
+    chatroom.send("before")
+    chatroom.messages = chatroom.get_count(10)
+
+    table = chatroom.enable_analytics()
+    assert len(table) == 1
+
+    received = threading.Event()
+    chatroom.subscribe(Event.MSG_NEW, lambda _: received.set())
+    chatroom.send("after")
+
+    assert received.wait(5)
+    assert chatroom.stop(timeout=3)
+    assert table.top_users() == [("owner", 2)]
+    assert table.total_length() == len("before") + len("after")
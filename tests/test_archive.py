@@ -0,0 +1,108 @@
+"""Tests for `teahaz.archive`, and dumps written into archives."""
+
+from __future__ import annotations
+
+import pytest
+
+from teahaz import Teacup
+from teahaz.archive import ARCHIVE_NAME, HistoryArchive, write_archive
+from teahaz.blobs import BlobStore
+from teahaz.dataclasses import Message, SystemEvent
+
+
+def _message(index, data=None, message_type="text", channel="general"):
+    return Message(
+        uid=f"message-{index}",
+        send_time=float(index),
+        message_type=message_type,
+        data=f"message {index}" if data is None else data,
+        channel_id=channel,
+        username=f"user-{index % 2}",
+    )
+
+
+def test_messages_round_trip(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    messages = [
+        _message(0),
+        _message(1, b"\x00\xff raw"),
+        _message(2, store.put(b"file"), "file"),
+        _message(3, SystemEvent("user_joined", {"username": "guest"}), "system", None),
+    ]
+    write_archive(tmp_path / ARCHIVE_NAME, messages)
+
+    with HistoryArchive(tmp_path / ARCHIVE_NAME, store) as archive:
+        assert len(archive) == 4
+        assert list(archive) == messages
+        assert archive[-1] == messages[-1]
+        assert archive[2].data.read() == b"file"
+        assert archive.channels == ["general", None]
+
+        with pytest.raises(IndexError):
+            archive[4]  # pylint: disable=pointless-statement
+
+
+def test_rows_are_sorted_and_searched_by_time(tmp_path):
+    write_archive(tmp_path / ARCHIVE_NAME, [_message(index) for index in (3, 0, 2, 1)])
+
+    with HistoryArchive(tmp_path / ARCHIVE_NAME) as archive:
+        assert list(archive.send_time) == [0.0, 1.0, 2.0, 3.0]
+        assert archive.between(1, 2) == range(1, 3)
+        assert archive.between(start=2.5) == range(3, 4)
+        assert archive.between(5, 6) == range(4, 4)
+        assert [message.uid for message in archive.messages(end=1)] == [
+            "message-0",
+            "message-1",
+        ]
+
+
+def test_archives_are_extended_in_place(tmp_path):
+    path = tmp_path / ARCHIVE_NAME
+    write_archive(path, [_message(index) for index in range(3)])
+
+    with HistoryArchive(path) as base:
+        write_archive(path, [_message(3, channel="random")], base=base)
+
+    with HistoryArchive(path) as archive:
+        assert [message.uid for message in archive] == [
+            f"message-{index}" for index in range(4)
+        ]
+        assert archive[3].channel_id == "random"
+
+
+def test_other_files_are_rejected(tmp_path):
+    (tmp_path / "other").write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        HistoryArchive(tmp_path / "other")
+
+
+def test_dumps_keep_history_in_archives(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    for index in range(3):
+        chatroom.send(f"message {index}")
+
+    chatroom.messages = chatroom.get_count(10)
+    teacup.dump_to(tmp_path, archive=True)
+
+    [directory] = [path for path in tmp_path.iterdir() if path.is_dir()]
+    assert (directory / ARCHIVE_NAME).is_file()
+
+    restored = Teacup.from_dump(tmp_path)
+    [copy] = restored.chatrooms
+
+    assert len(copy.archive) == 3
+    assert [message.data for message in copy.history()] == [
+        f"message {index}" for index in range(3)
+    ]
+
+    copy.messages = [_message(10**10, "newer", channel=copy.channels.first().uid)]
+    restored.dump_to(tmp_path)
+
+    reloaded = Teacup.from_dump(tmp_path)
+    assert [message.data for message in reloaded.chatrooms[0].history()] == [
+        "message 0",
+        "message 1",
+        "message 2",
+        "newer",
+    ]
@@ -0,0 +1,125 @@
+"""Tests for batch event subscriptions."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz import Event
+
+
+@pytest.fixture
+def chatroom(server, teacup):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.interval = 0.05
+
+    return chatroom
+
+
+class _Batches:
+    """A batch callback, recording the data of each batch."""
+
+    def __init__(self, expected):
+        self.batches = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, batch):
+        self.batches.append([message.data for message in batch])
+        if sum(map(len, self.batches)) >= self.expected:
+            self.done.set()
+
+
+def _polled(chatroom, count):
+    """Returns an event set once count messages were polled by chatroom."""
+
+    polled = threading.Event()
+    received = []
+
+    def _on_message(message):
+        received.append(message)
+        if len(received) == count:
+            polled.set()
+
+    chatroom.subscribe(Event.MSG_NEW, _on_message)
+    return polled
+
+
+def test_only_message_events_are_batched(chatroom):
+    with pytest.raises(ValueError):
+        chatroom.subscribe_batch(Event.CHANNEL_NEW, print)
+
+    with pytest.raises(ValueError):
+        chatroom.subscribe_batch(Event.MSG_NEW, print, max_batch=0)
+
+
+def test_messages_are_delivered_in_full_batches(chatroom):
+    batches = _Batches(25)
+    polled = _polled(chatroom, 25)
+    chatroom.subscribe_batch(Event.MSG_NEW, batches, max_batch=10)
+    assert chatroom.stop(timeout=3)
+
+    for index in range(25):
+        chatroom.send(f"message {index}")
+
+    chatroom.start()
+
+    assert batches.done.wait(5)
+    assert polled.wait(5)
+    assert [len(batch) for batch in batches.batches] == [10, 10, 5]
+    assert sum(batches.batches, []) == [f"message {index}" for index in range(25)]
+
+
+def test_messages_are_held_back_up_to_max_delay(chatroom):
+    batches = _Batches(2)
+    polled = _polled(chatroom, 1)
+    chatroom.subscribe_batch(Event.MSG_NEW, batches, max_delay=0.5)
+
+    chatroom.send("first")
+    assert polled.wait(5)
+
+    chatroom.send("second")
+
+    assert batches.done.wait(5)
+    assert batches.batches == [["first", "second"]]
+
+
+def test_draining_delivers_buffered_messages(chatroom):
+    batches = _Batches(1)
+    polled = _polled(chatroom, 1)
+    chatroom.subscribe_batch(Event.MSG_NEW, batches, max_delay=60)
+
+    chatroom.send("hello")
+    assert polled.wait(5)
+    assert not batches.batches
+
+    assert chatroom.stop(timeout=3, drain=True)
+    assert batches.batches == [["hello"]]
+
+
+def test_resubscribing_keeps_buffered_messages(chatroom):
+    replaced, batches = _Batches(1), _Batches(1)
+    polled = _polled(chatroom, 1)
+    chatroom.subscribe_batch(Event.MSG_NEW, replaced, max_delay=60)
+
+    chatroom.send("hello")
+    assert polled.wait(5)
+
+    chatroom.subscribe_batch(Event.MSG_NEW, batches)
+
+    assert batches.done.wait(5)
+    assert batches.batches == [["hello"]]
+    assert not replaced.batches
+
+
+def test_global_batch_listeners_reach_new_chatrooms(server, teacup):
+    batches = _Batches(1)
+    teacup.subscribe_batch_all(Event.MSG_NEW, batches)
+
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.interval = 0.05
+    chatroom.send("hello")
+
+    assert batches.done.wait(5)
+    assert batches.batches == [["hello"]]
@@ -0,0 +1,85 @@
+"""Tests for `teahaz.blobs`, and file messages kept in blob stores."""
+
+from __future__ import annotations
+
+import hashlib
+
+from teahaz import Teacup
+from teahaz.blobs import BlobHandle, BlobStore
+
+
+def test_blobs_are_stored_by_content(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+
+    handle = store.put(b"content")
+    digest = hashlib.sha256(b"content").hexdigest()
+
+    assert handle == BlobHandle(digest, 7, tmp_path / "blobs" / digest[:2] / digest[2:])
+    assert digest in store
+    assert store.put(b"content") == handle
+    assert store.get(digest) == handle
+    assert handle.read() == b"content"
+    assert bytes(handle.view()) == b"content"
+
+    assert [path.name for path in handle.path.parent.iterdir()] == [digest[2:]]
+
+
+def test_missing_and_empty_blobs(tmp_path):
+    store = BlobStore(tmp_path)
+
+    assert store.get("0" * 64) is None
+    assert "0" * 64 not in store
+
+    empty = store.put(b"")
+    assert empty.size == 0
+    assert bytes(empty.view()) == b""
+
+
+def test_file_messages_are_stored_once(server, tmp_path):
+    teacup = Teacup(blob_root=tmp_path / "blobs")
+
+    try:
+        first = teacup.create_chatroom(server.url, "first", "owner", "password")
+        second = teacup.create_chatroom(server.url, "second", "owner", "password")
+
+        for chatroom in (first, second):
+            chatroom.send(b"file content")
+            chatroom.send("text")
+
+        received = [chatroom.get_count(10) for chatroom in (first, second)]
+
+    finally:
+        assert teacup.stop(timeout=10)
+
+    for messages in received:
+        handle, text = (message.data for message in messages)
+
+        assert isinstance(handle, BlobHandle)
+        assert handle.read() == b"file content"
+        assert text == "text"
+
+    assert received[0][0].data == received[1][0].data
+    assert len(list((tmp_path / "blobs").glob("*/*"))) == 1
+
+
+def test_dumps_refer_to_blobs(server, tmp_path):
+    teacup = Teacup(blob_root=tmp_path / "blobs")
+
+    try:
+        chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+        chatroom.send(b"file content")
+        chatroom.messages = chatroom.get_count(10)
+
+        teacup.dump_to(tmp_path / "dump")
+    finally:
+        assert teacup.stop(timeout=10)
+
+    assert b"file content" not in b"".join(
+        path.read_bytes() for path in (tmp_path / "dump").rglob("*") if path.is_file()
+    )
+
+    restored = Teacup.from_dump(tmp_path / "dump")
+    [message] = restored.chatrooms[0].messages
+
+    assert isinstance(message.data, BlobHandle)
+    assert message.data.read() == b"file content"
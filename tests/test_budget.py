@@ -0,0 +1,142 @@
+"""Tests for `teahaz.budget`, and the request budgets of Teacups."""
+
+from __future__ import annotations
+
+import threading
+from time import perf_counter
+
+import pytest
+
+from teahaz import Event
+from teahaz.budget import Priority, RequestBudget
+
+# Budgets barely refill at this rate, so every token taken is visible
+STILL = 0.0001
+
+
+def _taken(budget, priority):
+    """Returns how many tokens priority can take right away."""
+
+    taken = 0
+    while budget.reserve_for(priority) == 0:
+        taken += 1
+
+    return taken
+
+
+@pytest.mark.parametrize(
+    "priority, taken",
+    [(Priority.NORMAL, 6), (Priority.ARCHIVAL, 4)],
+)
+def test_lower_priorities_leave_a_reserve(priority, taken):
+    budget = RequestBudget(STILL, burst=8)
+
+    assert _taken(budget, priority) == taken
+    assert budget.reserve_for(priority) > 0
+    assert budget.pressure == pytest.approx(taken / 8)
+
+    # The reserve is left for interactive requests
+    assert _taken(budget, Priority.INTERACTIVE) == 8 - taken
+
+
+def test_interactive_requests_wait_for_the_next_token():
+    budget = RequestBudget(20, burst=2)
+    _taken(budget, Priority.INTERACTIVE)
+
+    started = perf_counter()
+    assert budget.acquire(Priority.INTERACTIVE)
+    assert budget.acquire(Priority.INTERACTIVE)
+
+    assert 0.05 < perf_counter() - started < 0.5
+    assert budget.pressure == pytest.approx(1, abs=0.05)
+
+
+def test_waits_are_interrupted_by_stopping():
+    budget = RequestBudget(STILL, burst=4)
+    _taken(budget, Priority.NORMAL)
+
+    stop = threading.Event()
+    threading.Timer(0.05, stop.set).start()
+
+    assert not budget.acquire(Priority.NORMAL, stop)
+    assert budget.pressure == pytest.approx(1, abs=0.001)
+
+    # Requests sent without waiting still take their tokens
+    assert not budget.acquire(Priority.NORMAL, stop)
+    assert not budget.acquire(Priority.ARCHIVAL, stop)
+    assert budget.reserve_for(Priority.INTERACTIVE) > 2 / STILL
+
+
+def test_poll_intervals_stretch_under_pressure():
+    budget = RequestBudget(STILL, burst=4)
+    assert budget.stretch(Priority.ARCHIVAL) == pytest.approx(1)
+
+    _taken(budget, Priority.INTERACTIVE)
+
+    assert budget.stretch(Priority.INTERACTIVE) == 1
+    assert budget.stretch(Priority.NORMAL) == pytest.approx(4)
+    assert budget.stretch(Priority.ARCHIVAL) == pytest.approx(16)
+
+
+def test_overload_halves_the_rate():
+    budget = RequestBudget(8, burst=4)
+
+    budget.feedback(429)
+    budget.feedback(503)
+    assert budget.rate == 2
+
+    budget.feedback(404)
+    assert budget.rate == pytest.approx(2.8)
+
+    for _ in range(20):
+        budget.feedback(200)
+
+    assert budget.rate == 8
+
+
+def test_chatrooms_of_an_origin_share_a_budget(server, teacup):
+    first = teacup.create_chatroom(server.url, "first", "owner", "password")
+    teacup.set_request_budget(STILL, burst=40)
+    second = teacup.create_chatroom(server.url, "second", "owner", "password")
+
+    assert first.budget is second.budget is teacup.budgets[server.url]
+    pressure = first.budget.pressure
+
+    first.send("hello")
+    second.send("hello")
+    assert first.budget.pressure == pytest.approx(pressure + 2 / 40, abs=0.001)
+
+    teacup.set_request_budget(10, burst=5, url="http://other:1")
+    assert first.budget is teacup.budgets[server.url]
+    assert teacup.budgets["http://other:1"].burst == 5
+
+
+def test_overloaded_servers_slow_chatrooms_down(server, teacup, monkeypatch):
+    teacup.set_request_budget(8, burst=40)
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    teacup.subscribe_all(Event.ERROR, lambda *_: None)
+
+    respond = server.respond
+    monkeypatch.setattr(
+        server,
+        "respond",
+        lambda method, *args: (503, "Overloaded.", {})
+        if method == "POST"
+        else respond(method, *args),
+    )
+
+    assert chatroom.send("hello") is None
+    assert chatroom.budget.rate == 4
+
+
+def test_stopped_chatrooms_stay_within_the_budget(server, teacup):
+    teacup.set_request_budget(STILL, burst=40)
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    assert chatroom.stop(timeout=3)
+
+    _taken(chatroom.budget, Priority.NORMAL)
+    pressure = chatroom.budget.pressure
+
+    chatroom.send("hello")
+    chatroom.send("hello")
+    assert chatroom.budget.pressure == pytest.approx(pressure + 2 / 40, abs=0.001)
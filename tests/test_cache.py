@@ -0,0 +1,160 @@
+"""Tests for `teahaz.cache`, and the cached metadata of chatrooms."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz.cache import NOT_MODIFIED, MetadataCache
+
+
+class _Server:
+    """A fetch function, answering like a server with ETags would."""
+
+    def __init__(self, value="value", etag='"1"'):
+        self.value = value
+        self.etag = etag
+        self.calls = []
+
+    def __call__(self, etag):
+        self.calls.append(etag)
+
+        if etag is not None and etag == self.etag:
+            return NOT_MODIFIED
+
+        return self.value, self.etag
+
+
+def test_values_are_kept_for_their_ttl():
+    cache = MetadataCache(ttl=60, ttls={"short": 0})
+    fetch = _Server(["value"])
+
+    first = cache.get("long", fetch)
+    assert cache.get("long", fetch) is first
+    assert fetch.calls == [None]
+
+    cache.get("short", fetch)
+    cache.get("short", fetch)
+    assert fetch.calls == [None, None, '"1"']
+
+
+def test_unmodified_values_keep_their_identity():
+    cache = MetadataCache(ttl=60)
+    fetch = _Server(["value"])
+    first = cache.get("key", fetch)
+
+    cache.invalidate("key")
+    assert cache.get("key", fetch) is first
+
+    fetch.value, fetch.etag = ["changed"], '"2"'
+    cache.invalidate()
+    assert cache.get("key", fetch) == ["changed"]
+    assert fetch.calls == [None, '"1"', '"1"']
+
+    cache.clear()
+    cache.get("key", fetch)
+    assert fetch.calls[-1] is None
+
+
+def test_failed_fetches_are_not_cached():
+    cache = MetadataCache(ttl=60)
+
+    assert cache.get("key", lambda _: None) is None
+    assert cache.get("key", lambda _: NOT_MODIFIED) is None
+    assert cache.get("key", _Server()) == "value"
+
+
+def test_concurrent_callers_share_a_fetch():
+    cache = MetadataCache(ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def _fetch(_):
+        calls.append(None)
+        release.wait(5)
+        return "value", None
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("key", _fetch)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+
+    threading.Event().wait(0.1)
+    release.set()
+
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 4
+    assert len(calls) == 1
+
+
+def test_exceptions_reach_every_caller():
+    cache = MetadataCache(ttl=60)
+    release = threading.Event()
+
+    def _fetch(_):
+        release.wait(5)
+        raise ConnectionError("failed")
+
+    errors = []
+
+    def _get():
+        try:
+            cache.get("key", _fetch)
+        except ConnectionError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=_get) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+
+    threading.Event().wait(0.1)
+    release.set()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 2
+    assert cache.get("key", _Server()) == "value"
+
+
+def test_values_fetched_across_an_invalidation_are_revalidated():
+    cache = MetadataCache(ttl=60)
+    fetch = _Server()
+
+    def _fetch(etag):
+        cache.invalidate()
+        return fetch(etag)
+
+    assert cache.get("key", _fetch) == "value"
+    assert cache.get("key", fetch) == "value"
+    assert fetch.calls == [None, '"1"']
+
+
+@pytest.fixture
+def chatroom(server, teacup):
+    return teacup.create_chatroom(server.url, "room", "owner", "password")
+
+
+def test_users_are_revalidated_conditionally(server, teacup, chatroom):
+    def _fetched():
+        return server.requests[("GET", "users")]
+
+    users = chatroom.get_users()
+    assert chatroom.get_users() == users
+    assert _fetched() == 1
+
+    revalidated = chatroom.get_users(cached=False)
+    assert revalidated[0] is users[0]
+    assert _fetched() == 2
+
+    teacup.use_invite(chatroom.create_invite(uses=1), "guest", "password")
+    chatroom.invalidate_metadata("users")
+
+    assert [user.username for user in chatroom.get_users()] == ["owner", "guest"]
+    assert _fetched() == 3
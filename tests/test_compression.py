@@ -0,0 +1,79 @@
+"""Tests for `teahaz.compression`, and compressed requests of chatrooms."""
+
+from __future__ import annotations
+
+import pytest
+
+from teahaz.compression import (
+    accept_encoding,
+    available_codecs,
+    compress,
+    decompress,
+)
+
+DATA = b"teahaz " * 1000
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_codecs_round_trip(codec):
+    compressed = compress(DATA, codec)
+
+    assert len(compressed) < len(DATA) / 10
+    assert decompress(compressed, codec) == DATA
+    assert compress(DATA, codec, level=1) != compress(DATA, codec, level=9)
+
+
+def test_gzip_output_is_reproducible():
+    assert compress(DATA, "gzip") == compress(DATA, "gzip")
+
+
+def test_zstd_is_preferred_when_installed():
+    pytest.importorskip("zstandard")
+
+    assert available_codecs() == ["zstd", "gzip"]
+
+
+def test_unavailable_codecs_are_rejected():
+    with pytest.raises(ValueError):
+        compress(DATA, "brotli")
+
+    with pytest.raises(ValueError):
+        decompress(DATA, "brotli")
+
+
+def test_all_codecs_are_accepted():
+    assert accept_encoding().split(", ") == available_codecs() + ["deflate"]
+
+
+def test_chatrooms_compress_large_bodies(server, teacup, monkeypatch):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    with pytest.raises(ValueError):
+        chatroom.set_compression("brotli")
+
+    chatroom.set_compression("gzip", threshold=500)
+    assert chatroom.transport.headers["Accept-Encoding"] == accept_encoding()
+
+    encodings = []
+    respond = server.respond
+
+    def _respond(method, path, headers, body):
+        if method == "POST":
+            encodings.append(headers.get("content-encoding"))
+
+        return respond(method, path, headers, body)
+
+    monkeypatch.setattr(server, "respond", _respond)
+
+    chatroom.send("short")
+    chatroom.send("long" * 500)
+
+    chatroom.set_compression(None)
+    chatroom.send("long" * 500)
+
+    assert encodings == [None, "gzip", None]
+    assert [message.data for message in chatroom.get_count(3)] == [
+        "short",
+        "long" * 500,
+        "long" * 500,
+    ]
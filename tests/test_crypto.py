@@ -0,0 +1,136 @@
+"""Tests for `teahaz.crypto`."""
+
+from __future__ import annotations
+
+import os
+import threading
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from teahaz import Event, crypto
+from teahaz.crypto import RoomCipher
+
+
+@pytest.fixture
+def cipher():
+    return RoomCipher.from_secret("secret", "room")
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Splits batches of a few KB between 3 workers, of a pool shut down after."""
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(crypto, "_executor", executor)
+    monkeypatch.setattr(crypto, "WORKERS", 3)
+    monkeypatch.setattr(crypto, "WORKER_BYTES", 1024)
+
+    yield
+    executor.shutdown()
+
+
+def test_payloads_round_trip(cipher):
+    payload = cipher.encrypt(b"hello")
+
+    assert RoomCipher.is_encrypted(payload)
+    assert b"hello" not in payload
+    assert cipher.decrypt(payload) == b"hello"
+    assert cipher.encrypt(b"hello") != payload
+
+
+def test_plain_payloads_are_passed_through(cipher):
+    assert cipher.decrypt(b"hello") == b"hello"
+
+
+@pytest.mark.parametrize(
+    "other",
+    [
+        RoomCipher.from_secret("wrong", "room"),
+        RoomCipher.from_secret("secret", "other room"),
+    ],
+)
+def test_payloads_only_decrypt_with_their_key_and_room(cipher, other):
+    with pytest.raises(InvalidTag):
+        other.decrypt(cipher.encrypt(b"hello"))
+
+
+def test_tampered_payloads_are_rejected(cipher):
+    payload = bytearray(cipher.encrypt(b"hello"))
+    payload[-1] ^= 1
+
+    with pytest.raises(InvalidTag):
+        cipher.decrypt(bytes(payload))
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_decrypt_many_keeps_the_order(cipher, pool, monkeypatch, workers):
+    monkeypatch.setattr(crypto, "WORKERS", workers)
+
+    plaintexts = [os.urandom(index * 100) for index in range(50)]
+    payloads = [cipher.encrypt(plaintext) for plaintext in plaintexts]
+    payloads[7] = plaintexts[7]
+
+    assert cipher.decrypt_many(iter(payloads)) == plaintexts
+
+
+def test_decrypt_many_leaves_out_tampered_payloads(cipher, pool):
+    plaintexts = [os.urandom(1000) for _ in range(20)]
+    payloads = [cipher.encrypt(plaintext) for plaintext in plaintexts]
+    payloads[-1] = payloads[-1][:-1] + bytes([payloads[-1][-1] ^ 1])
+
+    assert cipher.decrypt_many(payloads) == plaintexts[:-1] + [None]
+
+
+def test_chatrooms_share_encrypted_messages(server, teacup, monkeypatch):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    guest = teacup.use_invite(owner.create_invite(uses=1), "guest", "password")
+
+    posted = []
+    respond = server.respond
+
+    def _respond(method, path, headers, body):
+        if method == "POST" and "/messages/" in path:
+            posted.append(b64decode(body["data"]))
+
+        return respond(method, path, headers, body)
+
+    monkeypatch.setattr(server, "respond", _respond)
+
+    owner.set_secret("shared")
+    guest.set_secret("shared")
+    owner.send("hello")
+
+    assert len(posted) == 1
+    assert RoomCipher.is_encrypted(posted[0])
+    assert [message.data for message in guest.get_count(10)][-1] == "hello"
+
+
+@pytest.mark.parametrize("secret", ["other", None])
+def test_unreadable_messages_do_not_stop_polling(server, teacup, secret):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    guest = teacup.use_invite(owner.create_invite(uses=1), "guest", "password")
+    guest.set_secret(secret)
+
+    received = []
+    done = threading.Event()
+
+    def _on_message(message):
+        received.append(message)
+        if len(received) == 2:
+            done.set()
+
+    guest.interval = 0.05
+    guest.subscribe(Event.MSG_NEW, _on_message)
+
+    owner.set_secret("shared")
+    owner.send("secret")
+    owner.set_secret(None)
+    owner.send("plain")
+
+    assert done.wait(5)
+    assert [message.is_decrypted for message in received] == [False, True]
+    assert received[0].data != "secret"
+    assert received[1].data == "plain"
@@ -0,0 +1,164 @@
+"""Tests for `teahaz.executor`."""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from teahaz import executor
+from teahaz.executor import get_executor, set_max_workers, threaded
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    """A shared executor of 4 workers, shut down after the test."""
+
+    monkeypatch.setattr(executor, "_executor", ThreadPoolExecutor(max_workers=4))
+    yield
+
+    get_executor().shutdown()
+
+
+def test_calls_resolve_their_future():
+    returned = []
+    future = threaded(lambda a, b: a + b, callback=returned.append)(1, b=2)
+
+    assert future.result(5) == 3
+    assert returned == [3]
+
+
+@pytest.mark.parametrize("fail_in", ["target", "callback"])
+def test_exceptions_reach_the_handler_and_future(fail_in):
+    def _fail(*_):
+        raise ValueError("failed")
+
+    handled = []
+    future = threaded(
+        _fail if fail_in == "target" else lambda: None,
+        callback=_fail if fail_in == "callback" else None,
+        error_handler=handled.append,
+    )()
+
+    with pytest.raises(ValueError):
+        future.result(5)
+
+    # Futures are resolved before the handler is called
+    get_executor().shutdown()
+    assert [str(exception) for exception in handled] == ["failed"]
+
+
+def test_exceptions_are_printed_by_default(capsys):
+    def _fail():
+        raise ValueError("printed")
+
+    with pytest.raises(ValueError):
+        threaded(_fail)().result(5)
+
+    get_executor().shutdown()
+    assert "ValueError: printed" in capsys.readouterr().err
+
+
+def test_calls_can_be_cancelled_before_starting():
+    set_max_workers(1)
+    release = threading.Event()
+    called = []
+
+    blocking = threaded(release.wait)(5)
+    cancelled = threaded(called.append)("cancelled")
+
+    assert cancelled.cancel()
+    release.set()
+
+    assert blocking.result(5)
+    assert threaded(called.append)("called").result(5) is None
+    assert called == ["called"]
+
+
+def test_serialized_calls_keep_their_order():
+    class _Sender:  # pylint: disable=too-few-public-methods
+        def __init__(self):
+            self.sent = []
+            self.running = 0
+
+        def send(self, value):
+            self.running += 1
+            assert self.running == 1
+            threading.Event().wait(0.001)
+            self.sent.append(value)
+            self.running -= 1
+
+    senders = [_Sender(), _Sender()]
+    futures = [
+        threaded(sender.send, serialize=True)(index)
+        for index in range(20)
+        for sender in senders
+    ]
+
+    for future in futures:
+        future.result(5)
+
+    assert all(sender.sent == list(range(20)) for sender in senders)
+
+
+def test_failing_handlers_do_not_block_their_key(capsys):
+    def _fail(*_):
+        raise ValueError("handler failed")
+
+    call = threaded(_fail, error_handler=_fail, serialize=True)
+
+    with pytest.raises(ValueError):
+        call().result(5)
+
+    # The key's queue is still drained after the handler raised
+    assert threaded(lambda: "next", serialize=lambda: _fail)().result(5) == "next"
+    get_executor().shutdown()
+
+    assert "ValueError: handler failed" in capsys.readouterr().err
+
+
+def test_serialized_calls_by_key_run_concurrently_across_keys():
+    started = threading.Barrier(2, timeout=5)
+    order = []
+
+    def _call(key, value):
+        if value == 0:
+            started.wait()
+
+        order.append((key, value))
+
+    call = threaded(_call, serialize=lambda key, _: key)
+    futures = [call(key, value) for value in range(3) for key in ("a", "b")]
+
+    for future in futures:
+        future.result(5)
+
+    for key in ("a", "b"):
+        assert [value for key_, value in order if key_ == key] == [0, 1, 2]
+
+
+def test_replaced_executors_finish_their_calls():
+    release = threading.Event()
+    previous = get_executor()
+
+    future = threaded(release.wait)(5)
+    set_max_workers(2)
+    release.set()
+
+    assert get_executor() is not previous
+    assert future.result(5)
+    previous.shutdown()
+
+
+def test_chatroom_sends_keep_their_order(server, teacup):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    send = threaded(chatroom.send, serialize=True)
+
+    futures = [send(f"message {index}") for index in range(10)]
+    for future in futures:
+        future.result(5)
+
+    assert [message.data for message in chatroom.get_count(10)] == [
+        f"message {index}" for index in range(10)
+    ]
@@ -0,0 +1,101 @@
+"""Tests for the lazy imports of the package."""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = {
+    "requests",
+    "urllib3",
+    "cryptography",
+    "httpx",
+    "h2",
+    "numpy",
+    "multiprocessing",
+    "sqlite3",
+}
+
+# The names `from teahaz import *` has always exported, and those since added
+# to `teahaz.types`, `teahaz.client` & `teahaz.dataclasses`
+STAR_EXPORTS = {
+    "threaded",
+    "Event",
+    "Teacup",
+    "Chatroom",
+    "LoginResult",
+    "User",
+    "Invite",
+    "Channel",
+    "ChannelDelta",
+    "Message",
+    "SystemEvent",
+    "MessageCallback",
+    "BatchCallback",
+    "ErrorCallback",
+    "ExceptionCallback",
+    "EventCallback",
+}
+
+
+def _imported(code: str) -> set[str]:
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys; before = set(sys.modules)\n"
+            + code
+            + "\nprint('\\n'.join(set(sys.modules) - before))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return set(process.stdout.split())
+
+
+@pytest.mark.parametrize(
+    "code, forbidden",
+    [
+        ("import teahaz", {"teahaz.dataclasses", "teahaz.client"}),
+        ("import teahaz; teahaz.Invite; teahaz.Message", {"teahaz.client"}),
+        ("import teahaz; teahaz.Teacup", set()),
+        ("from teahaz import *", {"teahaz.standin", "teahaz.analytics"}),
+    ],
+)
+def test_heavy_modules_are_imported_lazily(code, forbidden):
+    assert not _imported(code) & (HEAVY_MODULES | forbidden)
+
+
+def test_lazy_names_resolve():
+    import teahaz  # pylint: disable=import-outside-toplevel
+
+    for name in teahaz._EXPORTS:
+        assert getattr(teahaz, name) is not None
+
+    with pytest.raises(AttributeError):
+        teahaz.Missing  # pylint: disable=pointless-statement
+
+
+def test_star_import_exports_the_core_names():
+    namespace: dict = {}
+    exec("from teahaz import *", namespace)  # pylint: disable=exec-used
+
+    assert set(namespace) - {"__builtins__"} == STAR_EXPORTS
+    assert "StandInServer" not in namespace
+
+
+def test_all_is_unchanged():
+    import teahaz  # pylint: disable=import-outside-toplevel
+
+    assert set(teahaz.__all__) == STAR_EXPORTS
+    assert len(teahaz.__all__) == len(STAR_EXPORTS)
+
+
+def test_dir_lists_lazy_names():
+    import teahaz  # pylint: disable=import-outside-toplevel
+
+    assert set(teahaz._EXPORTS) <= set(dir(teahaz))
@@ -0,0 +1,79 @@
+"""Tests for `teahaz.loadgen`."""
+
+from __future__ import annotations
+
+import math
+
+import pytest
+
+from teahaz import loadgen
+from teahaz.loadgen import LoadGenerator, LoadReport
+
+
+def test_percentiles_use_the_nearest_rank():
+    report = LoadReport(1, 1, 1.0, latencies=[0.1, 0.2, 0.3, 0.4])
+
+    assert report.percentile(50) == 0.2
+    assert report.percentile(90) == 0.4
+    assert report.percentile(0) == 0.1
+    assert math.isnan(LoadReport(1, 1, 1.0).percentile(50))
+
+
+def test_reports_are_formatted():
+    report = LoadReport(
+        2, 3, 2.0, sent=10, delivered=30, latencies=[0.01], requests={"GET messages": 8}
+    )
+    text = report.format()
+
+    assert "rooms: 2, users per room: 3, duration: 2.0s" in text
+    assert "(5.0/s)" in text and "(15.0/s)" in text and "(4.0/s)" in text
+    assert "p50 10.0 ms" in text
+
+
+def test_generators_need_rooms_and_users():
+    with pytest.raises(ValueError):
+        LoadGenerator("http://localhost", rooms=0)
+
+    with pytest.raises(ValueError):
+        LoadGenerator("http://localhost", users=0)
+
+
+@pytest.mark.parametrize("share_polling", [False, True])
+def test_messages_reach_every_user(server, share_polling):
+    generator = LoadGenerator(
+        server.url,
+        rooms=2,
+        users=3,
+        send_rate=30,
+        poll_interval=0.05,
+        share_polling=share_polling,
+    )
+
+    assert len(generator.provision()) == 6
+    report = generator.run(1.0, settle=0.5)
+
+    assert report.sent > 10
+    assert report.delivered == 3 * report.sent
+    assert report.lost == report.errors == 0
+    assert len(report.latencies) == report.sent
+    assert report.latencies == sorted(report.latencies)
+
+
+def test_failed_provisioning_is_raised(server, monkeypatch):
+    monkeypatch.setattr(server, "respond", lambda *_: (503, "Unavailable.", {}))
+    generator = LoadGenerator(server.url)
+
+    with pytest.raises(RuntimeError, match="chatroom 0"):
+        generator.provision()
+
+    assert generator.teacup.stop(timeout=5)
+
+
+def test_main_reports_the_stand_in_requests(capsys):
+    loadgen.main(
+        ["--rooms", "1", "--users", "2", "--duration", "0.5", "--poll-interval", "0.05"]
+    )
+
+    output = capsys.readouterr().out
+    assert "sent:" in output and "lost: 0, errors: 0" in output
+    assert "POST messages:" in output and "GET messages:" in output
@@ -0,0 +1,133 @@
+"""Tests for the event loop of `teahaz.Chatroom`."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz import Event
+
+
+@pytest.fixture
+def chatroom(server, teacup):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.interval = 0.05
+
+    return chatroom
+
+
+def test_poll_in_flight_while_stopping_is_fetched_again(chatroom, monkeypatch):
+    delivered = []
+    new = threading.Event()
+    stopped = threading.Event()
+
+    fetch = chatroom._fetch_messages
+
+    def _stop_in_flight(*args, **kwargs):
+        messages = fetch(*args, **kwargs)
+
+        if messages and not stopped.is_set():
+            chatroom._signal_stop()
+            stopped.set()
+
+        return messages
+
+    monkeypatch.setattr(chatroom, "_fetch_messages", _stop_in_flight)
+    chatroom.subscribe(Event.MSG_DELIVERED, lambda *args: delivered.append(args))
+    chatroom.subscribe(Event.MSG_NEW, lambda message: new.set())
+
+    sent = chatroom.send("hello")
+    assert stopped.wait(5)
+    assert chatroom.stop(timeout=3)
+
+    # Nothing of the dropped poll was kept
+    assert delivered == []
+    assert not new.is_set()
+    assert len(chatroom.messages) == 0
+    assert len(chatroom.active_channel.messages) == 0
+
+    chatroom.start()
+    assert new.wait(5)
+    assert chatroom.stop(timeout=3)
+
+    assert [message for message, _ in delivered] == [sent]
+    assert [message.uid for message in chatroom.messages] == [sent.uid]
+    assert [message.uid for message in chatroom.active_channel.messages] == [sent.uid]
+
+
+def test_drain_finishes_the_poll_in_flight(chatroom, monkeypatch):
+    received = []
+    fetch = chatroom._fetch_messages
+
+    def _stop_in_flight(*args, **kwargs):
+        messages = fetch(*args, **kwargs)
+
+        if messages:
+            chatroom._signal_stop(drain=True)
+
+        return messages
+
+    monkeypatch.setattr(chatroom, "_fetch_messages", _stop_in_flight)
+    chatroom.subscribe(Event.MSG_NEW, received.append)
+
+    chatroom.send("hello")
+    chatroom.event_thread.join(5)
+
+    assert [message.data for message in received] == ["hello"]
+
+
+def test_messages_are_delivered_once(chatroom):
+    received = []
+    done = threading.Event()
+
+    def _on_message(message):
+        received.append(message.data)
+        if len(received) == 3:
+            done.set()
+
+    chatroom.subscribe(Event.MSG_NEW, _on_message)
+
+    for index in range(3):
+        chatroom.send(f"message {index}")
+
+    assert done.wait(5)
+    assert chatroom.stop(timeout=3)
+    assert received == [f"message {index}" for index in range(3)]
+    assert len(chatroom.messages) == 3
+
+
+def test_restart_resumes_polling(chatroom):
+    received = []
+    done = threading.Event()
+
+    def _on_message(message):
+        received.append(message.data)
+        done.set()
+
+    chatroom.subscribe(Event.MSG_NEW, _on_message)
+    assert chatroom.stop(timeout=3)
+
+    chatroom.send("while stopped")
+    chatroom.start()
+
+    assert done.wait(5)
+    assert received == ["while stopped"]
+
+
+def test_prefetch_prepends_older_messages_once(chatroom):
+    for index in range(3):
+        chatroom.send(f"message {index}")
+
+    channel = chatroom.active_channel
+    newest = chatroom.get_count(1)
+    assert [message.data for message in channel.messages] == ["message 2"]
+
+    fresh = chatroom.prefetch(10)
+    assert [message.data for message in fresh] == ["message 0", "message 1"]
+
+    assert chatroom.prefetch(10) == []
+    assert [message.data for message in channel.messages] == [
+        f"message {index}" for index in range(3)
+    ]
+    assert channel.messages[-1] is newest[0]
@@ -0,0 +1,93 @@
+"""Tests for `teahaz.messagelog`."""
+
+from __future__ import annotations
+
+import pickle
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from teahaz.messagelog import CHUNK_SIZE, MessageLog
+
+
+def test_sequence_behaviour():
+    log = MessageLog(range(1000))
+    log.append(1000)
+    log.extend(range(1001, 2000))
+
+    assert len(log) == 2000
+    assert list(log) == list(range(2000))
+    assert log[0] == 0 and log[-1] == 1999 and log[CHUNK_SIZE] == CHUNK_SIZE
+    assert log[10:20] == list(range(10, 20))
+    assert log[::500] == [0, 500, 1000, 1500]
+
+    with pytest.raises(IndexError):
+        log[2000]  # pylint: disable=pointless-statement
+
+
+def test_snapshots_do_not_change():
+    log = MessageLog(range(CHUNK_SIZE - 1))
+    view = log.snapshot()
+
+    # Enough to seal several chunks into the shared lists
+    log.extend(range(CHUNK_SIZE - 1, 5 * CHUNK_SIZE))
+    later = log.snapshot()
+    log.append(-1)
+
+    assert list(view) == list(range(CHUNK_SIZE - 1))
+    assert len(later) == 5 * CHUNK_SIZE and later[-1] == 5 * CHUNK_SIZE - 1
+    assert list(later) == list(range(5 * CHUNK_SIZE))
+
+
+def test_rebuilding_writes():
+    log = MessageLog(range(10, 3 * CHUNK_SIZE))
+    view = log.snapshot()
+
+    log.prepend(range(10))
+    assert list(log) == list(range(3 * CHUNK_SIZE))
+
+    log.extend(range(3 * CHUNK_SIZE, 4 * CHUNK_SIZE))
+    assert list(log) == list(range(4 * CHUNK_SIZE))
+
+    log.clear()
+    log.extend(range(CHUNK_SIZE + 1))
+    assert list(log) == list(range(CHUNK_SIZE + 1))
+    assert list(view) == list(range(10, 3 * CHUNK_SIZE))
+
+
+def test_discard():
+    messages = [SimpleNamespace(uid=str(index)) for index in range(3 * CHUNK_SIZE)]
+    log = MessageLog(messages)
+
+    removed = {str(index) for index in range(0, 3 * CHUNK_SIZE, 2)}
+    assert log.discard(removed) == len(removed)
+    assert list(log) == messages[1::2]
+    assert log.discard(removed) == 0
+
+
+def test_pickling():
+    log = MessageLog(range(CHUNK_SIZE * 2 + 3))
+    assert list(pickle.loads(pickle.dumps(log))) == list(log)
+
+
+def test_readers_see_consistent_states():
+    log = MessageLog()
+    errors = []
+    done = threading.Event()
+
+    def _read():
+        while not done.is_set():
+            view = log.snapshot()
+            if list(view) != list(range(len(view))):
+                errors.append(len(view))
+
+    reader = threading.Thread(target=_read)
+    reader.start()
+
+    for start in range(0, 50 * CHUNK_SIZE, 37):
+        log.extend(range(start, start + 37))
+
+    done.set()
+    reader.join()
+    assert not errors
@@ -0,0 +1,179 @@
+"""Tests for `teahaz.outbox`."""
+
+from __future__ import annotations
+
+from base64 import b64decode
+
+import pytest
+
+from teahaz import Event
+from teahaz.outbox import TokenBucket
+
+
+@pytest.fixture
+def chatroom(server, teacup):
+    return teacup.create_chatroom(server.url, "room", "owner", "password")
+
+
+def _fail_posts(server, monkeypatch, statuses):
+    """Answers the next message posts with statuses, then normally."""
+
+    respond = server.respond
+    statuses = list(statuses)
+
+    def _respond(method, path, headers, body):
+        if method == "POST" and "/messages/" in path and statuses:
+            server.requests[(method, "messages")] += 1
+            return statuses.pop(0), "Injected failure.", {}
+
+        return respond(method, path, headers, body)
+
+    monkeypatch.setattr(server, "respond", _respond)
+
+
+def _posts(server):
+    return server.requests[("POST", "messages")]
+
+
+def _stored(chatroom):
+    return [message.data for message in chatroom.get_count(100)]
+
+
+def test_overload_is_retried(server, chatroom, monkeypatch):
+    outbox = chatroom.configure_outbox(rate=50, burst=1)
+    _fail_posts(server, monkeypatch, [429, 503])
+
+    message = outbox.put("hello", chatroom.active_channel).result(timeout=5)
+
+    assert message.data == "hello"
+    assert _posts(server) == 3
+    assert _stored(chatroom) == ["hello"]
+    assert outbox.bucket.rate < 50
+
+
+def test_server_errors_are_not_retried(server, chatroom, monkeypatch):
+    outbox = chatroom.configure_outbox(rate=50, burst=1)
+    _fail_posts(server, monkeypatch, [500])
+
+    # The rate adapts without an error handler, too
+    with pytest.raises(RuntimeError):
+        outbox.put("hello", chatroom.active_channel).result(timeout=5)
+
+    assert _posts(server) == 1
+    assert outbox.bucket.rate < 50
+
+
+def test_client_errors_fail_at_once(server, chatroom, monkeypatch):
+    errors = []
+    chatroom.subscribe(Event.ERROR, lambda response, *_: errors.append(response))
+
+    outbox = chatroom.configure_outbox(rate=50, burst=1)
+    _fail_posts(server, monkeypatch, [400])
+
+    assert outbox.put("hello", chatroom.active_channel).result(timeout=5) is None
+    assert [response.status_code for response in errors] == [400]
+    assert _posts(server) == 1
+    assert outbox.bucket.rate == 50
+
+
+def test_retries_run_out(server, chatroom, monkeypatch):
+    outbox = chatroom.configure_outbox(rate=50, burst=1)
+    _fail_posts(server, monkeypatch, [429] * 10)
+
+    with pytest.raises(RuntimeError):
+        outbox.put("hello", chatroom.active_channel).result(timeout=5)
+
+    assert _posts(server) == outbox.retries + 1
+
+
+def test_refused_connections_are_retried(server, chatroom):
+    exceptions = []
+    chatroom.subscribe(
+        Event.NETWORK_EXCEPTION, lambda exception, *_: exceptions.append(exception)
+    )
+
+    outbox = chatroom.configure_outbox(rate=50, burst=1)
+    server.stop()
+    chatroom.transport.close()
+
+    assert outbox.put("hello", chatroom.active_channel).result(timeout=10) is None
+    assert len(exceptions) == 1
+    assert chatroom.transport.never_sent(exceptions[0])
+
+
+def test_timeouts_are_not_retried(server, chatroom):
+    chatroom.subscribe(Event.NETWORK_EXCEPTION, lambda *_: None)
+    chatroom.request_timeout = 0.2
+
+    outbox = chatroom.configure_outbox(rate=50, burst=1)
+    server.latency = 0.5
+
+    assert outbox.put("hello", chatroom.active_channel).result(timeout=5) is None
+    assert _posts(server) == 1
+
+
+def test_coalescing_joins_queued_texts(server, chatroom):
+    outbox = chatroom.configure_outbox(rate=0.5, burst=1, coalesce_limit=100)
+    outbox.put("first", chatroom.active_channel).result(timeout=5)
+
+    # The bucket is empty, so these queue up and are sent as one message
+    futures = [outbox.put(f"line {index}", chatroom.active_channel) for index in range(3)]
+    message = futures[0].result(timeout=5)
+
+    assert all(future.result(timeout=5) is message for future in futures)
+    assert message.data == "line 0\nline 1\nline 2"
+    assert _posts(server) == 2
+
+
+def test_replies_are_not_coalesced(server, chatroom):
+    outbox = chatroom.configure_outbox(rate=2, burst=1, coalesce_limit=100)
+    channel = chatroom.active_channel
+    original = outbox.put("original", channel).result(timeout=5)
+
+    futures = [
+        outbox.put("before", channel),
+        outbox.put("reply", channel, original.uid),
+        outbox.put("after", channel),
+        outbox.put("later", channel),
+    ]
+    for future in futures:
+        future.result(timeout=5)
+
+    stored = server._rooms[chatroom.uid].channels[channel.uid].messages
+    assert [(b64decode(msg["data"]), msg["replyID"]) for msg in stored[1:]] == [
+        (b"before", None),
+        (b"reply", original.uid),
+        (b"after\nlater", None),
+    ]
+
+
+def test_stop_cancels_queued_messages(chatroom):
+    outbox = chatroom.configure_outbox(rate=0.5, burst=1)
+
+    first = outbox.put("first", chatroom.active_channel)
+    assert first.result(timeout=5).data == "first"
+
+    # The worker takes at most one message to wait for a token with
+    outbox.put("waiting", chatroom.active_channel)
+    queued = outbox.put("queued", chatroom.active_channel)
+
+    assert outbox.stop(timeout=5)
+    assert queued.cancelled()
+
+    with pytest.raises(RuntimeError):
+        outbox.put("late", chatroom.active_channel)
+
+
+def test_bucket_adapts():
+    bucket = TokenBucket(rate=10, burst=2, min_rate=1)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() > 0
+
+    for _ in range(10):
+        bucket.penalize()
+    assert bucket.rate == 1
+
+    bucket.reward()
+    assert bucket.rate == 2
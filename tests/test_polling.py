@@ -0,0 +1,100 @@
+"""Tests for shared polling, see `Teacup.share_polling` & `Chatroom.follow`."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz import Event
+
+
+@pytest.fixture
+def room(server, teacup):
+    teacup.share_polling()
+    teacup.subscribe_all(Event.ERROR, lambda *_: None)
+
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    owner.interval = 0.05
+
+    return owner
+
+
+def _wait_for(chatroom, count):
+    done = threading.Event()
+    received = []
+
+    def _on_message(message):
+        received.append(message.data)
+        if len(received) >= count:
+            done.set()
+
+    chatroom.subscribe(Event.MSG_NEW, _on_message)
+    return received, done
+
+
+def test_accounts_share_a_poller(room, teacup):
+    invite = room.create_invite(uses=2)
+    guests = [
+        teacup.use_invite(invite, f"guest-{index}", "password") for index in range(2)
+    ]
+
+    assert all(guest.leader is room for guest in guests)
+    assert room.messages is guests[0].messages
+
+    inboxes = [_wait_for(chatroom, 1) for chatroom in (room, *guests)]
+    guests[0].send("hello")
+
+    for received, done in inboxes:
+        assert done.wait(5)
+        assert received == ["hello"]
+
+
+def test_failed_invite_leaves_no_follower(room, teacup):
+    invite = room.create_invite(uses=1)
+    assert teacup.use_invite(invite, "guest", "password") is not None
+
+    assert teacup.use_invite(invite, "ghost", "password") is None
+    assert len(room._followers) == 1
+
+
+def test_failed_login_leaves_no_follower(room, teacup, server):
+    [result] = teacup.login_many([(server.url, room.uid, "owner", "wrong")])
+
+    assert not result.is_ok
+    assert room._followers == ()
+
+
+def test_followers_take_over_a_stopped_leader(room, teacup):
+    invite = room.create_invite(uses=1)
+    guest = teacup.use_invite(invite, "guest", "password")
+    guest.interval = 0.05
+
+    received, done = _wait_for(guest, 1)
+    assert room.stop(timeout=3)
+
+    assert guest.leader is None
+    room.send("after")
+    assert done.wait(5)
+    assert received == ["after"]
+
+
+def test_disabling_shares_nothing(room, teacup):
+    invite = room.create_invite(uses=1)
+    guest = teacup.use_invite(invite, "guest", "password")
+
+    teacup.share_polling(False)
+
+    assert guest.leader is None
+    assert room._followers == ()
+    assert guest.messages is not room.messages
+
+
+def test_follow_rejects_other_rooms(room, teacup, server):
+    other = teacup.create_chatroom(server.url, "other", "owner", "password")
+
+    with pytest.raises(ValueError):
+        other.follow(room)
+
+    with pytest.raises(ValueError):
+        room.follow(room)
@@ -0,0 +1,125 @@
+"""Tests for the reconciliation of sent messages with their server echo."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz import Event
+
+
+@pytest.fixture
+def chatroom(server, teacup):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.interval = 0.05
+
+    return chatroom
+
+
+def _record(chatroom, *events, then=None):
+    """Records the events of chatroom as (event, args) pairs, calling then after."""
+
+    recorded = []
+
+    def _listen(event):
+        def _on_event(*args):
+            recorded.append((event, args))
+            if then is not None:
+                then(event)
+
+        chatroom.subscribe(event, _on_event)
+
+    for event in events:
+        _listen(event)
+
+    return recorded
+
+
+def _hold_back(server, monkeypatch, method, until):
+    """Holds back the responses to message requests of method until set."""
+
+    respond = server.respond
+
+    def _respond(method_, path, headers, body):
+        answer = respond(method_, path, headers, body)
+        if method_ == method and "/messages/" in path:
+            assert until.wait(5)
+
+        return answer
+
+    monkeypatch.setattr(server, "respond", _respond)
+
+
+def test_echo_updates_the_sent_instance(chatroom, server, monkeypatch):
+    returned = threading.Event()
+    delivered = threading.Event()
+    _hold_back(server, monkeypatch, "GET", returned)
+
+    recorded = _record(
+        chatroom,
+        Event.MSG_SENT,
+        Event.MSG_NEW,
+        Event.MSG_DELIVERED,
+        then=lambda event: event is Event.MSG_NEW and delivered.set(),
+    )
+
+    sent = chatroom.send("hello")
+    assert not sent.is_delivered
+    returned.set()
+
+    assert delivered.wait(5)
+    assert chatroom.stop(timeout=3)
+
+    assert sent.is_delivered
+    assert [event for event, _ in recorded] == [
+        Event.MSG_SENT,
+        Event.MSG_DELIVERED,
+        Event.MSG_NEW,
+    ]
+    assert all(args[0] is sent for _, args in recorded)
+    assert recorded[1][1][1] >= 0
+    assert list(chatroom.messages) == [sent]
+
+
+def test_echo_arriving_before_the_response(chatroom, server, monkeypatch):
+    echoed = threading.Event()
+    _hold_back(server, monkeypatch, "POST", echoed)
+
+    recorded = _record(
+        chatroom,
+        Event.MSG_NEW,
+        Event.MSG_SENT,
+        Event.MSG_DELIVERED,
+        then=lambda event: event is Event.MSG_NEW and echoed.set(),
+    )
+
+    sent = chatroom.send("hello")
+    assert chatroom.stop(timeout=3)
+
+    assert sent.is_delivered
+    assert [event for event, _ in recorded] == [
+        Event.MSG_NEW,
+        Event.MSG_DELIVERED,
+        Event.MSG_SENT,
+    ]
+    assert all(args[0] is sent for _, args in recorded)
+    assert list(chatroom.messages) == [sent]
+
+
+def test_messages_of_others_are_not_delivered(server, teacup, chatroom):
+    guest = teacup.use_invite(chatroom.create_invite(uses=1), "guest", "password")
+    received = threading.Event()
+    recorded = _record(
+        chatroom,
+        Event.MSG_DELIVERED,
+        Event.MSG_NEW,
+        then=lambda event: event is Event.MSG_NEW and received.set(),
+    )
+
+    guest.send("hello")
+
+    assert received.wait(5)
+    assert chatroom.stop(timeout=3)
+    assert [event for event, _ in recorded] == [Event.MSG_NEW]
+    assert recorded[0][1][0].is_delivered
@@ -0,0 +1,98 @@
+"""Tests for `teahaz.recorder`."""
+
+from __future__ import annotations
+
+import json
+from time import perf_counter
+
+import pytest
+
+from teahaz import Teacup
+from teahaz.recorder import REDACTED, ReplayServer, TrafficRecorder, read_recording
+
+
+@pytest.fixture
+def recording(server, teacup, tmp_path):
+    """A recording of logging in, sending and fetching messages."""
+
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom = teacup.login(server.url, owner.uid, "owner", "password")
+    owner.send("first")
+
+    path = tmp_path / "traffic.jsonl.gz"
+    with TrafficRecorder(path) as recorder:
+        recorder.attach(chatroom)
+
+        # Channels are fetched in full on login, as they would be by a new client
+        chatroom.metadata_cache.clear()
+        chatroom.login("owner", "password")
+        chatroom.send("second")
+        chatroom.get_count(10)
+
+        recorder.detach(chatroom)
+        chatroom.get_count(10)
+
+    assert chatroom.recorder is None
+    return path, owner.uid
+
+
+def test_requests_are_recorded_and_redacted(recording):
+    path, uid = recording
+    entries = list(read_recording(path))
+
+    assert [(entry["method"], entry["target"].split("/")[3]) for entry in entries] == [
+        ("POST", "login"),
+        ("GET", "channels"),
+        ("POST", "messages"),
+        ("GET", "messages"),
+    ]
+    assert all(entry["chatroom"] == uid for entry in entries)
+    assert all(entry["status"] == 200 for entry in entries)
+    assert entries[0]["json"] == {"username": "owner", "password": REDACTED}
+    assert entries[-1]["body"][-1]["messageID"] == entries[2]["body"]["messageID"]
+
+    times = [entry["t"] for entry in entries]
+    assert times == sorted(times)
+    assert all(entry["duration"] >= 0 for entry in entries)
+    assert ':"password"' not in json.dumps(entries, separators=(",", ":"))
+
+
+def test_errors_are_recorded(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    with TrafficRecorder(tmp_path / "errors.jsonl.gz") as recorder:
+        recorder.record(
+            chatroom,
+            "get",
+            {"url": f"{server.url}/api/v0/users/{chatroom.uid}?page=2"},
+            perf_counter(),
+            error=ConnectionError("refused"),
+        )
+
+    [entry] = read_recording(tmp_path / "errors.jsonl.gz")
+    assert entry["target"] == f"/api/v0/users/{chatroom.uid}?page=2"
+    assert entry["error"] == "ConnectionError('refused')"
+    assert "status" not in entry
+
+
+def test_recordings_are_replayed(recording):
+    path, uid = recording
+    teacup = Teacup()
+
+    with ReplayServer(path, speed=float("inf")) as replay:
+        try:
+            chatroom = teacup.login(replay.url, uid, "owner", "anything")
+
+            assert chatroom.send("second") is not None
+            assert [message.data for message in chatroom.get_count(10)] == [
+                "first",
+                "second",
+            ]
+
+            # Polls past the end of the recording find no new messages
+            assert chatroom.get_count(10) == []
+
+            with pytest.raises(RuntimeError, match="404"):
+                chatroom.get_users()
+        finally:
+            assert teacup.stop(timeout=10)
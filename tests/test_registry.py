@@ -0,0 +1,177 @@
+"""Tests for `teahaz.registry`."""
+
+from __future__ import annotations
+
+import pytest
+
+from teahaz import Event
+from teahaz.dataclasses import Channel
+from teahaz.registry import ChannelIndex, ChatroomRegistry, normalize_origin
+
+
+class _Chatroom:  # pylint: disable=too-few-public-methods
+    """The attributes of a `Chatroom` the registry indexes."""
+
+    def __init__(self, uid, name="room", url="https://teahaz.co.uk"):
+        self.uid = uid
+        self.name = name
+        self.url = url
+
+
+@pytest.mark.parametrize(
+    "url, origin",
+    [
+        ("https://Teahaz.co.uk/api/v0/", "https://teahaz.co.uk"),
+        ("HTTP://localhost:13337", "http://localhost:13337"),
+        ("teahaz.co.uk/", "teahaz.co.uk"),
+    ],
+)
+def test_origins_are_normalized(url, origin):
+    assert normalize_origin(url) == origin
+
+
+def test_registry_indexes_chatrooms():
+    registry = ChatroomRegistry()
+    first = _Chatroom("a", "general", "https://teahaz.co.uk/api")
+    second = _Chatroom("a", "general", "https://TEAHAZ.co.uk")
+    third = _Chatroom("b", "random", "http://localhost:13337")
+
+    for chatroom in (first, second, third):
+        registry.add(chatroom)
+
+    assert len(registry) == 3
+    assert registry.get("a") is first
+    assert registry.get("missing") is None
+    assert registry.by_uid("a") == (first, second)
+    assert registry.by_name("random") == (third,)
+    assert registry.by_origin("https://teahaz.co.uk/other") == (first, second)
+    assert list(registry) == [first, second, third]
+
+
+def test_registry_reindexes_and_removes_by_identity():
+    registry = ChatroomRegistry()
+    first, second = _Chatroom("a"), _Chatroom("a")
+    registry.add(first)
+    registry.add(second)
+
+    first.name = "renamed"
+    registry.add(first)
+
+    assert len(registry) == 2
+    assert registry.by_name("renamed") == (first,)
+    assert registry.by_name("room") == (second,)
+
+    assert registry.remove(first)
+    assert not registry.remove(first)
+    assert registry.by_uid("a") == (second,)
+    assert first not in registry and second in registry
+
+
+def test_snapshots_are_not_changed_by_mutations():
+    registry = ChatroomRegistry()
+    chatroom = _Chatroom("a")
+    registry.add(chatroom)
+
+    snapshot = registry.snapshot()
+    registry.remove(chatroom)
+
+    assert snapshot == (chatroom,)
+    assert registry.snapshot() == ()
+
+
+def test_teacup_looks_chatrooms_up(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    guest = teacup.use_invite(owner.create_invite(uses=1), "guest", "password")
+
+    assert teacup.get_chatroom("room") is owner
+    assert teacup.get_chatroom("missing") is None
+    assert teacup.get_chatroom_by_uid(owner.uid) is owner
+    assert teacup.get_chatrooms_by_url(server.url + "/api/v0") == (owner, guest)
+
+    assert teacup.remove_chatroom(owner.uid) is owner
+    assert teacup.remove_chatroom(owner) is None
+    assert teacup.get_chatroom_by_uid(owner.uid) is guest
+    assert teacup.chatrooms == (guest,)
+
+
+def test_channel_index_looks_channels_up():
+    general, random = Channel("a", "general", {}), Channel("b", "random", {})
+    index = ChannelIndex([general, random])
+
+    assert list(index) == [general, random]
+    assert index[1] is random and index.first() is general
+    assert index.get("b") is random and index.get("missing") is None
+    assert index.get_by_name("general") is general
+    assert "a" in index and general in index
+
+    assert not index.add(Channel("a", "duplicate", {}))
+    assert index.get_by_name("duplicate") is None
+
+    assert index.rename("a", "renamed") == "general"
+    assert index.rename("a", "renamed") is None
+    assert index.get_by_name("general") is None
+    assert index.get_by_name("renamed") is general
+
+    assert index.remove("a") is general
+    assert index.remove("a") is None
+    assert list(index) == [random]
+
+
+def test_applying_channels_keeps_known_ones():
+    general = Channel("a", "general", {"r": True})
+    general.messages = ["message"]
+    index = ChannelIndex([general, Channel("b", "random", {})])
+
+    delta = index.apply(
+        [Channel("a", "renamed", {"r": False}), Channel("c", "new", {})]
+    )
+
+    assert index.get("a") is general
+    assert general.name == "renamed" and general.permissions == {"r": False}
+    assert list(general.messages) == ["message"]
+    assert [channel.uid for channel in delta.added] == ["c"]
+    assert [channel.uid for channel in delta.removed] == ["b"]
+    assert delta.renamed == [(general, "general")]
+
+    delta = index.apply([Channel("d", "partial", {})], complete=False)
+    assert len(index) == 3 and not delta.removed
+
+
+def test_chatrooms_notify_channel_changes(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    first = owner.create_channel("general")
+    guest = teacup.use_invite(owner.create_invite(uses=1), "guest", "password")
+    kept = guest.channels.get(first.uid)
+
+    events = []
+    for event in (Event.CHANNEL_NEW, Event.CHANNEL_DEL, Event.CHANNEL_RENAME):
+        guest.subscribe(event, lambda *args, event=event: events.append((event, args)))
+
+    second = owner.create_channel("random")
+
+    # The channels are only changed on the server, without a channel endpoint
+    # pylint: disable-next=protected-access
+    room = server._rooms[owner.uid]
+    room.channels[first.uid].name = "renamed"
+    room.version += 1
+
+    guest.invalidate_metadata("channels")
+    guest.login("guest", "password")
+
+    assert guest.channels.get(first.uid) is kept
+    assert sorted((event.name, args[0].uid) for event, args in events) == [
+        ("CHANNEL_NEW", second.uid),
+        ("CHANNEL_RENAME", first.uid),
+    ]
+
+    events.clear()
+    del room.channels[second.uid]
+    room.version += 1
+
+    guest.invalidate_metadata("channels")
+    guest.login("guest", "password")
+
+    assert [(event, args[0].uid) for event, args in events] == [
+        (Event.CHANNEL_DEL, second.uid)
+    ]
+    assert second.uid not in guest.channels
@@ -0,0 +1,141 @@
+"""Tests for `teahaz.search`."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz import Event
+from teahaz.dataclasses import Message
+from teahaz.search import SearchIndex, tokenize
+
+
+def _message(index, text, channel="channel", user="user"):
+    return Message(f"uid-{index}", float(index), "text", text, channel, user)
+
+
+def _uids(hits):
+    return [hit.message_uid for hit in hits]
+
+
+def test_tokenize():
+    assert tokenize("Hello, World_1! hello") == ["hello", "world_1", "hello"]
+
+
+def test_queries():
+    index = SearchIndex()
+    index.add(
+        "room",
+        [
+            _message(0, "the quick brown fox"),
+            _message(1, "the brown quick fox", user="other"),
+            _message(2, "quickly now", channel="other"),
+            _message(3, b"quick bytes are not indexed"),
+        ],
+    )
+
+    assert len(index) == 3
+    assert _uids(index.search("quick fox")) == ["uid-1", "uid-0"]
+    assert _uids(index.search('"quick brown"')) == ["uid-0"]
+    assert _uids(index.search("quick*")) == ["uid-2", "uid-1", "uid-0"]
+    assert _uids(index.search("quick*", channel="other")) == ["uid-2"]
+    assert _uids(index.search("fox", user="other")) == ["uid-1"]
+    assert _uids(index.search("fox", start=0.5)) == ["uid-1"]
+    assert index.search("missing") == []
+
+
+def test_adding_again_does_nothing():
+    index = SearchIndex()
+    messages = [_message(0, "hello"), _message(1, "world")]
+
+    assert index.add("room", messages) == 2
+    assert index.add("room", messages) == 0
+    assert index.add("other room", messages) == 2
+
+
+def test_remove_chatroom():
+    index = SearchIndex()
+    index.add("room", [_message(0, "hello")])
+    index.add("other", [_message(0, "hello")])
+
+    index.remove_chatroom("room")
+    assert [hit.chatroom_uid for hit in index.search("hello")] == ["other"]
+
+
+def test_on_disk_index_is_reused(tmp_path):
+    path = tmp_path / "index.sqlite"
+    index = SearchIndex(path)
+    index.add("room", [_message(0, "hello")])
+    index.close()
+
+    reopened = SearchIndex(path)
+    assert _uids(reopened.search("hello")) == ["uid-0"]
+    reopened.close()
+
+
+def test_enable_search_only_attaches_the_index(server, teacup):
+    listener = lambda message: None  # pylint: disable=unnecessary-lambda-assignment
+    teacup.subscribe_all(Event.MSG_NEW, listener)
+    teacup.share_polling()
+
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    owner.send("hello there")
+    owner._store(owner.get_count(10))
+
+    guest = teacup.use_invite(owner.create_invite(uses=1), "guest", "password")
+    transport, followers = guest.transport, owner._followers
+    threads = threading.active_count()
+
+    index = teacup.enable_search()
+
+    assert owner.search_index is guest.search_index is index
+    assert guest.transport is transport
+    assert owner._followers == followers
+    assert threading.active_count() == threads
+    assert [hit.message.data for hit in teacup.search("hello")] == ["hello there"]
+
+
+def test_new_messages_are_indexed(server, teacup):
+    teacup.enable_search()
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.interval = 0.05
+
+    received = threading.Event()
+    chatroom.subscribe(Event.MSG_NEW, lambda message: received.set())
+
+    chatroom.send("searchable words")
+    assert received.wait(5)
+
+    assert [hit.message_uid for hit in teacup.search("searchable")] == [
+        message.uid for message in chatroom.messages
+    ]
+
+
+def test_enable_search_keeps_transports(server, teacup):
+    pytest.importorskip("h2")
+    teacup.use_http2()
+
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    transport = chatroom.transport
+
+    teacup.enable_search()
+    assert chatroom.transport is transport
+
+
+def test_memory_budget_evicts_oldest():
+    index = SearchIndex(memory_budget=1_000_000)
+
+    for batch in range(100):
+        index.add(
+            "room",
+            [
+                _message(batch * 100 + item, f"batch{batch} common words {item}")
+                for item in range(100)
+            ],
+        )
+        assert index._memory_used() <= 1_000_000
+
+    assert 0 < len(index) < 10_000
+    assert index.search("batch0") == []
+    assert len(index.search("batch99")) == 100
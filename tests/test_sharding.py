@@ -0,0 +1,142 @@
+"""Tests for `teahaz.sharding`."""
+
+from __future__ import annotations
+
+import queue
+from collections import Counter
+
+import pytest
+
+from teahaz import Event
+from teahaz.sharding import HashRing, ShardedTeacup
+
+
+@pytest.fixture(scope="module")
+def cup():
+    sharded = ShardedTeacup(shards=2)
+    yield sharded
+    assert sharded.stop(timeout=10)
+
+
+def test_ring_spreads_keys_stably():
+    ring = HashRing(4)
+    keys = [f"chatroom-{index}" for index in range(2000)]
+
+    shards = [ring.get(key) for key in keys]
+
+    assert shards == [HashRing(4).get(key) for key in keys]
+    assert all(300 < count < 700 for count in Counter(shards).values())
+
+
+def test_adding_a_shard_moves_few_keys():
+    keys = [f"chatroom-{index}" for index in range(2000)]
+    before, after = HashRing(4), HashRing(5)
+
+    moved = [key for key in keys if before.get(key) != after.get(key)]
+
+    assert len(moved) < len(keys) / 3
+    assert all(after.get(key) == 4 for key in moved)
+
+
+def test_ring_needs_a_shard():
+    with pytest.raises(ValueError):
+        HashRing(0)
+
+
+def test_chatrooms_live_in_their_shard(server, cup):
+    owner = cup.create_chatroom(server.url, "room", "owner", "password")
+    assert owner is not None and owner.shard == cup.ring.get("room")
+
+    invite = owner.create_invite(uses=1)
+    guest = cup.use_invite(invite, "guest", "password")
+    assert guest is not None and guest.shard == owner.shard
+
+    other = cup.login(server.url, owner.uid, "owner", "password")
+    assert other.shard == owner.shard == cup.shard_for(owner.uid)
+    assert cup.get_chatroom_by_uid(owner.uid) in cup.chatrooms
+
+    for chatroom in (owner, guest, other):
+        assert cup.remove_chatroom(chatroom) is chatroom
+
+    assert cup.remove_chatroom(owner.uid) is None
+    assert not cup.chatrooms
+
+
+def test_failures_are_raised_from_the_shard(server, cup):
+    owner = cup.create_chatroom(server.url, "failures", "owner", "password")
+
+    with pytest.raises(RuntimeError, match="401"):
+        cup.login(server.url, owner.uid, "owner", "wrong")
+
+    assert cup.chatrooms == (owner,)
+    cup.remove_chatroom(owner)
+
+
+def test_calls_run_in_the_shard(server, cup):
+    chatroom = cup.create_chatroom(server.url, "calls", "owner", "password")
+    chatroom.send("hello")
+
+    assert [message.data for message in chatroom.get_count(10)][-1] == "hello"
+
+    with pytest.raises(AttributeError):
+        chatroom.missing_method()
+
+    cup.remove_chatroom(chatroom)
+
+
+def test_events_reach_the_parent(server, cup):
+    received: queue.Queue = queue.Queue()
+    cup.subscribe_all(Event.MSG_NEW, received.put)
+
+    chatroom = cup.create_chatroom(server.url, "events", "owner", "password")
+    chatroom.send("hello")
+
+    assert received.get(timeout=10).data == "hello"
+    assert cup.get_threads()
+
+    cup.remove_chatroom(chatroom)
+
+
+def test_failing_listeners_do_not_stop_events(server, cup, capsys):
+    received: queue.Queue = queue.Queue()
+    calls = []
+
+    def _fail_once(message):
+        calls.append(message)
+        received.put(message)
+
+        if len(calls) == 1:
+            raise ValueError("listener failed")
+
+    cup.subscribe_all(Event.MSG_NEW, _fail_once)
+
+    chatroom = cup.create_chatroom(server.url, "failing", "owner", "password")
+    chatroom.send("first")
+    assert received.get(timeout=10).data == "first"
+
+    chatroom.send("second")
+    assert received.get(timeout=10).data == "second"
+    assert "ValueError: listener failed" in capsys.readouterr().err
+
+    cup.remove_chatroom(chatroom)
+
+
+def test_dumps_restore_into_the_same_shards(server, cup, tmp_path):
+    created = [
+        cup.create_chatroom(server.url, f"room-{index}", "owner", "password")
+        for index in range(4)
+    ]
+    cup.dump_to(tmp_path)
+
+    restored = ShardedTeacup.from_dump(tmp_path, shards=2)
+    try:
+        assert {chatroom.uid for chatroom in restored.chatrooms} == {
+            chatroom.uid for chatroom in created
+        }
+        for chatroom in restored.chatrooms:
+            assert chatroom.shard == restored.ring.get(chatroom.uid)
+    finally:
+        assert restored.stop(timeout=10)
+
+    for chatroom in created:
+        cup.remove_chatroom(chatroom)
@@ -0,0 +1,140 @@
+"""Tests for `teahaz.snapshot`."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import teahaz.snapshot
+from teahaz import Teacup
+from teahaz.snapshot import chatroom_directories
+
+
+def test_stop_with_flush_writes_and_returns(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.send("hello")
+
+    snapshotter = teacup.start_snapshots(tmp_path, interval=None)
+    assert snapshotter.stop(timeout=3, flush=True)
+    assert not snapshotter.is_running
+
+    data = json.loads((tmp_path / chatroom.uid / "data.json").read_text())
+    assert data["chatroomID"] == chatroom.uid
+
+
+def test_scheduled_stop_without_flush(server, teacup, tmp_path):
+    teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    snapshotter = teacup.start_snapshots(tmp_path, interval=60)
+    assert snapshotter.stop(timeout=3)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_request_coalesces_and_resolves(server, teacup, tmp_path):
+    teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    snapshotter = teacup.start_snapshots(tmp_path, interval=None)
+    futures = [snapshotter.request() for _ in range(5)]
+
+    for future in futures:
+        assert future.result(timeout=5) is None
+
+    assert snapshotter.last_snapshot is not None
+    assert snapshotter.stop(timeout=3)
+
+
+def test_dump_round_trip(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.messages = chatroom.get_count(10) or []
+
+    chatroom.send("hello")
+    chatroom.messages = chatroom.get_count(10)
+
+    teacup.dump_to(tmp_path)
+    restored = Teacup.from_dump(tmp_path)
+
+    [copy] = restored.chatrooms
+    assert copy.uid == chatroom.uid
+    assert [message.data for message in copy.messages] == ["hello"]
+
+
+def test_remove_old_keeps_other_files(server, teacup, tmp_path):
+    teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    stale = tmp_path / "stale"
+    stale.mkdir()
+    (stale / "data.json").write_text("{}")
+    (tmp_path / "blobs").mkdir()
+
+    teacup.dump_to(tmp_path)
+
+    assert not stale.exists()
+    assert (tmp_path / "blobs").exists()
+
+
+def test_http2_cookies_are_captured(server, teacup, tmp_path):
+    pytest.importorskip("h2")
+    teacup.use_http2()
+
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.transport.client.cookies.set("session", "token", domain="127.0.0.1")
+
+    teacup.dump_to(tmp_path)
+    [restored] = Teacup.from_dump(tmp_path).chatrooms
+
+    assert restored.session.cookies.get("session") == "token"
+    assert "session" not in chatroom.session.cookies
+
+
+def test_chatrooms_are_replaced_whole(server, teacup, tmp_path, monkeypatch):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    teacup.dump_to(tmp_path)
+    before = (tmp_path / chatroom.uid / "data.json").read_text()
+
+    chatroom.name = "renamed"
+
+    def _crash(*_):
+        raise OSError("crash")
+
+    monkeypatch.setattr(teahaz.snapshot, "write_atomic", _crash)
+    monkeypatch.setattr(teahaz.snapshot, "write_archive", _crash)
+
+    with pytest.raises(OSError):
+        teacup.dump_to(tmp_path)
+
+    # The failed write left the previous dump alone, and nothing else behind
+    assert (tmp_path / chatroom.uid / "data.json").read_text() == before
+    assert sorted(path.name for path in tmp_path.iterdir()) == [chatroom.uid]
+
+
+def test_interrupted_replace_is_recovered(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    teacup.dump_to(tmp_path)
+
+    # A crash between moving the previous dump aside & moving the new one in
+    (tmp_path / chatroom.uid).rename(tmp_path / f".old-{chatroom.uid}")
+    (tmp_path / ".tmp-unfinished").mkdir()
+    (tmp_path / ".tmp-unfinished" / "data.json").write_text("{}")
+
+    assert chatroom_directories(tmp_path) == [tmp_path / chatroom.uid]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [chatroom.uid]
+
+    [restored] = Teacup.from_dump(tmp_path).chatrooms
+    assert restored.uid == chatroom.uid
+
+
+def test_directories_are_synced(server, teacup, tmp_path, monkeypatch):
+    teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    synced = []
+    fsync_directory = teahaz.snapshot._fsync_directory
+
+    def _record(path):
+        synced.append(path)
+        fsync_directory(path)
+
+    monkeypatch.setattr(teahaz.snapshot, "_fsync_directory", _record)
+    teacup.dump_to(tmp_path)
+
+    assert tmp_path in synced
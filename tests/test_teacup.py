@@ -0,0 +1,106 @@
+"""Tests for `teahaz.Teacup`."""
+
+from __future__ import annotations
+
+import threading
+
+from teahaz import Event, Teacup
+
+
+def _chatroom_threads() -> list[threading.Thread]:
+    return [
+        thread
+        for thread in threading.enumerate()
+        if not thread.daemon and thread is not threading.main_thread()
+    ]
+
+
+def test_login_many_reports_failures(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    results = teacup.login_many(
+        [
+            (server.url, owner.uid, "owner", "password"),
+            (server.url, owner.uid, "owner", "wrong"),
+            (server.url, "missing", "owner", "password"),
+        ]
+    )
+
+    assert [result.is_ok for result in results] == [True, False, False]
+    assert all(result.error is not None for result in results[1:])
+    assert len(teacup.chatrooms) == 2
+
+
+def test_chatrooms_without_prefetched_channels_still_poll(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    [result] = teacup.login_many(
+        [(server.url, owner.uid, "owner", "password")], prefetch_channels=False
+    )
+    chatroom = result.chatroom
+    assert chatroom.active_channel is None
+
+    received = threading.Event()
+    chatroom.interval = 0.05
+    chatroom.subscribe(Event.MSG_NEW, lambda _: received.set())
+    owner.send("hello")
+
+    assert received.wait(5)
+    assert chatroom.active_channel == owner.active_channel
+
+
+def test_failed_login_starts_no_thread(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    teacup.subscribe_all(Event.MSG_NEW, lambda _: None)
+    running = len(_chatroom_threads())
+
+    [result] = teacup.login_many([(server.url, owner.uid, "owner", "wrong")])
+
+    assert not result.is_ok
+    assert len(_chatroom_threads()) == running
+    assert teacup.chatrooms == (owner,)
+
+
+def test_failed_invite_starts_no_thread(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    teacup.subscribe_all(Event.MSG_NEW, lambda _: None)
+    teacup.subscribe_all(Event.ERROR, lambda *_: None)
+
+    invite = owner.create_invite(uses=1)
+    assert teacup.use_invite(invite, "guest", "password") is not None
+    running = len(_chatroom_threads())
+
+    assert teacup.use_invite(invite, "other", "password") is None
+    assert len(_chatroom_threads()) == running
+    assert len(teacup.chatrooms) == 2
+
+
+def test_global_listeners_reach_new_chatrooms(server, teacup):
+    received = threading.Event()
+    teacup.subscribe_all(Event.MSG_NEW, lambda message: received.set())
+
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+    owner.interval = 0.05
+    owner.send("hello")
+
+    assert owner.event_thread.is_alive()
+    assert received.wait(5)
+
+
+def test_remove_chatroom(server, teacup):
+    owner = teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    assert teacup.remove_chatroom(owner.uid) is owner
+    assert teacup.remove_chatroom(owner.uid) is None
+    assert teacup.get_chatroom_by_uid(owner.uid) is None
+
+
+def test_stop_is_concurrent(server):
+    cup = Teacup()
+    for index in range(4):
+        chatroom = cup.create_chatroom(server.url, f"room-{index}", "owner", "pw")
+        chatroom.interval = 60
+        chatroom.start()
+
+    assert cup.stop(timeout=5)
+    assert not any(chatroom.event_thread.is_alive() for chatroom in cup.chatrooms)
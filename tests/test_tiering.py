@@ -0,0 +1,200 @@
+"""Tests for `teahaz.tiering`."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from teahaz.dataclasses import Message
+from teahaz.tiering import SegmentStore
+
+
+def _messages(start, count, channel="channel"):
+    return [
+        Message(f"uid-{index}", float(index), "text", f"text {index}", channel, "user")
+        for index in range(start, start + count)
+    ]
+
+
+def _segment_files(directory):
+    return sorted(path.name for path in directory.glob("segment-*.tharch"))
+
+
+def test_added_messages_are_readable_before_and_after_writing(tmp_path):
+    store = SegmentStore(tmp_path)
+    store.add(_messages(0, 10))
+
+    assert [message.uid for message in store.messages(2, 4)] == [
+        "uid-2",
+        "uid-3",
+        "uid-4",
+    ]
+
+    assert store.flush(5)
+    assert len(store) == 10
+    assert [message.data for message in store.messages()] == [
+        f"text {index}" for index in range(10)
+    ]
+
+
+def test_reads_merge_overlapping_segments(tmp_path):
+    store = SegmentStore(tmp_path)
+    store.add(_messages(0, 10)[::2])
+    store.add(_messages(0, 10)[1::2])
+    assert store.flush(5)
+
+    assert [message.send_time for message in store.messages()] == [
+        float(index) for index in range(10)
+    ]
+
+
+def test_compaction_is_size_tiered(tmp_path, monkeypatch):
+    store = SegmentStore(tmp_path, max_segments=4, fanout=2)
+
+    written = []
+    merge = store._merge
+
+    def _count_rows(segments):
+        written.append(sum(segment.rows for segment in segments))
+        return merge(segments)
+
+    monkeypatch.setattr(store, "_merge", _count_rows)
+
+    for batch in range(64):
+        store.add(_messages(batch * 10, 10))
+        assert store.flush(5)
+
+    assert len(store._segments) <= 4
+    assert len(store) == 640
+
+    # Merging everything every time would rewrite about 64 * 640 / 2 rows
+    assert sum(written) < 640 * 8
+    assert [message.send_time for message in store.messages()] == [
+        float(index) for index in range(640)
+    ]
+
+
+def test_reopening_keeps_messages(tmp_path):
+    store = SegmentStore(tmp_path, max_segments=2, fanout=2)
+    for batch in range(5):
+        store.add(_messages(batch * 3, 3))
+    assert store.close(5)
+
+    reopened = SegmentStore(tmp_path)
+    assert len(reopened) == 15
+
+    reopened.add(_messages(15, 1))
+    assert reopened.flush(5)
+    assert len(set(path.name for path in tmp_path.iterdir())) == len(
+        reopened._segments
+    )
+
+
+def test_interrupted_merge_is_cleaned_up(tmp_path):
+    store = SegmentStore(tmp_path)
+    for batch in range(3):
+        store.add(_messages(batch * 3, 3))
+    assert store.flush(5)
+
+    sources = {path: path.read_bytes() for path in tmp_path.iterdir()}
+    store.compact()
+    assert _segment_files(tmp_path) == ["segment-00000000-00000002.tharch"]
+
+    # A crash after writing the merged segment leaves its sources behind
+    for path, content in sources.items():
+        path.write_bytes(content)
+    (tmp_path / ".tmp-partial").write_bytes(b"partial")
+
+    reopened = SegmentStore(tmp_path)
+
+    assert _segment_files(tmp_path) == ["segment-00000000-00000002.tharch"]
+    assert not (tmp_path / ".tmp-partial").exists()
+    assert [message.uid for message in reopened.messages()] == [
+        f"uid-{index}" for index in range(9)
+    ]
+
+
+def test_add_does_not_wait_for_the_disk(tmp_path, monkeypatch):
+    import teahaz.tiering  # pylint: disable=import-outside-toplevel
+
+    release = threading.Event()
+    write_archive = teahaz.tiering.write_archive
+
+    def _slow_write(path, messages):
+        release.wait(5)
+        write_archive(path, messages)
+
+    monkeypatch.setattr(teahaz.tiering, "write_archive", _slow_write)
+
+    store = SegmentStore(tmp_path)
+    store.add(_messages(0, 5))
+
+    assert not store.flush(0.1)
+    assert len(list(store.messages())) == 5
+
+    release.set()
+    assert store.flush(5)
+    assert _segment_files(tmp_path) == ["segment-00000000.tharch"]
+
+
+def test_reads_survive_merges(tmp_path, monkeypatch):
+    import teahaz.tiering  # pylint: disable=import-outside-toplevel
+
+    store = SegmentStore(tmp_path)
+    for batch in range(3):
+        store.add(_messages(batch * 3, 3))
+    assert store.flush(5)
+
+    # Merges remove their sources between a read listing & reading segments
+    merge = teahaz.tiering.heapq.merge
+
+    def _merge_while_reading(*sources, key):
+        store.compact()
+        return merge(*sources, key=key)
+
+    monkeypatch.setattr(teahaz.tiering.heapq, "merge", _merge_while_reading)
+
+    assert [message.uid for message in store.messages()] == [
+        f"uid-{index}" for index in range(9)
+    ]
+    assert _segment_files(tmp_path) == ["segment-00000000-00000002.tharch"]
+
+
+def test_fanout_must_merge(tmp_path):
+    with pytest.raises(ValueError):
+        SegmentStore(tmp_path, fanout=1)
+
+
+def test_chatroom_spills_to_disk(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    cold = chatroom.enable_tiering(tmp_path / "cold", hot_count=2)
+
+    for index in range(6):
+        chatroom.send(f"message {index}")
+
+    chatroom._store(chatroom.get_count(10))
+    assert chatroom.stop(timeout=5)
+
+    assert len(chatroom.messages) == 2
+    assert len(cold) == 4
+    assert [message.data for message in chatroom.history()] == [
+        f"message {index}" for index in range(6)
+    ]
+
+
+def test_history_skips_messages_spilled_while_reading(server, teacup, tmp_path):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+
+    for index in range(6):
+        chatroom.send(f"message {index}")
+
+    chatroom.messages = chatroom.get_count(10)
+    snapshot = chatroom.messages.snapshot()
+
+    # The snapshot was taken before the spill, as `history` does
+    chatroom.enable_tiering(tmp_path / "cold", hot_count=2)
+
+    assert [message.data for message in chatroom._history(snapshot)] == [
+        f"message {index}" for index in range(6)
+    ]
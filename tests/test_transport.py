@@ -0,0 +1,124 @@
+"""Tests for `teahaz.transport`."""
+
+from __future__ import annotations
+
+import socket
+import threading
+
+import pytest
+import requests
+
+from teahaz import Event
+from teahaz.standin import StandInServer
+from teahaz.transport import SessionTransport
+
+
+def _closed_port_url():
+    """Returns the URL of a local port nothing listens on."""
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    return f"http://127.0.0.1:{port}/"
+
+
+def _cookie(name, value):
+    return requests.cookies.create_cookie(name, value, domain="127.0.0.1")
+
+
+def test_session_transports_use_their_session(server):
+    session = requests.Session()
+    transport = SessionTransport(session)
+
+    assert transport.headers is session.headers
+    assert transport.cookies is session.cookies
+
+    with pytest.raises(ValueError):
+        transport.request("fetch", server.url)
+
+    response = transport.request("get", f"{server.url}/api/v0/users/missing")
+    assert response.status_code == 404
+    transport.close()
+
+
+def test_refused_requests_were_never_sent():
+    transport = SessionTransport(requests.Session())
+
+    with pytest.raises(requests.ConnectionError) as refused:
+        transport.request("post", _closed_port_url(), timeout=1)
+
+    assert transport.never_sent(refused.value)
+    assert not transport.never_sent(requests.ReadTimeout("timed out"))
+    assert not transport.never_sent(ValueError())
+
+
+def test_set_transport_carries_the_session_over(server, teacup):
+    chatroom = teacup.create_chatroom(server.url, "room", "owner", "password")
+    chatroom.set_compression("gzip")
+    chatroom.session.cookies.set("session", "token")
+
+    transport = SessionTransport(requests.Session())
+    chatroom.set_transport(transport)
+
+    assert chatroom.transport is transport
+    assert transport.cookies.get("session") == "token"
+    assert transport.headers["Accept-Encoding"] == chatroom.session.headers[
+        "Accept-Encoding"
+    ]
+    assert chatroom.send("hello") is not None
+
+
+@pytest.fixture
+def http2_server():
+    pytest.importorskip("h2")
+    pytest.importorskip("httpx")
+
+    with StandInServer(http2=True) as standin:
+        yield standin
+
+
+def test_http2_chatrooms_share_connections(http2_server, teacup):
+    teacup.use_http2(max_connections=1, cleartext=True)
+    owner = teacup.create_chatroom(http2_server.url, "room", "owner", "password")
+    guest = teacup.use_invite(owner.create_invite(uses=1), "guest", "password")
+
+    received = threading.Event()
+    guest.interval = 0.05
+    guest.subscribe(Event.MSG_NEW, lambda _: received.set())
+
+    threads = [
+        threading.Thread(target=owner.send, args=(f"message {index}",))
+        for index in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert received.wait(5)
+    assert len(owner.get_count(20)) == 10
+    assert http2_server.connections == 1
+
+    # Forks share the connections, but not the cookies
+    owner.transport.cookies.set_cookie(_cookie("session", "owner"))
+    assert "session" not in {cookie.name for cookie in guest.transport.cookies}
+    assert owner.transport.pool is guest.transport.pool
+
+    assert guest.stop(timeout=3)
+    teacup.use_http2(False)
+    assert isinstance(owner.transport, SessionTransport)
+
+
+def test_http2_refused_requests_were_never_sent(http2_server, teacup):
+    httpx = pytest.importorskip("httpx")
+    teacup.use_http2(cleartext=True)
+    chatroom = teacup.create_chatroom(http2_server.url, "room", "owner", "password")
+
+    with pytest.raises(httpx.ConnectError) as refused:
+        chatroom.transport.request("post", _closed_port_url(), timeout=1)
+
+    assert chatroom.transport.never_sent(refused.value)
+    assert not chatroom.transport.never_sent(httpx.ReadTimeout("timed out"))
+
+    teacup.use_http2(False)